@@ -0,0 +1,176 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forwarder import ForwardingProxy, STATS_PATH, body_framing, copy_body, parse_head, read_head  # noqa: E402
+
+# Everything runs against local stand-ins: two upstream proxies and an origin server on 127.0.0.1.
+# Responses name the server that produced them, so the runs double as a check that requests took the
+# expected path (pooled upstream, failover target, or direct for no_proxy).
+
+
+class StandIn:
+    # Answers absolute-form GETs itself like an upstream proxy would (origin-form when acting as the origin
+    # server), with keep-alive and a body of /bytes/N bytes; CONNECT tunnels echo what they receive
+    def __init__(self, name):
+        self.name = name.encode()
+        self.server = None
+        self.port = None
+        self.writers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        # Like a crashed process: open connections are dropped too, not just the listening socket
+        self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                data = await read_head(reader)
+                if data is None:
+                    break
+                request_line, headers = parse_head(data)
+                method, target, version = request_line.split(" ")
+                if method == "CONNECT":
+                    writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+                    while True:
+                        chunk = await reader.read(65536)
+                        if not chunk:
+                            break
+                        writer.write(chunk)
+                        await writer.drain()
+                    break
+                size = int(target.rsplit("/bytes/", 1)[1]) if "/bytes/" in target else 0
+                writer.write(b"HTTP/1.1 200 OK\r\nX-Served-By: %s\r\nContent-Length: %d\r\n\r\n" % (self.name, size))
+                remaining = size
+                while remaining:
+                    chunk = b"x" * min(remaining, 1 << 20)
+                    writer.write(chunk)
+                    remaining -= len(chunk)
+                    await writer.drain()
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+
+async def fetch(reader, writer, target, expect=None):
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    await writer.drain()
+    status_line, headers = parse_head(await read_head(reader))
+
+    class Sink:
+        def write(self, data):
+            pass
+
+        async def drain(self):
+            pass
+    size = await copy_body(reader, Sink(), body_framing(headers))
+    served_by = dict(headers).get("X-Served-By")
+    if expect is not None and served_by != expect:
+        raise RuntimeError(f"{target} served by {served_by}, expected {expect}: {status_line}")
+    return size
+
+
+def elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+async def bench(requests, transfer_mb, clients):
+    primary, backup, origin = StandIn("primary"), StandIn("backup"), StandIn("origin")
+    for server in (primary, backup, origin):
+        await server.start()
+    proxy = ForwardingProxy([f"http://127.0.0.1:{primary.port}", f"http://127.0.0.1:{backup.port}"],
+                            no_proxy="localhost", port=0, check_interval=0.05)
+    await proxy.start()
+    metrics = {}
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", primary.port)
+        start = time.perf_counter()
+        for i in range(requests):
+            await fetch(reader, writer, "http://example.com/bytes/0", "primary")
+        # `requests` round trips: total ms * 1000 / requests is microseconds per request
+        metrics["forwarder.baseline_request_us"] = elapsed_ms(start) * 1000 / requests
+        writer.close()
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+        start = time.perf_counter()
+        for i in range(requests):
+            await fetch(reader, writer, "http://example.com/bytes/0", "primary")
+        metrics["forwarder.request_us"] = elapsed_ms(start) * 1000 / requests
+        start = time.perf_counter()
+        await fetch(reader, writer, f"http://example.com/bytes/{transfer_mb << 20}", "primary")
+        metrics[f"forwarder.transfer_{transfer_mb}mb_ms"] = elapsed_ms(start)
+        start = time.perf_counter()
+        await fetch(reader, writer, f"http://localhost:{origin.port}/bytes/0", "origin")
+        metrics["forwarder.direct_request_ms"] = elapsed_ms(start)
+
+        async def client():
+            client_reader, client_writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+            for i in range(requests // clients):
+                await fetch(client_reader, client_writer, "http://example.com/bytes/1024", "primary")
+            client_writer.close()
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        metrics[f"forwarder.concurrent_{clients}_clients_ms"] = elapsed_ms(start)
+
+        tunnel_reader, tunnel_writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+        tunnel_writer.write(b"CONNECT example.com:443 HTTP/1.1\r\nHost: example.com:443\r\n\r\n")
+        await read_head(tunnel_reader)
+        start = time.perf_counter()
+        for i in range(requests):
+            tunnel_writer.write(b"ping")
+            await tunnel_reader.readexactly(4)
+        metrics["forwarder.tunnel_roundtrip_us"] = elapsed_ms(start) * 1000 / requests
+        tunnel_writer.close()
+
+        # Primary dies: its pooled connections are dropped and new connections are refused
+        await primary.stop()
+        start = time.perf_counter()
+        await fetch(reader, writer, "http://example.com/bytes/0", "backup")
+        metrics["forwarder.failover_ms"] = elapsed_ms(start)
+        start = time.perf_counter()
+        for i in range(requests):
+            await fetch(reader, writer, "http://example.com/bytes/0", "backup")
+        metrics["forwarder.after_failover_request_us"] = elapsed_ms(start) * 1000 / requests
+
+        # Primary comes back on the same port: the health check restores it within check_interval
+        primary.server = await asyncio.start_server(primary.handle, "127.0.0.1", primary.port)
+        start = time.perf_counter()
+        while not proxy.upstreams[0].up:
+            await asyncio.sleep(0.005)
+        metrics["forwarder.recovery_ms"] = elapsed_ms(start)
+        await fetch(reader, writer, "http://example.com/bytes/0", "primary")
+        await fetch(reader, writer, STATS_PATH)
+        writer.close()
+    finally:
+        await proxy.close()
+        for server in (primary, backup, origin):
+            await server.stop()
+        # Let the handlers of the connections just closed see EOF before the loop shuts down
+        await asyncio.sleep(0.05)
+    stats = proxy.stats()
+    metrics["forwarder.failovers"] = stats["failovers"]
+    metrics["forwarder.errors"] = stats["errors"]
+    return metrics
+
+
+def run(requests=2000, transfer_mb=64, clients=50):
+    return asyncio.run(bench(requests, transfer_mb, clients))
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:40} {value:12.3f}")
@@ -0,0 +1,53 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from noproxy import NoProxyMatcher  # noqa: E402
+
+
+def build_no_proxy(entries, seed=1):
+    rng = random.Random(seed)
+    items = []
+    for i in range(entries):
+        kind = i % 10
+        if kind < 6:
+            items.append(f".svc{i}.dept{rng.randrange(50)}.corp.example")
+        elif kind < 8:
+            items.append(f"10.{rng.randrange(256)}.{rng.randrange(256)}.0/24")
+        elif kind < 9:
+            items.append(f"fd00:{i:x}::/48")
+        else:
+            items.append(f"host{i}.example.org:{8000 + rng.randrange(100)}")
+    return ",".join(items)
+
+
+def measure(fn, args, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for a in args:
+            fn(*a)
+    return (time.perf_counter() - start) / (repeat * len(args)) * 1e6
+
+
+def run(entries=10000, repeat=20):
+    value = build_no_proxy(entries)
+    start = time.perf_counter()
+    matcher = NoProxyMatcher(value)
+    compile_ms = (time.perf_counter() - start) * 1000
+    hits = [("a.svc6.dept3.corp.example", 80), ("10.1.2.3", 443), ("fd00:8::1", 80)]
+    misses = [("www.python.org", 443), ("8.8.8.8", 53), ("2001:db8::1", 80)]
+    return {
+        "noproxy.entries": entries,
+        "noproxy.compile_ms": compile_ms,
+        "noproxy.lookup_hit_us": measure(matcher.bypass_host, hits, repeat * 100),
+        "noproxy.lookup_miss_us": measure(matcher.bypass_host, misses, repeat * 100),
+        "noproxy.url_us": measure(matcher.bypass_url, [("https://a.svc6.dept3.corp.example/x",)], repeat * 100),
+    }
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:28} {value:12.3f}")
@@ -0,0 +1,114 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import configfiles  # noqa: E402
+import core  # noqa: E402
+import rewrite  # noqa: E402
+from bench_noproxy import build_no_proxy  # noqa: E402
+from privileged import PrivilegedTransaction  # noqa: E402
+
+
+def best_ms(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def build_rc(lines):
+    # A dotfile with the managed exports near the end, the worst case for a line-by-line rewrite
+    body = [f"alias a{i}='ls -la /tmp/{i}'\n" if i % 3 else f"# comment {i}\n" for i in range(lines)]
+    body.append('export http_proxy="http://old.example:3128"\n')
+    body.append('export https_proxy="http://old.example:3128"\n')
+    return "".join(body)
+
+
+def build_dnf_conf(sections):
+    parts = ["[main]\ngpgcheck=1\ninstallonly_limit=3\nclean_requirements_on_remove=True\n\n"]
+    for i in range(sections):
+        parts.append(f"[repo{i}]\nname=Repo {i}\nbaseurl=http://mirror.example/{i}/\nenabled=1\ngpgcheck=1\n\n")
+    return "".join(parts)
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def commit_root(root, env_vars, package_managers):
+    # Same staging/commit path as save_proxy_settings and toggle_proxy, pointed at a scratch tree;
+    # run() puts the pkexec stub first on PATH while it benchmarks
+    transaction = PrivilegedTransaction()
+    core.stage_plan(transaction, core.plan_environment(env_vars, root))
+    for pm in package_managers:
+        for plan in core.plan_package_manager(pm, env_vars, root):
+            core.stage_plan(transaction, plan)
+    return transaction.commit()
+
+
+def run(rc_lines=100000, dnf_sections=5000, no_proxy_entries=10000, repeat=5):
+    stub_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub")
+    with mock.patch.dict(os.environ, {"PATH": stub_dir + os.pathsep + os.environ.get("PATH", "")}):
+        return run_with_stub(rc_lines, dnf_sections, no_proxy_entries, repeat)
+
+
+def run_with_stub(rc_lines, dnf_sections, no_proxy_entries, repeat):
+    root = tempfile.mkdtemp(prefix="proxymaster-bench-")
+    try:
+        on = core.make_env_vars("http://proxy.example:3128", "http://proxy.example:3128", "",
+                                build_no_proxy(no_proxy_entries))
+        off = core.make_env_vars()
+        rc_path = os.path.join(root, "home", ".bashrc")
+        rc_text = build_rc(rc_lines)
+        dnf_text = build_dnf_conf(dnf_sections)
+        environment = os.path.join(root, "etc", "environment")
+        dnf_conf = os.path.join(root, "etc", "dnf", "dnf.conf")
+
+        def rewrite_rc():
+            # Same streamed rewrite as update_user_rc
+            return rewrite.rewrite_file(rc_path, configfiles.SHELL, core.desired_environment(on))
+
+        def rewrite_stale_rc():
+            write(rc_path, rc_text)
+            rewrite_rc()
+
+        def toggle():
+            commit_root(root, on, ["dnf"])
+            commit_root(root, off, ["dnf"])
+
+        write(environment, "PATH=/usr/bin\n")
+        write(dnf_conf, dnf_text)
+        metrics = {
+            "rewrite.rc_lines": rc_lines,
+            "rewrite.rc_render_ms": best_ms(
+                lambda: configfiles.SHELL.render(rc_text, core.desired_environment(on)), repeat),
+            "rewrite.rc_write_ms": best_ms(rewrite_stale_rc, repeat),
+            # Already up to date: hashed and left alone
+            "rewrite.rc_unchanged_ms": best_ms(rewrite_rc, repeat),
+            "rewrite.dnf_render_ms": best_ms(
+                lambda: configfiles.DNF.render(dnf_text, core.desired_package_manager("dnf", on)), repeat),
+            "rewrite.environment_no_proxy_render_ms": best_ms(
+                lambda: configfiles.ENVIRONMENT.render("PATH=/usr/bin\n", core.desired_environment(on)), repeat),
+            "rewrite.toggle_pkexec_ms": best_ms(toggle, repeat) / 2,
+        }
+        commit_root(root, on, ["dnf"])
+        metrics["rewrite.save_unchanged_ms"] = best_ms(lambda: commit_root(root, on, ["dnf"]), repeat)
+        metrics["rewrite.is_proxy_enabled_ms"] = best_ms(lambda: core.is_proxy_enabled(root), repeat)
+        metrics["rewrite.read_status_ms"] = best_ms(lambda: core.read_status(root), repeat)
+        return metrics
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:40} {value:12.3f}")
@@ -0,0 +1,62 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from store import ProxyStore  # noqa: E402
+
+
+def best_ms(cmd, repeat, env=None):
+    # Fresh interpreter per run: measures cold startup, including imports
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, cwd=REPO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None
+        best = min(best, elapsed)
+    return best * 1000
+
+
+def run(repeat=10):
+    metrics = {
+        "startup.python_ms": best_ms([sys.executable, "-c", "pass"], repeat),
+        "startup.import_core_ms": best_ms([sys.executable, "-c", "import core"], repeat),
+        "startup.cli_status_ms": best_ms([sys.executable, "cli.py", "status"], repeat),
+        "startup.cli_status_json_ms": best_ms([sys.executable, "cli.py", "status", "--json"], repeat),
+    }
+    metrics.update(run_launcher(repeat))
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    gui = best_ms([sys.executable, "-c", "import main"], max(1, repeat // 2), env)
+    if gui is not None:
+        metrics["startup.import_gui_ms"] = gui
+    return {name: value for name, value in metrics.items() if value is not None}
+
+
+def run_launcher(repeat):
+    # `cli.py run` overhead: compare with exec'ing the same command straight from a bare interpreter
+    home = tempfile.mkdtemp(prefix="proxymaster-bench-")
+    try:
+        store = ProxyStore(os.path.join(home, ".proxymaster_proxy_history.json"),
+                           os.path.join(home, ".proxymaster_profiles.json"), write_delay=0,
+                           launch_cache_path=os.path.join(home, ".proxymaster_launch_cache"))
+        store.set_profiles({f"profile{i}": {"http_proxy": f"http://proxy{i}.example:3128"} for i in range(100)})
+        env = dict(os.environ, HOME=home)
+        return {
+            "startup.exec_true_ms": best_ms([sys.executable, "-c", "import os; os.execvp('true', ['true'])"], repeat),
+            "startup.cli_run_ms": best_ms([sys.executable, "cli.py", "run", "--profile", "profile99", "--", "true"],
+                                          repeat, env),
+        }
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:28} {value:12.3f}")
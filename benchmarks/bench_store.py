@@ -0,0 +1,65 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from completion import CompletionIndex  # noqa: E402
+from store import ProxyStore  # noqa: E402
+
+
+def elapsed_ms(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def run(entries=10000):
+    directory = tempfile.mkdtemp(prefix="proxymaster-bench-")
+    try:
+        history_path = os.path.join(directory, "history.json")
+        profiles_path = os.path.join(directory, "profiles.json")
+        store = ProxyStore(history_path, profiles_path, max_history=entries, write_delay=60)
+        values = [{"http_proxy": f"http://proxy{i}.example:3128", "https_proxy": f"http://proxy{i}.example:3129",
+                   "no_proxy": f"localhost,.svc{i}.example"} for i in range(entries)]
+        profiles = {f"profile{i}": dict(values[i], ftp_proxy="", downloads={"dnf": {"max_parallel_downloads": "10"}})
+                    for i in range(entries)}
+
+        def add_all():
+            for value in values:
+                store.add_history(value)
+
+        metrics = {
+            "store.entries": entries,
+            "store.history_add_ms": elapsed_ms(add_all),
+            "store.history_readd_ms": elapsed_ms(add_all),
+            "store.history_flush_ms": elapsed_ms(store.flush),
+        }
+        store.set_profiles(profiles)
+        metrics["store.profiles_flush_ms"] = elapsed_ms(store.flush)
+        cold = ProxyStore(history_path, profiles_path, max_history=entries, write_delay=60)
+        metrics["store.history_load_ms"] = elapsed_ms(cold.get_history)
+        metrics["store.profiles_load_ms"] = elapsed_ms(cold.get_profiles)
+        # 1000 lookups: total milliseconds equals microseconds per lookup
+        metrics["store.profile_get_us"] = elapsed_ms(lambda: [cold.get_profile(f"profile{i}") for i in range(1000)])
+
+        index = CompletionIndex()
+        usage = cold.get_usage()["http_proxy"]
+        metrics["completion.build_ms"] = elapsed_ms(
+            lambda: [index.add(value, count, last_used) for value, (count, last_used) in usage.items()])
+        # 1000 operations: total milliseconds equals microseconds per operation
+        metrics["completion.use_us"] = elapsed_ms(
+            lambda: [index.use(f"http://proxy{i * 7 % entries}.example:3128", 1e9 + i) for i in range(1000)])
+        metrics["completion.search_prefix_us"] = elapsed_ms(lambda: [index.search(f"proxy{i % 100}") for i in range(1000)])
+        metrics["completion.search_substring_us"] = elapsed_ms(
+            lambda: [index.search(f"{i % 100}.exa") for i in range(1000)])
+        return metrics
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    for name, value in run().items():
+        print(f"{name:28} {value:12.3f}")
@@ -0,0 +1,98 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(BENCH_DIR)
+# Metrics with these suffixes are timings (lower is better); everything else is a parameter
+TIMING_SUFFIXES = ("_ms", "_us", "_s")
+
+sys.path.insert(0, BENCH_DIR)
+
+
+def discover():
+    return sorted(name[:-3] for name in os.listdir(BENCH_DIR) if name.startswith("bench_") and name.endswith(".py"))
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def run_suites(names, rounds):
+    # Each suite runs `rounds` times and keeps the best value per timing, which is far less noisy
+    # than a single run or the mean
+    metrics = {}
+    for name in names:
+        module = importlib.import_module(name)
+        for _ in range(rounds):
+            for key, value in module.run().items():
+                if key not in metrics or (key.endswith(TIMING_SUFFIXES) and value < metrics[key]):
+                    metrics[key] = value
+    return metrics
+
+
+def compare(metrics, baseline, threshold):
+    rows = []
+    regressions = []
+    for key, value in metrics.items():
+        old = baseline.get(key)
+        if not key.endswith(TIMING_SUFFIXES) or not old:
+            continue
+        change = (value - old) / old
+        rows.append(f"{key:40} {old:12.3f} {value:12.3f} {change * 100:+8.1f}%")
+        if change > threshold:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ProxyMaster benchmark suite.")
+    parser.add_argument("suites", nargs="*", help="suite names, e.g. bench_store (default: all)")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per suite; the best timing is kept")
+    parser.add_argument("--output", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with a previous --output file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as a regression (default: 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    names = [name if name.startswith("bench_") else f"bench_{name}" for name in args.suites] or discover()
+    metrics = run_suites(names, args.rounds)
+    result = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "suites": names,
+        "metrics": metrics,
+    }
+    for key, value in metrics.items():
+        print(f"{key:40} {value:12.3f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    if not args.compare:
+        return 0
+    with open(args.compare, "r") as f:
+        baseline = json.load(f)
+    rows, regressions = compare(metrics, baseline.get("metrics", {}), args.threshold)
+    print(f"\nCompared with {baseline.get('commit') or args.compare}:")
+    print(f"{'metric':40} {'baseline':>12} {'current':>12} {'change':>9}")
+    for row in rows:
+        print(row)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
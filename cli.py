@@ -0,0 +1,378 @@
+import sys
+
+# Headless entry point: must never import PyQt so it stays cheap enough for login scripts and CI.
+
+
+def load_env_vars(args):
+    import core
+    if args.profile:
+        from store import get_store
+        profile = get_store().get_profile(args.profile)
+        if profile is None:
+            raise SystemExit(f"proxymaster: no such profile: {args.profile}")
+        return core.profile_env_vars(profile)
+    return core.make_env_vars(args.http_proxy, args.https_proxy, args.ftp_proxy, args.no_proxy)
+
+
+def load_downloads(args):
+    import core
+    profile = {"downloads": {}}
+    if args.profile:
+        from store import get_store
+        profile = get_store().get_profile(args.profile) or profile
+        profile["downloads"] = {pm: dict(settings) for pm, settings in (profile.get("downloads") or {}).items()}
+    for option in args.download or []:
+        pm, _, setting = option.partition(":")
+        key, sep, value = setting.partition("=")
+        if not sep or key not in core.DOWNLOAD_SETTINGS.get(pm, ()):
+            raise SystemExit(f"proxymaster: unknown download setting: {option}")
+        profile["downloads"].setdefault(pm, {})[key] = value
+    try:
+        return core.profile_downloads(profile)
+    except ValueError as e:
+        raise SystemExit(f"proxymaster: {e}")
+
+
+def cmd_status(args):
+    import core
+    status = core.read_status(args.root)
+    if args.json:
+        import json
+        print(json.dumps(status, indent=2))
+        return 0
+    print(f"Proxy Status: {'ON' if status['enabled'] else 'OFF'}")
+    for var in core.ENV_VARS:
+        if var in status["environment"]:
+            print(f"  {var}={status['environment'][var]}")
+    if "user_rc" in status:
+        print(f"Shell config ({status['user_rc']}): {'set' if status['shell'] else 'not set'}")
+    for pm, configured in status["package_managers"].items():
+        print(f"  {pm}: {'proxy set' if configured else 'no proxy'}")
+    return 0
+
+
+def cmd_apply(args):
+    import core
+    env_vars = load_env_vars(args)
+    downloads = load_downloads(args)
+    roots = list(args.root or [])
+    if args.roots_from:
+        with open(args.roots_from, "r") as f:
+            roots.extend(line.strip() for line in f if line.strip())
+    if roots:
+        return apply_offline(roots, env_vars, args.jobs, downloads)
+    package_managers = []
+    if args.package_managers:
+        package_managers = [pm for pm, found in core.detect_package_managers().items() if found]
+    if not core.apply_proxy_settings(env_vars, package_managers, downloads=downloads):
+        return 1
+    from store import get_store
+    get_store().add_history(env_vars)
+    return 0
+
+
+def apply_offline(roots, env_vars, jobs=None, downloads=None):
+    import core
+    failed = 0
+    for result in core.apply_to_roots(roots, env_vars, workers=jobs, downloads=downloads):
+        if result["ok"]:
+            changed = sum(1 for target in result["targets"] if target["changed"])
+            print(f"{result['root']}: OK ({changed} of {len(result['targets'])} files changed)")
+            continue
+        failed += 1
+        print(f"{result['root']}: FAILED {result['error']}")
+        for target in result["targets"]:
+            if not target["ok"]:
+                print(f"  {target['target']}: {target['error']}")
+    print(f"{len(roots) - failed}/{len(roots)} roots updated")
+    return 1 if failed else 0
+
+
+def cmd_off(args):
+    import core
+    return 0 if core.disable_proxy() else 1
+
+
+def cmd_pm(args):
+    import core
+    if args.action == "set":
+        ok = core.set_package_manager_proxy(args.pm, load_env_vars(args), downloads=load_downloads(args))
+    else:
+        ok = core.remove_package_manager_proxy(args.pm)
+    return 0 if ok else 1
+
+
+def cmd_auto(args):
+    import core
+    from netrules import ProfileSwitcher, create_network_watcher, wait_for_change
+    from store import get_store
+    store = get_store()
+    if args.rules:
+        import json
+        with open(args.rules, "r") as f:
+            rules = json.load(f)
+    else:
+        rules = store.get_rules()
+    if not rules:
+        raise SystemExit("proxymaster: no network rules configured (see ~/.proxymaster_rules.json)")
+    try:
+        switcher = ProfileSwitcher(rules, store.get_profile, args.routes, args.resolv)
+    except ValueError as e:
+        raise SystemExit(f"proxymaster: {e}")
+    package_managers = []
+    if args.package_managers:
+        package_managers = [pm for pm, found in core.detect_package_managers().items() if found]
+    watcher = None if args.once else create_network_watcher(args.routes, args.resolv)
+    try:
+        while True:
+            name, facts, changed = switcher.check()
+            if changed:
+                print(f"{facts.describe()}: {f'profile {name}' if name else 'no rule matched'}", flush=True)
+                if name and not args.dry_run:
+                    switcher.apply(name, package_managers)
+            if watcher is None:
+                return 0
+            wait_for_change(watcher, poll=args.poll)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def cmd_forward(args):
+    import asyncio
+    import forwarder
+    if args.upstream:
+        profile = {"upstreams": args.upstream, "no_proxy": args.no_proxy or ""}
+    else:
+        if not args.profile:
+            raise SystemExit("proxymaster: forward needs --profile or --upstream")
+        from store import get_store
+        profile = get_store().get_profile(args.profile)
+        if profile is None:
+            raise SystemExit(f"proxymaster: no such profile: {args.profile}")
+        if args.no_proxy is not None:
+            profile["no_proxy"] = args.no_proxy
+    host, _, port = args.listen.rpartition(":")
+    if not port.isdigit():
+        raise SystemExit(f"proxymaster: invalid --listen address: {args.listen}")
+    try:
+        proxy = forwarder.ForwardingProxy(forwarder.profile_upstreams(profile), profile.get("no_proxy", ""),
+                                          host or forwarder.DEFAULT_HOST, int(port))
+    except ValueError as e:
+        raise SystemExit(f"proxymaster: {e}")
+
+    async def serve():
+        await proxy.start()
+        print(f"Forwarding on {proxy.url} to {', '.join(u.url for u in proxy.upstreams) or 'direct connections only'}",
+              flush=True)
+        try:
+            if args.apply:
+                # Point the system at the daemon only once it is listening
+                import core
+                env_vars = core.make_env_vars(proxy.url, proxy.url, profile.get("ftp_proxy", ""),
+                                              profile.get("no_proxy", ""))
+                await asyncio.get_running_loop().run_in_executor(None, core.apply_proxy_settings, env_vars)
+            while True:
+                await asyncio.sleep(args.stats_interval or 3600)
+                if args.stats_interval:
+                    for line in forwarder.format_stats(proxy.stats()):
+                        print(line, flush=True)
+        finally:
+            await proxy.close()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        raise SystemExit(f"proxymaster: cannot listen on {args.listen}: {e.strerror}")
+    return 0
+
+
+def cmd_shell(args):
+    import core
+    if args.action == "install":
+        core.install_shell_integration(args.shell)
+        print("Open a new terminal (or source your shell config) once; later changes reach it at the next prompt.")
+    else:
+        core.uninstall_shell_integration()
+    return 0
+
+
+def cmd_run(args):
+    import launcher
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        raise SystemExit("proxymaster: run: no command given")
+    profile = launcher.get_profile(args.profile)
+    if profile is None:
+        raise SystemExit(f"proxymaster: no such profile: {args.profile}")
+    env = launcher.profile_environ(profile)
+    import tracing
+    if tracing.enabled():
+        # exec() would replace this process before the trace is written
+        import subprocess
+        with tracing.span("command", command=command[0]):
+            return subprocess.call(command, env=env)
+    import os
+    try:
+        os.execvpe(command[0], command, env)
+    except OSError as e:
+        print(f"proxymaster: {command[0]}: {e.strerror}", file=sys.stderr)
+        return 127 if isinstance(e, FileNotFoundError) else 126
+
+
+def parse_run_args(argv):
+    # `run --profile NAME [--] cmd...` without argparse; anything else (e.g. --help) goes through the parser
+    from types import SimpleNamespace
+    if len(argv) >= 2 and argv[0] == "--profile":
+        return SimpleNamespace(profile=argv[1], command=argv[2:])
+    if argv[:1] and argv[0].startswith("--profile="):
+        return SimpleNamespace(profile=argv[0][len("--profile="):], command=argv[1:])
+    return None
+
+
+def cmd_test_url(args):
+    from noproxy import evaluate_urls, format_evaluation
+    urls = list(args.urls)
+    if args.file:
+        with open(args.file, "r") as f:
+            urls.extend(line.strip() for line in f if line.strip())
+    if args.profile or args.http_proxy or args.https_proxy or args.ftp_proxy or args.no_proxy:
+        env_vars = load_env_vars(args)
+    else:
+        import core
+        env_vars = core.make_env_vars(**core.read_status()["environment"])
+    for url, proxy in evaluate_urls(urls, env_vars):
+        print(format_evaluation(url, proxy))
+    return 0
+
+
+def add_proxy_arguments(parser):
+    parser.add_argument("--profile", help="use the values from a saved profile")
+    parser.add_argument("--http-proxy", default="")
+    parser.add_argument("--https-proxy", default="")
+    parser.add_argument("--ftp-proxy", default="")
+    parser.add_argument("--no-proxy", default="")
+
+
+def add_download_arguments(parser):
+    parser.add_argument("--download", action="append", metavar="PM:KEY=VALUE",
+                        help="package manager download setting, e.g. dnf:max_parallel_downloads=10, or "
+                             "=unset to remove it (repeatable, overrides the profile)")
+
+
+def build_parser():
+    import argparse
+    from core import PACKAGE_MANAGERS
+    parser = argparse.ArgumentParser(prog="proxymaster", description="Manage system and package manager proxy settings.")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="record timing spans and write them to FILE as a Chrome/Perfetto trace")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    status = subparsers.add_parser("status", help="show the current proxy configuration")
+    status.add_argument("--json", action="store_true", help="print machine-readable output")
+    status.add_argument("--root", default="/", metavar="DIR", help="inspect a chroot or image tree")
+    status.set_defaults(func=cmd_status)
+
+    apply = subparsers.add_parser("apply", help="write proxy settings to /etc/environment and the shell config")
+    add_proxy_arguments(apply)
+    add_download_arguments(apply)
+    apply.add_argument("--package-managers", action="store_true",
+                       help="also configure every detected package manager in the same admin prompt")
+    apply.add_argument("--root", action="append", metavar="DIR",
+                       help="write into a chroot or image tree instead of this system (repeatable, no pkexec); "
+                            "package managers are detected from the tree")
+    apply.add_argument("--roots-from", metavar="FILE", help="read additional root directories from FILE, one per line")
+    apply.add_argument("--jobs", type=int, default=None, help="worker processes for batch apply (default: CPU count)")
+    apply.set_defaults(func=cmd_apply)
+
+    off = subparsers.add_parser("off", help="remove proxy settings from /etc/environment and the shell config")
+    off.set_defaults(func=cmd_off)
+
+    pm = subparsers.add_parser("pm", help="set or remove the proxy for one package manager")
+    pm.add_argument("action", choices=["set", "remove"])
+    pm.add_argument("pm", choices=PACKAGE_MANAGERS)
+    add_proxy_arguments(pm)
+    add_download_arguments(pm)
+    pm.set_defaults(func=cmd_pm)
+
+    auto = subparsers.add_parser("auto", help="switch profiles automatically from network rules")
+    auto.add_argument("--once", action="store_true", help="evaluate the rules once and exit")
+    auto.add_argument("--dry-run", action="store_true", help="only print which profile would be applied")
+    auto.add_argument("--package-managers", action="store_true",
+                      help="also configure every detected package manager when switching")
+    auto.add_argument("--rules", metavar="FILE", help="read rules from FILE instead of ~/.proxymaster_rules.json")
+    auto.add_argument("--routes", default="/proc/net/route", metavar="FILE",
+                      help="route table in /proc/net/route format (e.g. a fake table for testing); "
+                           "other files are polled instead of using netlink")
+    auto.add_argument("--resolv", default="/etc/resolv.conf", metavar="FILE", help="resolver config with search domains")
+    auto.add_argument("--poll", type=float, default=1.0, metavar="SECONDS", help="poll interval without netlink")
+    auto.set_defaults(func=cmd_auto)
+
+    forward = subparsers.add_parser("forward", help="run a local forwarding proxy with pooled upstreams and failover")
+    forward.add_argument("--profile", help="forward to this profile's upstreams (its \"upstreams\" list, "
+                                           "else http_proxy then https_proxy)")
+    forward.add_argument("--upstream", action="append", metavar="URL",
+                         help="upstream proxy, in rank order (repeatable, instead of --profile)")
+    forward.add_argument("--no-proxy", default=None, help="hosts to connect directly (default: the profile's no_proxy)")
+    forward.add_argument("--listen", default="127.0.0.1:3128", metavar="HOST:PORT")
+    forward.add_argument("--apply", action="store_true",
+                         help="point the system proxy settings at the local proxy once it is listening")
+    forward.add_argument("--stats-interval", type=float, default=0, metavar="SECONDS",
+                         help="print throughput and latency counters every SECONDS")
+    forward.set_defaults(func=cmd_forward)
+
+    shell = subparsers.add_parser("shell", help="install or remove the shell integration: a sourced env file and "
+                                  "a prompt hook instead of export lines in the shell config")
+    shell.add_argument("action", choices=["install", "uninstall"])
+    shell.add_argument("--shell", action="append", choices=["bash", "zsh", "fish"],
+                       help="shell to set up (repeatable, default: every shell with a config file)")
+    shell.set_defaults(func=cmd_shell)
+
+    run = subparsers.add_parser("run", help="run a command with a profile's proxy environment (no files written)")
+    run.add_argument("--profile", required=True, help="saved profile whose proxy variables are injected")
+    run.add_argument("command", nargs=argparse.REMAINDER, help="command and arguments, after --")
+    run.set_defaults(func=cmd_run)
+
+    test_url = subparsers.add_parser("test-url", help="show whether URLs would use the proxy or bypass it via no_proxy")
+    test_url.add_argument("urls", nargs="*", metavar="URL")
+    test_url.add_argument("--file", help="read URLs from FILE, one per line")
+    add_proxy_arguments(test_url)
+    test_url.set_defaults(func=cmd_test_url)
+    return parser
+
+
+def main(argv=None):
+    import tracing
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if tracing.enable_from_argv(argv):
+        try:
+            return run(argv)
+        finally:
+            for line in tracing.format_summary():
+                print(line, file=sys.stderr)
+    return run(argv)
+
+
+def run(argv):
+    import tracing
+    # `status` runs from login scripts, so it skips argparse (and the re/enum imports it pulls in)
+    if argv[:1] == ["status"] and set(argv[1:]) <= {"--json"}:
+        from types import SimpleNamespace
+        with tracing.span("status"):
+            return cmd_status(SimpleNamespace(json="--json" in argv, root="/"))
+    # `run` wraps other commands, so it skips argparse too and never imports core
+    if argv[:1] == ["run"]:
+        args = parse_run_args(argv[1:])
+        if args is not None:
+            with tracing.span("run"):
+                return cmd_run(args)
+    args = build_parser().parse_args(argv)
+    with tracing.span(args.command):
+        return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+import math
+from bisect import bisect_left, bisect_right, insort
+
+# Frecency ranking: a value's score is count * 0.5 ** (age / half_life). Exponential decay scales every
+# score by the same factor as time passes, so the ranking only changes when a value is used and can be
+# kept as a sorted list keyed by log2(count) + last_used / half_life, updated incrementally.
+HALF_LIFE = 14 * 24 * 3600
+
+
+def rank_key(count, last_used, half_life=HALF_LIFE):
+    if count <= 0:
+        # Never applied (e.g. only present in a profile): after every used value
+        return -math.inf
+    return math.log2(count) + last_used / half_life
+
+
+def is_prefix(lowered, query):
+    # Values usually share a scheme, so a match right after "://" counts as a prefix match too
+    if lowered.startswith(query):
+        return True
+    scheme, sep, rest = lowered.partition("://")
+    return bool(sep) and rest.startswith(query)
+
+
+class CompletionIndex:
+    def __init__(self, half_life=HALF_LIFE):
+        self.half_life = half_life
+        self.entries = {}
+        self.order = []
+        self.haystack = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, value):
+        return value in self.entries
+
+    def _order_item(self, value):
+        count, last_used = self.entries[value]
+        return (-rank_key(count, last_used, self.half_life), value)
+
+    def add(self, value, count=0, last_used=0.0):
+        if not value:
+            return
+        if value in self.entries:
+            old_count, old_last = self.entries[value]
+            if count <= old_count and last_used <= old_last:
+                return
+            self._unrank(value)
+            self.entries[value] = (max(count, old_count), max(last_used, old_last))
+        else:
+            self.entries[value] = (count, last_used)
+            self.haystack = None
+        insort(self.order, self._order_item(value))
+
+    def use(self, value, now):
+        if not value:
+            return
+        if value not in self.entries:
+            self.add(value, 1, now)
+            return
+        count, last_used = self.entries[value]
+        self._unrank(value)
+        self.entries[value] = (count + 1, max(now, last_used))
+        insort(self.order, self._order_item(value))
+
+    def remove(self, value):
+        if value not in self.entries:
+            return
+        self._unrank(value)
+        del self.entries[value]
+        self.haystack = None
+
+    def _unrank(self, value):
+        i = bisect_left(self.order, self._order_item(value))
+        del self.order[i]
+
+    def ranked(self, limit=None):
+        items = self.order if limit is None else self.order[:limit]
+        return [value for _, value in items]
+
+    def rank_of(self, value):
+        return bisect_left(self.order, self._order_item(value))
+
+    def _haystack(self):
+        # Every lowered value joined into one string: substring search is then a handful of C-level
+        # str.find() calls instead of a Python loop over all values. Rebuilt lazily after adds/removes.
+        if self.haystack is None:
+            values = list(self.entries)
+            # Offsets come from the lowered strings: lower() can change the length (e.g. "İ")
+            lowered = [value.lower() for value in values]
+            starts = []
+            position = 0
+            for value in lowered:
+                starts.append(position)
+                position += len(value) + 1
+            self.haystack = ("\n".join(lowered) + "\n", starts, values)
+        return self.haystack
+
+    def matches(self, query):
+        text, starts, values = self._haystack()
+        found = {}
+        position = text.find(query)
+        while position != -1:
+            i = bisect_right(starts, position) - 1
+            end = starts[i + 1] if i + 1 < len(starts) else len(text)
+            found[values[i]] = is_prefix(text[starts[i]:end - 1], query)
+            position = text.find(query, end)
+        return found
+
+    def search(self, query, limit=50):
+        # Prefix matches (on the whole value or the part after the scheme) come first, then substring
+        # matches; each group is ordered by frecency. The ranked list is walked only until `limit`.
+        query = query.strip().lower()
+        if not query:
+            return self.ranked(limit)
+        if "\n" in query:
+            return []
+        found = self.matches(query)
+        if len(found) * 8 < len(self.order):
+            ranked = sorted(found, key=lambda value: (not found[value], self._order_item(value)))
+            return ranked[:limit]
+        results = []
+        for prefix in (True, False):
+            for _, value in self.order:
+                if len(results) >= limit:
+                    return results
+                if found.get(value, None) is prefix:
+                    results.append(value)
+        return results
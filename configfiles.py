@@ -0,0 +1,239 @@
+# Parsers/emitters for the files ProxyMaster manages. render() only touches lines for the keys it
+# is asked to manage: lines whose value already matches are kept byte-for-byte, changed keys are
+# rewritten in place, duplicates are dropped and missing keys are appended (inside the right
+# section for ini-style files). Rendering the desired state of an up-to-date file is a no-op.
+# scan() and iter_render() work on any iterable of lines (e.g. an open file), so large files can be
+# processed as a stream; parse() and render() are the whole-text conveniences built on them.
+# Lines are matched with str methods rather than regular expressions: scan() is on the `cli.py status`
+# path, which would otherwise pay for importing re on every call.
+
+
+def is_word(text, extra=""):
+    # Same characters as the regex class [\w<extra>]+
+    return bool(text) and all(c.isalnum() or c == "_" or c in extra for c in text)
+
+
+class LineConfig:
+    section = None
+
+    def split(self, line):
+        # KEY=value
+        key, sep, value = line.partition("=")
+        if sep and is_word(key):
+            return key, value
+        return None, None
+
+    def match(self, line):
+        key, value = self.split(line.rstrip("\n"))
+        if key is None:
+            return None, None
+        return key, self.unquote(value)
+
+    def unquote(self, value):
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            return value[1:-1]
+        return value
+
+    def format(self, key, value):
+        return f'{key}="{value}"\n'
+
+    def parse(self, text):
+        return dict(self.scan(text.splitlines(keepends=True)))
+
+    def scan(self, lines, keys=None):
+        # Yields the first (key, value) of each key in the managed section, reading `lines` lazily so
+        # callers can stop as soon as they have what they need
+        seen = set()
+        for section, line in self.iter_lines(lines):
+            if section != self.section:
+                continue
+            key, value = self.match(line)
+            if key is not None and key not in seen and (keys is None or key in keys):
+                seen.add(key)
+                yield key, value
+
+    def iter_lines(self, lines):
+        if self.section is None:
+            for line in lines:
+                yield None, line
+            return
+        section = None
+        for line in lines:
+            stripped = line.strip()
+            if stripped.startswith("[") and stripped.endswith("]"):
+                section = stripped[1:-1].strip()
+            yield section, line
+
+    def render(self, text, desired):
+        return "".join(self.iter_render(text.splitlines(keepends=True), desired))
+
+    def iter_render(self, lines, desired):
+        # Streaming render: only blank lines at the end of the managed section are held back, so
+        # missing keys can be inserted before them; everything else is yielded as it is read
+        seen = set()
+        held = []
+        last = ""
+        done = False
+        found = self.section is None
+        in_section = self.section is None
+        for section, line in self.iter_lines(lines):
+            if self.section is not None:
+                if in_section and section != self.section and not done:
+                    yield from self.missing(desired, seen, last)
+                    done = True
+                in_section = section == self.section
+                found = found or in_section
+            key, value = self.match(line) if in_section else (None, None)
+            if key is not None and key in desired:
+                if key in seen or desired[key] is None:
+                    continue
+                seen.add(key)
+                if value != desired[key]:
+                    line = self.format(key, desired[key])
+            if in_section and not done and line.isspace():
+                held.append(line)
+                continue
+            if held:
+                yield from held
+                held = []
+            yield line
+            last = line
+        if not done:
+            if not found:
+                # Section not present at all: start it at the end of the file
+                yield from held
+                if held:
+                    last = held[-1]
+                held = []
+                if any(value is not None and key not in seen for key, value in desired.items()):
+                    if last and not last.endswith("\n"):
+                        yield "\n"
+                    yield f"[{self.section}]\n"
+                    last = "\n"
+            yield from self.missing(desired, seen, last)
+        yield from held
+
+    def missing(self, desired, seen, last):
+        missing = [self.format(key, value) for key, value in desired.items() if value is not None and key not in seen]
+        # Inserted keys count as seen: a repeated section later in the file then has its copies dropped,
+        # instead of rewritten now and removed on the next render
+        seen.update(key for key, value in desired.items() if value is not None)
+        if missing and last and not last.endswith("\n"):
+            yield "\n"
+        yield from missing
+
+
+class EnvironmentConfig(LineConfig):
+    pass
+
+
+class ShellConfig(LineConfig):
+    def split(self, line):
+        # export KEY=value
+        if not line.startswith("export"):
+            return None, None
+        rest = line[6:].lstrip()
+        if len(rest) == len(line) - 6:
+            # No whitespace after `export`
+            return None, None
+        return LineConfig.split(self, rest)
+
+    def format(self, key, value):
+        return f'export {key}="{value}"\n'
+
+
+class AptConfig(LineConfig):
+    def split(self, line):
+        # Acquire::some::Key "value";
+        line = line.strip()
+        fields = line[:-1].rstrip().split(None, 1) if line.endswith(";") else ()
+        if len(fields) != 2:
+            return None, None
+        key, value = fields
+        if not key.startswith("Acquire::") or not is_word(key[9:], ":.-"):
+            return None, None
+        if len(value) < 2 or value[0] != '"' or value[-1] != '"':
+            return None, None
+        return key, value
+
+    def format(self, key, value):
+        return f'{key} "{value}";\n'
+
+
+class IniConfig(LineConfig):
+    section = "main"
+
+    def __init__(self, section="main", separator="="):
+        self.section = section
+        self.separator = separator
+
+    def split(self, line):
+        # key = value, spaces around both optional
+        key, sep, value = line.partition("=")
+        key = key.strip()
+        if sep and is_word(key, "."):
+            return key, value.strip()
+        return None, None
+
+    def unquote(self, value):
+        return value
+
+    def format(self, key, value):
+        return f"{key}{self.separator}{value}\n"
+
+
+class PacmanConfig:
+    # pacman has no proxy option; libalpm's downloader honours the *_proxy environment, so instead
+    # of routing every download through a serial XferCommand we only disable any XferCommand (which
+    # would bypass ParallelDownloads) and leave a marker so removal can restore it.
+    marker = "# ProxyMaster: proxy comes from the environment; XferCommand disabled to keep ParallelDownloads\n"
+    disabled_prefix = "#ProxyMaster-disabled# "
+    legacy = r"^XferCommand\s*=\s*/usr/bin/curl -x \S+ -L -C - -f %u > %o$"
+
+    def parse(self, text):
+        return dict(self.scan(text.splitlines(keepends=True)))
+
+    def scan(self, lines, keys=None):
+        for line in lines:
+            if line.rstrip("\n") == self.marker.rstrip("\n"):
+                yield "proxy", "environment"
+                return
+
+    def render(self, text, desired):
+        return "".join(self.iter_render(text.splitlines(keepends=True), desired))
+
+    def iter_render(self, lines, desired):
+        import re
+        legacy = re.compile(self.legacy)
+        enabled = bool(desired.get("proxy"))
+        marked = False
+        last = ""
+        for line in lines:
+            stripped = line.strip()
+            if stripped == self.marker.strip() or legacy.match(stripped):
+                # Our marker is re-added below; XferCommand lines written by older versions are dropped
+                continue
+            if enabled and stripped.startswith("XferCommand"):
+                line = self.disabled_prefix + line
+            elif not enabled and line.startswith(self.disabled_prefix):
+                line = line[len(self.disabled_prefix):]
+            yield line
+            last = line
+            if enabled and stripped == "[options]" and not marked:
+                yield self.marker
+                last = self.marker
+                marked = True
+        if enabled and not marked:
+            if last and not last.endswith("\n"):
+                yield "\n"
+            yield "[options]\n"
+            yield self.marker
+
+
+ENVIRONMENT = EnvironmentConfig()
+SHELL = ShellConfig()
+APT = AptConfig()
+DNF = IniConfig("main")
+ZYPPER = IniConfig("main")
+PACMAN = PacmanConfig()
@@ -0,0 +1,476 @@
+import os
+
+import configfiles
+import tracing
+
+ENV_VARS = ("http_proxy", "https_proxy", "ftp_proxy", "no_proxy")
+PACKAGE_MANAGERS = ("apt", "dnf", "pacman", "zypper")
+ENVIRONMENT_FILE = "/etc/environment"
+APT_PROXY_CONF = "/etc/apt/apt.conf.d/99proxy"
+SUDOERS_PROXY_CONF = "/etc/sudoers.d/proxymaster"
+SUDOERS_PROXY_CONTENT = (
+    "# Managed by ProxyMaster: keep the proxy environment for commands run through sudo (e.g. pacman)\n"
+    'Defaults env_keep += "http_proxy https_proxy ftp_proxy no_proxy"\n'
+    'Defaults env_keep += "HTTP_PROXY HTTPS_PROXY FTP_PROXY NO_PROXY"\n'
+)
+PACKAGE_MANAGER_CONFIGS = {
+    "apt": (APT_PROXY_CONF, configfiles.APT),
+    "dnf": ("/etc/dnf/dnf.conf", configfiles.DNF),
+    "pacman": ("/etc/pacman.conf", configfiles.PACMAN),
+    "zypper": ("/etc/zypp/zypp.conf", configfiles.ZYPPER),
+}
+# Download-throughput options a profile may carry per package manager; they live in the same file as
+# the proxy, so they are rendered into the same plan and committed in the same transaction
+DOWNLOAD_SETTINGS = {
+    "apt": ("Acquire::Queue-Mode", "Acquire::http::Pipeline-Depth", "Acquire::http::Timeout", "Acquire::Retries"),
+    "dnf": ("max_parallel_downloads", "fastestmirror", "timeout", "retries", "minrate"),
+    "zypper": ("download.max_concurrent_connections", "download.transfer_timeout", "download.max_silent_tries",
+               "download.min_download_speed"),
+}
+# A download setting with this value (or None in a saved profile) is removed from the config file
+UNSET = "unset"
+
+
+def make_env_vars(http_proxy="", https_proxy="", ftp_proxy="", no_proxy=""):
+    return {
+        "http_proxy": http_proxy,
+        "https_proxy": https_proxy,
+        "ftp_proxy": ftp_proxy,
+        "no_proxy": no_proxy
+    }
+
+
+def profile_env_vars(profile):
+    return make_env_vars(*(profile.get(var, "").strip() for var in ENV_VARS))
+
+
+def profile_downloads(profile):
+    # {pm: {option: value}} with unknown options dropped; empty values leave the option untouched and
+    # None removes it
+    downloads = {}
+    for pm, settings in (profile.get("downloads") or {}).items():
+        for key, value in (settings or {}).items():
+            if key not in DOWNLOAD_SETTINGS.get(pm, ()):
+                continue
+            if value is None or str(value).strip().lower() == UNSET:
+                downloads.setdefault(pm, {})[key] = None
+                continue
+            value = str(value).strip()
+            if not value:
+                continue
+            if "\n" in value or '"' in value or ";" in value:
+                raise ValueError(f"invalid value for {pm} {key}: {value!r}")
+            downloads.setdefault(pm, {})[key] = value
+    return downloads
+
+
+def rooted(path, root="/"):
+    if root in ("", "/"):
+        return path
+    # Image trees often contain absolute symlinks, which would lead to the host's own files: resolve
+    # the path and refuse to read or write anything that ends up outside the tree
+    top = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(top, path.lstrip("/")))
+    if os.path.commonpath([top, resolved]) != top:
+        raise PermissionError(f"{os.path.join(root, path.lstrip('/'))} resolves outside {root}: {resolved}")
+    return resolved
+
+
+def detect_package_managers(root="/"):
+    import shutil
+    pkgmanagers = {}
+    with tracing.span("detect_package_managers", root=root):
+        if root in ("", "/"):
+            for pm in PACKAGE_MANAGERS:
+                pkgmanagers[pm] = shutil.which(pm) is not None
+            return pkgmanagers
+        # Offline trees: look for the binary inside the tree (absolute symlinks may point into the
+        # tree's own filesystem, so only check that the entry exists)
+        bin_dirs = ("usr/bin", "bin", "usr/sbin", "sbin")
+        for pm in PACKAGE_MANAGERS:
+            pkgmanagers[pm] = any(os.path.lexists(os.path.join(root, d, pm)) for d in bin_dirs)
+        return pkgmanagers
+
+
+def get_user_rc():
+    shell = os.environ.get("SHELL", "")
+    if "zsh" in shell:
+        return os.path.expanduser("~/.zshrc")
+    return os.path.expanduser("~/.bashrc")
+
+
+def get_shell_state_file():
+    # With shell integration installed, open shells read the proxy from the sourced env file instead
+    import shellenv
+    return shellenv.ENV_PATH if shellenv.installed() else get_user_rc()
+
+
+def read_text(path):
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def desired_environment(env_vars):
+    return {var: env_vars.get(var) or None for var in ENV_VARS}
+
+
+def desired_package_manager(pm, env_vars, downloads=None):
+    http_proxy = env_vars.get("http_proxy") or None
+    if pm == "apt":
+        desired = {
+            "Acquire::http::Proxy": http_proxy,
+            "Acquire::https::Proxy": env_vars.get("https_proxy") or None,
+            "Acquire::ftp::Proxy": env_vars.get("ftp_proxy") or None,
+        }
+    elif pm == "pacman":
+        desired = {"proxy": "environment" if http_proxy or env_vars.get("https_proxy") else None}
+    else:
+        desired = {"proxy": http_proxy}
+    desired.update((downloads or {}).get(pm, {}))
+    return desired
+
+
+def make_plan(path, old, new, label=None, mode=None):
+    # Describes what a file should become; "changed" is False when it is already correct
+    return {"target": path, "old": old, "new": new, "changed": new != old, "label": label or path, "mode": mode}
+
+
+def plan_file(path, parser, desired, must_exist=False, remove_if_empty=False, label=None):
+    with tracing.span("read config", "io", path=path):
+        old = read_text(path)
+    if old is None and must_exist:
+        raise FileNotFoundError(f"No such file or directory: '{path}'")
+    with tracing.span("render config", path=path):
+        new = parser.render(old or "", desired)
+    if remove_if_empty and not new.strip():
+        new = None
+    return make_plan(path, old, new, label)
+
+
+def plan_environment(env_vars, root="/"):
+    return plan_file(rooted(ENVIRONMENT_FILE, root), configfiles.ENVIRONMENT, desired_environment(env_vars),
+                     label=ENVIRONMENT_FILE)
+
+
+def plan_package_manager(pm, env_vars, root="/", downloads=None):
+    path, parser = PACKAGE_MANAGER_CONFIGS[pm]
+    # apt uses a drop-in file owned by ProxyMaster; the others edit the distribution's main config
+    plan = plan_file(rooted(path, root), parser, desired_package_manager(pm, env_vars, downloads),
+                     must_exist=pm != "apt", remove_if_empty=pm == "apt", label=pm)
+    if pm == "pacman":
+        return [plan] + plan_pacman_environment(env_vars, root)
+    return [plan]
+
+
+def plan_pacman_environment(env_vars, root="/"):
+    # pacman picks the proxy up from its environment: /etc/environment for login sessions and a
+    # sudoers env_keep drop-in so `sudo pacman` does not strip it. Both are planned whether the proxy
+    # is being set or removed, so removing it really stops pacman from using it.
+    enabled = bool(desired_package_manager("pacman", env_vars)["proxy"])
+    plans = []
+    sudoers = rooted(SUDOERS_PROXY_CONF, root)
+    if os.path.isdir(os.path.dirname(sudoers)):
+        try:
+            old = read_text(sudoers)
+            known = True
+        except PermissionError:
+            old, known = None, False
+        plan = make_plan(sudoers, old, SUDOERS_PROXY_CONTENT if enabled else None, mode=0o440)
+        if not known:
+            # /etc/sudoers.d is root-only: always stage the drop-in and let the helper report
+            # whether it actually changed
+            plan["changed"] = True
+        plans.append(plan)
+    plans.append(plan_environment(env_vars, root))
+    return plans
+
+
+def stage_plan(transaction, plan):
+    if not plan["changed"]:
+        transaction.skip(plan["target"], label=plan["label"])
+    elif plan["new"] is None:
+        transaction.remove(plan["target"], label=plan["label"])
+    else:
+        transaction.write(plan["target"], plan["new"], label=plan["label"], mode=plan["mode"])
+
+
+def write_plan(plan, follow_symlinks=True):
+    # rewrite (and the hashlib/tempfile it needs) is only imported on write paths, keeping `status` cheap
+    import rewrite
+    if not plan["changed"]:
+        return
+    with tracing.span("write config", "io", path=plan["target"]):
+        if plan["new"] is None:
+            if os.path.lexists(plan["target"]):
+                os.remove(plan["target"])
+        else:
+            rewrite.atomic_write(plan["target"], plan["new"], plan["mode"], follow_symlinks)
+
+
+def update_user_rc(env_vars, log=print):
+    import rewrite
+    import shellenv
+    if shellenv.installed():
+        try:
+            if shellenv.write_env(env_vars):
+                log("Shell environment updated; open shells pick it up at their next prompt.")
+            else:
+                log("Shell environment already up to date.")
+        except Exception as e:
+            log(f"Error writing to {shellenv.ENV_PATH}: {e}")
+        return
+    user_rc = get_user_rc()
+    try:
+        # Dotfiles can be large: stream the rewrite instead of building the new file in memory
+        with tracing.span("rewrite user rc", "io", path=user_rc):
+            changed = rewrite.rewrite_file(user_rc, configfiles.SHELL, desired_environment(env_vars))
+        if changed:
+            log("User shell config updated.")
+        else:
+            log("User shell config already up to date.")
+    except Exception as e:
+        log(f"Error writing to {user_rc}: {e}")
+
+
+def install_shell_integration(shells=None, log=print):
+    import rewrite
+    import shellenv
+    # Carry the values exported from the rc file (or else /etc/environment) over into the env file, then
+    # drop the export lines so the sourced file is the only source of truth
+    values = read_values(get_user_rc(), configfiles.SHELL, ENV_VARS) or read_values(ENVIRONMENT_FILE,
+                                                                                    configfiles.ENVIRONMENT, ENV_VARS)
+    env_vars = make_env_vars(**values)
+    shells = shells or shellenv.detect_shells()
+    for shell in shells:
+        rc = shellenv.RC_PATHS.get(shell)
+        if rc and rewrite.rewrite_file(rc, configfiles.SHELL, desired_environment(make_env_vars())):
+            log(f"Proxy exports removed from {rc}.")
+    return shellenv.install(env_vars, shells, log)
+
+
+def uninstall_shell_integration(log=print):
+    import shellenv
+    # Back to export lines in the rc file, with the values the env file held
+    try:
+        with open(shellenv.ENV_PATH, "r") as f:
+            values = dict(configfiles.SHELL.scan(f, ENV_VARS))
+    except FileNotFoundError:
+        values = {}
+    shellenv.uninstall(log)
+    update_user_rc(make_env_vars(**values), log)
+
+
+def stage_proxy_settings(env_vars, package_managers, log=print, downloads=None):
+    from privileged import PrivilegedTransaction
+    # Stage every target first so a single pkexec call commits them all; files that are
+    # already correct are recorded as unchanged and never reach pkexec
+    transaction = PrivilegedTransaction()
+    staged = set()
+    try:
+        plan = plan_environment(env_vars)
+        stage_plan(transaction, plan)
+        staged.add(plan["target"])
+    except Exception as e:
+        log(f"Error writing to {ENVIRONMENT_FILE}: {e}")
+    for pm in package_managers:
+        try:
+            for plan in plan_package_manager(pm, env_vars, downloads=downloads):
+                if plan["target"] not in staged:
+                    stage_plan(transaction, plan)
+                    staged.add(plan["target"])
+        except Exception as e:
+            log(f"Error setting proxy for {pm}: {e}")
+    return transaction
+
+
+def commit_proxy_settings(transaction, log=print):
+    env_updated = False
+    if transaction.ops:
+        targets = ", ".join(op["label"] for op in transaction.ops)
+        log(f"Requesting admin password to update {targets}...")
+    for result in transaction.commit():
+        if result["ok"] and not result["changed"]:
+            log(f"{result['label']} already up to date.")
+            env_updated = env_updated or result["label"] == ENVIRONMENT_FILE
+        elif result["label"] == ENVIRONMENT_FILE:
+            if result["ok"]:
+                log(f"{ENVIRONMENT_FILE} updated successfully.")
+                env_updated = True
+            else:
+                log(f"Error: {result['error']}")
+        elif result["ok"]:
+            if result["label"] in PACKAGE_MANAGERS:
+                log(f"{result['label']} proxy set successfully.")
+            else:
+                log(f"{result['label']} updated successfully.")
+        else:
+            log(f"Error setting {result['label']} proxy: {result['error']}")
+    return env_updated
+
+
+def apply_proxy_settings(env_vars, package_managers=(), log=print, downloads=None):
+    transaction = stage_proxy_settings(env_vars, package_managers, log, downloads)
+    env_updated = commit_proxy_settings(transaction, log)
+    update_user_rc(env_vars, log)
+    return env_updated
+
+
+def disable_proxy(log=print):
+    from privileged import PrivilegedTransaction
+    transaction = PrivilegedTransaction()
+    try:
+        stage_plan(transaction, plan_environment(make_env_vars()))
+    except Exception as e:
+        log(f"Error disabling proxy in {ENVIRONMENT_FILE}: {e}")
+    ok = False
+    for result in transaction.commit():
+        if result["ok"]:
+            log(f"Proxy removed from {ENVIRONMENT_FILE}." if result["changed"] else f"Proxy already disabled in {ENVIRONMENT_FILE}.")
+            ok = True
+        else:
+            log(f"Error disabling proxy in {ENVIRONMENT_FILE}: {result['error']}")
+    update_user_rc(make_env_vars(), log)
+    return ok
+
+
+def set_package_manager_proxy(pm, env_vars, log=print, downloads=None):
+    from privileged import PrivilegedTransaction
+    try:
+        transaction = PrivilegedTransaction()
+        for plan in plan_package_manager(pm, env_vars, downloads=downloads):
+            stage_plan(transaction, plan)
+        ok = True
+        for result in transaction.commit():
+            if not result["ok"]:
+                log(f"Error setting {pm} proxy: {result['error']}")
+                ok = False
+            elif result["label"] != pm:
+                if result["changed"]:
+                    log(f"{result['label']} updated successfully.")
+            else:
+                log(f"{pm} proxy set successfully." if result["changed"] else f"{pm} proxy already up to date.")
+        return ok
+    except Exception as e:
+        log(f"Error setting proxy for {pm}: {e}")
+        return False
+
+
+def remove_package_manager_proxy(pm, log=print):
+    from privileged import PrivilegedTransaction
+    try:
+        transaction = PrivilegedTransaction()
+        for plan in plan_package_manager(pm, make_env_vars()):
+            stage_plan(transaction, plan)
+        ok = True
+        for result in transaction.commit():
+            if not result["ok"]:
+                log(f"Error removing {pm} proxy: {result['error']}")
+                ok = False
+            elif result["label"] == ENVIRONMENT_FILE:
+                if result["changed"]:
+                    log(f"Proxy removed from {ENVIRONMENT_FILE}.")
+            elif result["label"] != pm:
+                if result["changed"]:
+                    log(f"{result['label']} removed.")
+            else:
+                log(f"{pm} proxy removed." if result["changed"] else f"{pm} has no proxy configured.")
+        return ok
+    except Exception as e:
+        log(f"Error removing proxy for {pm}: {e}")
+        return False
+
+
+def read_values(path, parser, keys):
+    # Reads lazily and stops once every key has been seen
+    try:
+        f = open(path, "r")
+    except FileNotFoundError:
+        return {}
+    values = {}
+    with f:
+        for key, value in parser.scan(f, keys):
+            values[key] = value
+            if len(values) == len(keys):
+                break
+    return values
+
+
+def is_proxy_enabled(root="/"):
+    try:
+        f = open(rooted(ENVIRONMENT_FILE, root), "r")
+    except OSError:
+        return False
+    with f:
+        for key, value in configfiles.ENVIRONMENT.scan(f, ("http_proxy", "https_proxy")):
+            if value:
+                return True
+    return False
+
+
+def package_manager_status(pm, root="/"):
+    path, parser = PACKAGE_MANAGER_CONFIGS[pm]
+    try:
+        return bool(read_values(rooted(path, root), parser, desired_package_manager(pm, {})))
+    except OSError:
+        return False
+
+
+def read_status(root="/"):
+    try:
+        environment = read_values(rooted(ENVIRONMENT_FILE, root), configfiles.ENVIRONMENT, ENV_VARS)
+    except OSError:
+        environment = {}
+    status = {
+        "enabled": bool(environment.get("http_proxy") or environment.get("https_proxy")),
+        "environment": environment,
+        "package_managers": {pm: package_manager_status(pm, root) for pm in PACKAGE_MANAGERS},
+    }
+    if root in ("", "/"):
+        status["user_rc"] = get_shell_state_file()
+        try:
+            status["shell"] = read_values(status["user_rc"], configfiles.SHELL, ENV_VARS)
+        except OSError:
+            status["shell"] = {}
+    return status
+
+
+def apply_to_root(root, env_vars, package_managers=None, downloads=None):
+    # Offline apply into a chroot or image tree: files are written directly, no pkexec and no
+    # user shell config. Runs in worker processes, so everything is reported in the result.
+    result = {"root": root, "ok": True, "targets": [], "error": ""}
+    try:
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"no such directory: {root}")
+        if package_managers is None:
+            package_managers = [pm for pm, found in detect_package_managers(root).items() if found]
+        plans = [plan_environment(env_vars, root)]
+        for pm in package_managers:
+            plans.extend(plan for plan in plan_package_manager(pm, env_vars, root, downloads)
+                         if plan["target"] not in {p["target"] for p in plans})
+    except Exception as e:
+        result.update(ok=False, error=str(e))
+        return result
+    for plan in plans:
+        try:
+            # Targets were resolved inside the tree by rooted(); a link that appeared since is replaced, not followed
+            write_plan(plan, follow_symlinks=False)
+            result["targets"].append({"target": plan["target"], "ok": True, "changed": plan["changed"], "error": ""})
+        except Exception as e:
+            result["ok"] = False
+            result["targets"].append({"target": plan["target"], "ok": False, "changed": plan["changed"], "error": str(e)})
+    return result
+
+
+def apply_to_roots(roots, env_vars, package_managers=None, workers=None, downloads=None):
+    if len(roots) <= 1:
+        return [apply_to_root(root, env_vars, package_managers, downloads) for root in roots]
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(roots) // ((workers or os.cpu_count() or 1) * 4))
+        return list(pool.map(partial(apply_to_root, env_vars=env_vars, package_managers=package_managers,
+                                     downloads=downloads),
+                             roots, chunksize=chunksize))
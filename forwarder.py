@@ -0,0 +1,630 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+from noproxy import compile_no_proxy
+from probe import parse_proxy_url
+
+# Local forwarding proxy. The system proxy settings point at 127.0.0.1, and this daemon forwards to a
+# ranked list of upstream proxies from the active profile:
+# - keep-alive connections to each upstream are pooled and reused across requests;
+# - an upstream that refuses, resets or times out is marked down and the request is replayed on the
+#   next one, so tools never see the failure;
+# - down upstreams are only probed in the background, so later requests skip them at no cost, and an
+#   upstream that comes back rejoins with its probe connection already in the pool;
+# - no_proxy matches are connected directly;
+# - counters for requests, bytes and latency are served as JSON at http://127.0.0.1:PORT/proxymaster/stats.
+# Small bodies of replayable requests are buffered so that a failed attempt can be replayed; other request
+# bodies and all response bodies are streamed, and a request whose body has started is never failed over.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 3128
+STATS_PATH = "/proxymaster/stats"
+MAX_HEAD_BYTES = 65536
+# Connection-level headers are not forwarded, nor are the client's proxy credentials (each upstream has its own)
+HOP_BY_HOP = frozenset(("connection", "keep-alive", "proxy-connection", "proxy-authorization", "te", "upgrade",
+                        "expect"))
+# Methods that may be replayed on another upstream once they were sent
+REPLAYABLE = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE", "CONNECT"))
+# Largest request body kept in memory for a replay; longer or chunked bodies are streamed
+MAX_REPLAY_BODY = 1 << 20
+LATENCY_SAMPLES = 1024
+COUNTERS = ("requests", "tunnels", "direct", "errors", "failovers", "bytes_sent", "bytes_received")
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class BodyBuffer:
+    # Minimal writer interface, so request bodies are read with the same copy helpers as responses
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+
+    async def drain(self):
+        pass
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+def parse_head(data):
+    lines = data.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise ValueError(f"malformed header line: {line!r}")
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+def render_head(start_line, headers):
+    return (start_line + "\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers) + "\r\n").encode("latin-1")
+
+
+def header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def connection_tokens(headers):
+    tokens = set()
+    for key, value in headers:
+        if key.lower() in ("connection", "proxy-connection"):
+            tokens.update(token.strip().lower() for token in value.split(","))
+    return tokens
+
+
+def body_framing(headers):
+    # None: chunked, n >= 0: Content-Length, -1: neither (no request body; response runs until close)
+    encoding = header(headers, "transfer-encoding")
+    if encoding is not None and "chunked" in encoding.lower():
+        return None
+    length = header(headers, "content-length")
+    if length is None:
+        return -1
+    if not length.isdigit():
+        raise ValueError(f"invalid Content-Length: {length!r}")
+    return int(length)
+
+
+async def read_head(reader):
+    try:
+        data = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise
+    return data[:-4].lstrip(b"\r\n")
+
+
+async def read_response_head(reader):
+    while True:
+        data = await read_head(reader)
+        if data is None:
+            raise ConnectionResetError("connection closed before the response")
+        status_line, headers = parse_head(data)
+        fields = status_line.split(" ", 2)
+        if len(fields) < 2 or not fields[0].startswith("HTTP/") or not fields[1].isdigit():
+            raise ValueError(f"invalid status line: {status_line!r}")
+        status = int(fields[1])
+        # Interim responses (e.g. 103 Early Hints) are dropped: Expect and Upgrade are never forwarded
+        if not 100 <= status < 200:
+            return status_line, status, headers
+
+
+async def copy_exactly(reader, writer, length):
+    remaining = length
+    while remaining:
+        data = await reader.read(min(remaining, 65536))
+        if not data:
+            raise asyncio.IncompleteReadError(b"", remaining)
+        writer.write(data)
+        remaining -= len(data)
+        await writer.drain()
+    return length
+
+
+async def copy_chunked(reader, writer):
+    # Chunked bodies are relayed as they are, framing included
+    total = 0
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        writer.write(line)
+        total += len(line)
+        size = int(line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                writer.write(line)
+                total += len(line)
+                if line == b"\r\n":
+                    await writer.drain()
+                    return total
+        total += await copy_exactly(reader, writer, size + 2)
+
+
+async def copy_until_eof(reader, writer):
+    total = 0
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return total
+        writer.write(data)
+        total += len(data)
+        await writer.drain()
+
+
+async def copy_body(reader, writer, framing):
+    if framing is None:
+        return await copy_chunked(reader, writer)
+    if framing < 0:
+        return await copy_until_eof(reader, writer)
+    return await copy_exactly(reader, writer, framing)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Upstream:
+    def __init__(self, url):
+        if "://" in url and not url.lower().startswith("http://"):
+            raise ValueError(f"only http:// upstream proxies are supported: {url!r}")
+        self.url = url
+        self.host, self.port, self.auth = parse_proxy_url(url)
+        self.up = True
+        self.idle = []
+        self.latency_ms = None
+        self.last_error = ""
+        self.counters = {"requests": 0, "tunnels": 0, "failures": 0, "connections": 0, "reused": 0,
+                         "bytes_sent": 0, "bytes_received": 0}
+
+    def auth_headers(self):
+        return [("Proxy-Authorization", f"Basic {self.auth}")] if self.auth else []
+
+    def record_latency(self, ms):
+        # Moving average of the time to response headers
+        self.latency_ms = ms if self.latency_ms is None else 0.8 * self.latency_ms + 0.2 * ms
+
+    def close_idle(self):
+        for reader, writer, since in self.idle:
+            writer.close()
+        self.idle = []
+
+    def snapshot(self):
+        return dict(self.counters, url=self.url, up=self.up, idle=len(self.idle), latency_ms=self.latency_ms,
+                    last_error=self.last_error)
+
+
+def profile_upstreams(profile):
+    # A profile may list its upstreams in rank order; otherwise its http_proxy and https_proxy are used
+    upstreams = profile.get("upstreams")
+    if isinstance(upstreams, str):
+        upstreams = [upstreams]
+    if not upstreams:
+        upstreams = [profile.get("http_proxy"), profile.get("https_proxy")]
+    return list(dict.fromkeys(url.strip() for url in upstreams if url and url.strip()))
+
+
+class ForwardingProxy:
+    def __init__(self, upstreams, no_proxy="", host=DEFAULT_HOST, port=DEFAULT_PORT, connect_timeout=2.0,
+                 response_timeout=60.0, check_interval=1.0, pool_size=8, idle_timeout=30.0):
+        self.upstreams = [Upstream(url) for url in dict.fromkeys(upstreams)]
+        self.matcher = compile_no_proxy(no_proxy)
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.response_timeout = response_timeout
+        self.check_interval = check_interval
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.clients = {}
+        self.server = None
+        self.health_task = None
+        self.started = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port, limit=MAX_HEAD_BYTES)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started = time.monotonic()
+        self.health_task = asyncio.ensure_future(self.health_loop())
+
+    async def close(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        # Closing the client connections ends their handlers (and tunnels); give them a moment to finish
+        for writer in list(self.clients):
+            writer.close()
+        tasks = [task for task in self.clients.values() if task is not None]
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=1.0)
+            for task in pending:
+                task.cancel()
+        for upstream in self.upstreams:
+            upstream.close_idle()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def count(self, upstream, key, n=1):
+        self.counters[key] += n
+        if upstream is not None:
+            upstream.counters[key] += n
+
+    def candidates(self):
+        # Healthy upstreams in rank order; when none is, all of them, since one may just have come back
+        healthy = [upstream for upstream in self.upstreams if upstream.up]
+        return healthy or list(self.upstreams)
+
+    def mark_down(self, upstream, error):
+        upstream.up = False
+        upstream.counters["failures"] += 1
+        upstream.last_error = str(error) or error.__class__.__name__
+        upstream.close_idle()
+
+    async def health_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for upstream in self.upstreams:
+                if upstream.up:
+                    continue
+                try:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(upstream.host, upstream.port),
+                                                            self.connect_timeout)
+                except (OSError, asyncio.TimeoutError) as e:
+                    upstream.last_error = str(e) or e.__class__.__name__
+                    continue
+                upstream.up = True
+                upstream.counters["connections"] += 1
+                upstream.idle.append((reader, writer, time.monotonic()))
+
+    async def acquire(self, upstream):
+        now = time.monotonic()
+        while upstream.idle:
+            reader, writer, since = upstream.idle.pop()
+            if now - since < self.idle_timeout and not reader.at_eof() and not writer.is_closing():
+                upstream.counters["reused"] += 1
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(upstream.host, upstream.port),
+                                                self.connect_timeout)
+        upstream.counters["connections"] += 1
+        return reader, writer, False
+
+    def release(self, upstream, reader, writer):
+        if upstream.up and len(upstream.idle) < self.pool_size and not writer.is_closing():
+            upstream.idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    async def exchange(self, method, build_request, send_body=None):
+        # Sends the request to the first upstream that answers. A failed pooled connection is retried
+        # once on a fresh one (the upstream may simply have closed it); any other failure marks the
+        # upstream down and moves on to the next, unless the request was sent and cannot be replayed.
+        # send_body streams the request body after the head: once it has started there is no retry.
+        errors = []
+        replayable = method in REPLAYABLE and send_body is None
+        for position, upstream in enumerate(self.candidates()):
+            retry_fresh = True
+            while True:
+                try:
+                    reader, writer, reused = await self.acquire(upstream)
+                except (OSError, asyncio.TimeoutError) as e:
+                    self.mark_down(upstream, e)
+                    errors.append(f"{upstream.url}: {upstream.last_error}")
+                    break
+                start = time.monotonic()
+                body_started = sending = False
+                try:
+                    writer.write(build_request(upstream))
+                    await writer.drain()
+                    if send_body is not None:
+                        body_started = sending = True
+                        await send_body(writer)
+                        sending = False
+                        start = time.monotonic()
+                    status_line, status, headers = await asyncio.wait_for(read_response_head(reader),
+                                                                          self.response_timeout)
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+                    writer.close()
+                    if sending:
+                        # Either end may have failed mid-body, so the upstream is not blamed for it
+                        errors.append(f"{upstream.url}: request body not delivered: {e}")
+                        raise UpstreamError("; ".join(errors))
+                    retry = replayable or not body_started
+                    if reused and retry_fresh and retry:
+                        retry_fresh = False
+                        continue
+                    self.mark_down(upstream, e)
+                    errors.append(f"{upstream.url}: {upstream.last_error}")
+                    if not retry:
+                        raise UpstreamError("; ".join(errors))
+                    break
+                latency = (time.monotonic() - start) * 1000
+                upstream.record_latency(latency)
+                self.latencies.append(latency)
+                if position:
+                    self.counters["failovers"] += 1
+                return upstream, reader, writer, status_line, status, headers
+        raise UpstreamError("; ".join(errors) or "no upstream proxy configured")
+
+    async def handle_client(self, reader, writer):
+        self.clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                data = await read_head(reader)
+                if data is None:
+                    break
+                try:
+                    request_line, headers = parse_head(data)
+                    method, target, version = request_line.split(" ")
+                except ValueError:
+                    await self.respond(writer, 400, "Bad Request", "malformed request\n")
+                    break
+                if method == "CONNECT":
+                    await self.handle_connect(reader, writer, target)
+                    break
+                if not await self.handle_request(reader, writer, method, target, version, headers):
+                    break
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            self.counters["errors"] += 1
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def respond(self, writer, status, reason, body, keep_alive=False, content_type="text/plain"):
+        payload = body.encode()
+        headers = [("Content-Type", content_type), ("Content-Length", str(len(payload)))]
+        if not keep_alive:
+            headers.append(("Connection", "close"))
+        writer.write(render_head(f"HTTP/1.1 {status} {reason}", headers) + payload)
+        await writer.drain()
+        return keep_alive
+
+    async def handle_request(self, reader, writer, method, target, version, headers):
+        from urllib.parse import urlsplit
+        keep_alive = "close" not in connection_tokens(headers) and (
+            version == "HTTP/1.1" or "keep-alive" in connection_tokens(headers))
+        if target.startswith("/"):
+            # Addressed to the daemon itself rather than proxied
+            if method == "GET" and target == STATS_PATH:
+                return await self.respond(writer, 200, "OK", json.dumps(self.stats(), indent=2) + "\n", keep_alive,
+                                          "application/json")
+            return await self.respond(writer, 404, "Not Found", "not found\n", keep_alive)
+        parts = urlsplit(target)
+        if parts.scheme != "http" or not parts.hostname:
+            self.counters["errors"] += 1
+            return await self.respond(writer, 400, "Bad Request", f"unsupported request target: {target}\n")
+        expect = header(headers, "expect")
+        if expect is not None and expect.lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        framing = body_framing(headers)
+        body = b""
+        buffered = framing == -1 or (method in REPLAYABLE and framing is not None and framing <= MAX_REPLAY_BODY)
+        if buffered and framing > 0:
+            buffer = BodyBuffer()
+            await copy_body(reader, buffer, framing)
+            body = buffer.getvalue()
+        sent = len(body)
+
+        async def send_body(up_writer):
+            nonlocal sent
+            sent = await copy_body(reader, up_writer, framing)
+        forwarded = [(name, value) for name, value in headers if name.lower() not in HOP_BY_HOP]
+        if header(forwarded, "host") is None:
+            forwarded.insert(0, ("Host", parts.netloc))
+        self.counters["requests"] += 1
+        port = parts.port or 80
+
+        if self.matcher.bypass_host(parts.hostname, port):
+            self.counters["direct"] += 1
+            path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            up_writer = None
+            try:
+                up_reader, up_writer = await asyncio.wait_for(asyncio.open_connection(parts.hostname, port),
+                                                              self.connect_timeout)
+                start = time.monotonic()
+                up_writer.write(render_head(f"{method} {path} HTTP/1.1", forwarded + [("Connection", "close")]) + body)
+                await up_writer.drain()
+                if not buffered:
+                    await send_body(up_writer)
+                    start = time.monotonic()
+                status_line, status, response_headers = await asyncio.wait_for(read_response_head(up_reader),
+                                                                               self.response_timeout)
+                self.latencies.append((time.monotonic() - start) * 1000)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+                if up_writer is not None:
+                    up_writer.close()
+                self.counters["errors"] += 1
+                return await self.respond(writer, 502, "Bad Gateway",
+                                          f"direct connection to {parts.hostname}:{port} failed: {e}\n")
+            except BaseException:
+                if up_writer is not None:
+                    up_writer.close()
+                raise
+            upstream = None
+        else:
+            def build_request(upstream):
+                return render_head(f"{method} {target} HTTP/1.1", forwarded + upstream.auth_headers()) + body
+            try:
+                upstream, up_reader, up_writer, status_line, status, response_headers = await self.exchange(
+                    method, build_request, None if buffered else send_body)
+            except UpstreamError as e:
+                self.counters["errors"] += 1
+                return await self.respond(writer, 502, "Bad Gateway", f"all upstream proxies failed: {e}\n")
+            upstream.counters["requests"] += 1
+        self.count(upstream, "bytes_sent", sent)
+
+        response_framing = 0 if method == "HEAD" or status in (204, 304) else body_framing(response_headers)
+        reusable = (upstream is not None and response_framing != -1 and status_line.startswith("HTTP/1.1")
+                    and "close" not in connection_tokens(response_headers))
+        keep_alive = keep_alive and response_framing != -1
+        relayed = [(name, value) for name, value in response_headers
+                   if name.lower() not in ("connection", "keep-alive", "proxy-connection")]
+        if not keep_alive:
+            relayed.append(("Connection", "close"))
+        head = render_head(status_line, relayed)
+        writer.write(head)
+        try:
+            received = await copy_body(up_reader, writer, response_framing)
+        except BaseException:
+            up_writer.close()
+            raise
+        self.count(upstream, "bytes_received", len(head) + received)
+        if reusable:
+            self.release(upstream, up_reader, up_writer)
+        else:
+            up_writer.close()
+        return keep_alive
+
+    async def handle_connect(self, reader, writer, target):
+        host, sep, port = target.rpartition(":")
+        if not sep or not port.isdigit():
+            self.counters["errors"] += 1
+            await self.respond(writer, 400, "Bad Request", f"invalid CONNECT target: {target}\n")
+            return
+        host, port = host.strip("[]"), int(port)
+        self.counters["tunnels"] += 1
+        if self.matcher.bypass_host(host, port):
+            self.counters["direct"] += 1
+            try:
+                up_reader, up_writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.counters["errors"] += 1
+                await self.respond(writer, 502, "Bad Gateway", f"direct connection to {target} failed: {e}\n")
+                return
+            writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+            await self.pipe(reader, writer, up_reader, up_writer, None)
+            return
+
+        def build_request(upstream):
+            return render_head(f"CONNECT {target} HTTP/1.1", [("Host", target)] + upstream.auth_headers())
+        try:
+            upstream, up_reader, up_writer, status_line, status, headers = await self.exchange("CONNECT", build_request)
+        except UpstreamError as e:
+            self.counters["errors"] += 1
+            await self.respond(writer, 502, "Bad Gateway", f"all upstream proxies failed: {e}\n")
+            return
+        upstream.counters["tunnels"] += 1
+        if status != 200:
+            # Refused by the upstream (e.g. 403 or 407): relay its answer as is
+            writer.write(render_head(status_line, headers))
+            try:
+                await copy_body(up_reader, writer, body_framing(headers))
+            finally:
+                up_writer.close()
+            return
+        writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        await self.pipe(reader, writer, up_reader, up_writer, upstream)
+
+    async def pipe(self, client_reader, client_writer, up_reader, up_writer, upstream):
+        async def copy(reader, writer, key):
+            try:
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    writer.write(data)
+                    self.count(upstream, key, len(data))
+                    await writer.drain()
+                if writer.can_write_eof():
+                    writer.write_eof()
+            except OSError:
+                # One side went away: closing both ends stops the other direction too
+                client_writer.close()
+                up_writer.close()
+        try:
+            await asyncio.gather(copy(client_reader, up_writer, "bytes_sent"),
+                                 copy(up_reader, client_writer, "bytes_received"))
+        finally:
+            up_writer.close()
+
+    def stats(self):
+        latencies = list(self.latencies)
+        uptime = time.monotonic() - self.started if self.started is not None else 0.0
+        return dict(self.counters, listen=self.url, uptime_s=uptime,
+                    latency_ms={"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+                                "samples": len(latencies)},
+                    upstreams=[upstream.snapshot() for upstream in self.upstreams])
+
+
+def format_ms(value):
+    return "-" if value is None else f"{value:.1f} ms"
+
+
+def format_stats(stats):
+    uptime = max(stats["uptime_s"], 0.001)
+    lines = [
+        f"{stats['listen']}: {stats['requests']} requests, {stats['tunnels']} tunnels, {stats['direct']} direct, "
+        f"{stats['failovers']} failovers, {stats['errors']} errors; latency p50 {format_ms(stats['latency_ms']['p50'])}, "
+        f"p95 {format_ms(stats['latency_ms']['p95'])}; {stats['bytes_received'] / uptime / 1024:.1f} KiB/s in, "
+        f"{stats['bytes_sent'] / uptime / 1024:.1f} KiB/s out",
+    ]
+    for upstream in stats["upstreams"]:
+        state = "up" if upstream["up"] else f"DOWN ({upstream['last_error']})"
+        lines.append(f"  {upstream['url']}: {state}, {upstream['requests']} requests, {upstream['tunnels']} tunnels, "
+                     f"{upstream['failures']} failures, {upstream['reused']}/{upstream['connections']} reused/opened, "
+                     f"latency {format_ms(upstream['latency_ms'])}")
+    return lines
+
+
+class BackgroundForwarder:
+    # Runs a ForwardingProxy on an event loop in its own thread, for callers without one (the GUI)
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.loop = None
+        self.thread = None
+
+    def start(self, timeout=5.0):
+        import threading
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors = []
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.proxy.start())
+            except OSError as e:
+                errors.append(e)
+                started.set()
+                self.loop.close()
+                return
+            started.set()
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.proxy.close())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, name="proxymaster-forwarder", daemon=True)
+        self.thread.start()
+        started.wait(timeout)
+        if errors:
+            raise errors[0]
+
+    def stats(self, timeout=1.0):
+        async def collect():
+            return self.proxy.stats()
+        return asyncio.run_coroutine_threadsafe(collect(), self.loop).result(timeout)
+
+    def stop(self, timeout=5.0):
+        if self.thread is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
@@ -0,0 +1,68 @@
+import os
+
+# Per-command proxies: `cli.py run --profile NAME -- cmd` executes cmd with the profile's proxy variables
+# injected into its environment. Nothing is written and nothing runs through pkexec, so parallel jobs can
+# each use a different proxy. Profiles are looked up in a tab-separated cache that the store rewrites
+# whenever it saves the profiles JSON: reading it needs neither json nor re, which keeps this path within
+# a few milliseconds of a bare interpreter start. A missing or stale cache falls back to the JSON file.
+
+ENV_VARS = ("http_proxy", "https_proxy", "ftp_proxy", "no_proxy")
+# Same file as store.DEFAULT_PROFILES_PATH, repeated here so the fast path does not import the store
+PROFILES_PATH = os.path.expanduser("~/.proxymaster_profiles.json")
+CACHE_PATH = os.path.expanduser("~/.proxymaster_launch_cache")
+CACHE_HEADER = "proxymaster-launch 1\n"
+
+
+def render_cache(profiles):
+    lines = [CACHE_HEADER]
+    for name, profile in profiles.items():
+        fields = [name] + [str(profile.get(var) or "").strip() for var in ENV_VARS]
+        # Names or values that cannot be stored on one tab-separated line are left to the JSON fallback
+        if any("\t" in field or "\n" in field or "\r" in field for field in fields):
+            continue
+        lines.append("\t".join(fields) + "\n")
+    return "".join(lines)
+
+
+def write_cache(profiles, path=CACHE_PATH):
+    from rewrite import atomic_write
+    atomic_write(path, render_cache(profiles), 0o600)
+
+
+def cached_profile(name, profiles_path=PROFILES_PATH, cache_path=CACHE_PATH):
+    try:
+        # The cache is written right after the JSON; an older cache means the JSON was edited since
+        if os.stat(cache_path).st_mtime_ns < os.stat(profiles_path).st_mtime_ns:
+            return None
+        with open(cache_path, "r") as f:
+            if f.readline() != CACHE_HEADER:
+                return None
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if fields[0] == name and len(fields) == len(ENV_VARS) + 1:
+                    return dict(zip(ENV_VARS, fields[1:]))
+    except OSError:
+        pass
+    return None
+
+
+def get_profile(name):
+    profile = cached_profile(name)
+    if profile is None:
+        from store import get_store
+        profile = get_store().get_profile(name)
+    return profile
+
+
+def profile_environ(profile, environ=None):
+    # Both spellings are set since tools disagree on which one they read; an empty value unsets the
+    # variable, so a profile without a proxy also clears one inherited from the login environment
+    env = dict(os.environ if environ is None else environ)
+    for var in ENV_VARS:
+        value = str(profile.get(var) or "").strip()
+        for name in (var, var.upper()):
+            if value:
+                env[name] = value
+            else:
+                env.pop(name, None)
+    return env
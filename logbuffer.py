@@ -0,0 +1,92 @@
+import time
+from collections import deque
+
+SEVERITIES = ("debug", "info", "warning", "error")
+SEVERITY_LEVELS = {name: level for level, name in enumerate(SEVERITIES)}
+
+
+class LogRecord:
+    __slots__ = ("seq", "timestamp", "severity", "message", "target", "duration")
+
+    def __init__(self, message, severity=None, target=None, duration=None, timestamp=None):
+        self.seq = 0
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.severity = severity or guess_severity(message)
+        self.message = message
+        self.target = target
+        self.duration = duration
+
+    def to_dict(self):
+        return {
+            "seq": self.seq,
+            "timestamp": self.timestamp,
+            "severity": self.severity,
+            "message": self.message,
+            "target": self.target,
+            "duration": self.duration,
+        }
+
+    def format(self):
+        stamp = time.strftime("%H:%M:%S", time.localtime(self.timestamp))
+        text = f"{stamp} {self.severity.upper():7} {self.message}"
+        if self.duration is not None:
+            text += f" ({self.duration * 1000:.0f} ms)"
+        return text
+
+
+def guess_severity(message):
+    lowered = message.lower()
+    if lowered.startswith("error") or " failed" in lowered:
+        return "error"
+    if lowered.startswith("warning") or lowered.startswith("no live proxy"):
+        return "warning"
+    return "info"
+
+
+class LogBuffer:
+    # Fixed-capacity ring buffer: appends are O(1) and memory stays flat; the oldest
+    # records are dropped once capacity is reached.
+    def __init__(self, capacity=10000):
+        self.records = deque(maxlen=capacity)
+        self.next_seq = 1
+
+    @property
+    def capacity(self):
+        return self.records.maxlen
+
+    def append(self, record):
+        record.seq = self.next_seq
+        self.next_seq += 1
+        dropped = len(self.records) == self.records.maxlen
+        self.records.append(record)
+        return dropped
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def clear(self):
+        self.records.clear()
+
+    def filter(self, min_severity="debug", text="", target=None):
+        level = SEVERITY_LEVELS[min_severity]
+        text = text.lower()
+        for record in self.records:
+            if SEVERITY_LEVELS[record.severity] < level:
+                continue
+            if target is not None and record.target != target:
+                continue
+            if text and text not in record.message.lower():
+                continue
+            yield record
+
+    def export_jsonl(self, path, records=None):
+        import json
+        count = 0
+        with open(path, "w") as f:
+            for record in self.records if records is None else records:
+                f.write(json.dumps(record.to_dict()) + "\n")
+                count += 1
+        return count
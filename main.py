@@ -1,57 +1,265 @@
 import sys
-try:
-    from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton, QComboBox, QTabWidget, QTextEdit
-    from PyQt6.QtGui import QPalette, QColor
-    pyqt_version = 6
-except ImportError:
-    from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, QPushButton, QComboBox, QTabWidget, QTextEdit
-    from PyQt5.QtGui import QPalette, QColor
-    pyqt_version = 5
+
+import tracing
+
+tracing.enable_from_argv(sys.argv, 1)
+with tracing.span("import PyQt"):
+    try:
+        from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QTabWidget, QListView, QProgressBar, QCheckBox, QLineEdit, QFileDialog, QCompleter, QInputDialog
+        from PyQt6.QtGui import QPalette, QColor
+        from PyQt6.QtCore import Qt, QThread, QTimer, QSocketNotifier, QAbstractListModel, QModelIndex, QSortFilterProxyModel, pyqtSignal
+        pyqt_version = 6
+    except ImportError:
+        from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QTabWidget, QListView, QProgressBar, QCheckBox, QLineEdit, QFileDialog, QCompleter, QInputDialog
+        from PyQt5.QtGui import QPalette, QColor
+        from PyQt5.QtCore import Qt, QThread, QTimer, QSocketNotifier, QAbstractListModel, QModelIndex, QSortFilterProxyModel, pyqtSignal
+        pyqt_version = 5
+
+import core
+from logbuffer import LogBuffer, LogRecord, SEVERITIES, SEVERITY_LEVELS
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, queue, job_id, name, fn, on_success=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.name = name
+        self.fn = fn
+        self.on_success = on_success
+        self.cancelled = False
+        self.started_at = None
+
+    def log(self, message, severity=None):
+        self.queue.log_message.emit(LogRecord(message, severity, target=self.name))
+
+    def progress(self, done, total, message=""):
+        self.queue.job_progress.emit(self.job_id, done, total, message)
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+
+class JobQueue(QThread):
+    # Jobs run one at a time, in submission order, so back-to-back file operations never interleave
+    job_started = pyqtSignal(int, str)
+    job_progress = pyqtSignal(int, int, int, str)
+    job_finished = pyqtSignal(int, str, object, str)
+    log_message = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        import queue
+        super().__init__(parent)
+        self.pending = queue.Queue()
+        self.jobs = {}
+        self.next_id = 1
+
+    def submit(self, name, fn, on_success=None):
+        job = Job(self, self.next_id, name, fn, on_success)
+        self.next_id += 1
+        self.jobs[job.job_id] = job
+        self.pending.put(job)
+        return job
+
+    def cancel_all(self):
+        for job in list(self.jobs.values()):
+            job.cancelled = True
+
+    def stop(self):
+        self.cancel_all()
+        self.pending.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            job = self.pending.get()
+            if job is None:
+                break
+            if job.cancelled:
+                self.job_finished.emit(job.job_id, "cancelled", None, "")
+                continue
+            import time
+            job.started_at = time.monotonic()
+            self.job_started.emit(job.job_id, job.name)
+            try:
+                with tracing.span(f"job: {job.name}", "job"):
+                    result = job.fn(job)
+                self.job_finished.emit(job.job_id, "ok", result, "")
+            except JobCancelled:
+                self.job_finished.emit(job.job_id, "cancelled", None, "")
+            except Exception as e:
+                self.job_finished.emit(job.job_id, "error", None, str(e))
+
+
+SEVERITY_COLORS = {"debug": "#888888", "info": "#00ff00", "warning": "#ffcc00", "error": "#ff5555"}
+
+
+class LogModel(QAbstractListModel):
+    # Thin view over the ring buffer; QListView only asks for the rows that are visible
+    def __init__(self, buffer, parent=None):
+        super().__init__(parent)
+        self.buffer = buffer
+        self.colors = {severity: QColor(color) for severity, color in SEVERITY_COLORS.items()}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.buffer)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.buffer[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return record.format()
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return self.colors[record.severity]
+        if role == Qt.ItemDataRole.ToolTipRole and record.target:
+            return record.target
+        return None
+
+    def append(self, record):
+        if len(self.buffer) == self.buffer.capacity:
+            self.beginRemoveRows(QModelIndex(), 0, 0)
+            self.buffer.records.popleft()
+            self.endRemoveRows()
+        row = len(self.buffer)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.buffer.append(record)
+        self.endInsertRows()
+
+
+class CompletionModel(QAbstractListModel):
+    # Mirrors a ranked list of values; sync() applies the difference as row removes, moves and inserts
+    # so attached combos and completers keep their state instead of being cleared and refilled
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.values = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.values)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return self.values[index.row()]
+        return None
+
+    def sync(self, values):
+        keep = set(values)
+        for row in range(len(self.values) - 1, -1, -1):
+            if self.values[row] not in keep:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.values[row]
+                self.endRemoveRows()
+        rows = {value: row for row, value in enumerate(self.values)}
+        for row, value in enumerate(values):
+            if row < len(self.values) and self.values[row] == value:
+                continue
+            source = self.values.index(value, row) if value in rows else None
+            if source is None:
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.values.insert(row, value)
+                self.endInsertRows()
+            else:
+                self.beginMoveRows(QModelIndex(), source, source, QModelIndex(), row)
+                self.values.insert(row, self.values.pop(source))
+                self.endMoveRows()
+
+
+class LogFilterModel(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.min_level = 0
+        self.text = ""
+
+    def set_filter(self, min_severity, text):
+        self.min_level = SEVERITY_LEVELS[min_severity]
+        self.text = text.lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, row, parent):
+        record = self.sourceModel().buffer[row]
+        if SEVERITY_LEVELS[record.severity] < self.min_level:
+            return False
+        return not self.text or self.text in record.message.lower()
+
 
 class ProxyMaster(QMainWindow):
-    def get_proxy_history_path(self):
-        import os
-        return os.path.expanduser("~/.proxymaster_proxy_history.json")
+    log_requested = pyqtSignal(object)
 
     def load_proxy_history(self):
-        import json, os
-        path = self.get_proxy_history_path()
-        if os.path.exists(path):
-            with open(path, "r") as f:
-                history = json.load(f)
-        else:
-            history = {"http_proxy": [], "https_proxy": [], "ftp_proxy": [], "no_proxy": []}
-        return history
+        return self.store.get_history()
 
     def save_proxy_history(self, history):
-        import json
-        path = self.get_proxy_history_path()
-        with open(path, "w") as f:
-            json.dump(history, f)
+        self.store.set_history(history)
 
     def add_to_proxy_history(self, http_proxy, https_proxy, ftp_proxy, no_proxy):
-        history = self.load_proxy_history()
-        def add_unique(lst, value):
-            if value and value not in lst:
-                lst.insert(0, value)
-        add_unique(history["http_proxy"], http_proxy)
-        add_unique(history["https_proxy"], https_proxy)
-        add_unique(history["ftp_proxy"], ftp_proxy)
-        add_unique(history["no_proxy"], no_proxy)
-        self.save_proxy_history(history)
-        self.update_proxy_dropdowns(history)
-
-    def update_proxy_dropdowns(self, history=None):
-        if history is None:
-            history = self.load_proxy_history()
-        self.http_proxy_input.clear()
-        self.http_proxy_input.addItems(history["http_proxy"])
-        self.https_proxy_input.clear()
-        self.https_proxy_input.addItems(history["https_proxy"])
-        self.ftp_proxy_input.clear()
-        self.ftp_proxy_input.addItems(history["ftp_proxy"])
-        self.no_proxy_input.clear()
-        self.no_proxy_input.addItems(history["no_proxy"])
+        import time
+        values = {
+            "http_proxy": http_proxy,
+            "https_proxy": https_proxy,
+            "ftp_proxy": ftp_proxy,
+            "no_proxy": no_proxy
+        }
+        now = time.time()
+        evicted = self.store.add_history(values, now)
+        # Incremental: only the used (and evicted) values move in the indexes and combo models
+        for field, value in values.items():
+            index = self.completion_indexes[field]
+            for old in evicted.get(field, []):
+                if old not in self.profile_values[field]:
+                    index.remove(old)
+            index.use(value, now)
+            self.proxy_models[field].sync(index.ranked())
+
+    def proxy_inputs(self):
+        return {
+            "http_proxy": self.http_proxy_input,
+            "https_proxy": self.https_proxy_input,
+            "ftp_proxy": self.ftp_proxy_input,
+            "no_proxy": self.no_proxy_input,
+        }
+
+    def setup_proxy_completion(self):
+        from completion import CompletionIndex
+        self.completion_indexes = {}
+        self.proxy_models = {}
+        self.search_models = {}
+        for field, combo in self.proxy_inputs().items():
+            self.completion_indexes[field] = CompletionIndex()
+            self.proxy_models[field] = CompletionModel(self)
+            combo.setModel(self.proxy_models[field])
+            self.search_models[field] = CompletionModel(self)
+            completer = QCompleter(self.search_models[field], combo)
+            completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+            combo.setCompleter(completer)
+            combo.lineEdit().textEdited.connect(lambda text, f=field: self.update_proxy_completions(f, text))
+        self.update_proxy_dropdowns()
+
+    def update_proxy_dropdowns(self):
+        # Full rebuild from the store (startup and profile changes); saves go through add_to_proxy_history
+        usage = self.store.get_usage()
+        profiles = self.load_profiles()
+        self.profile_values = {field: {profile.get(field) for profile in profiles.values()} - {None, ""}
+                               for field in usage}
+        for field, index in self.completion_indexes.items():
+            for value in [value for value in index.entries if value not in usage[field]]:
+                index.remove(value)
+            for value, (count, last_used) in usage[field].items():
+                index.add(value, count, last_used)
+            for value in self.profile_values[field]:
+                index.add(value)
+            self.proxy_models[field].sync(index.ranked())
+
+    def update_proxy_completions(self, field, text):
+        self.search_models[field].sync(self.completion_indexes[field].search(text))
+        combo = self.proxy_inputs()[field]
+        if text and self.search_models[field].values:
+            combo.completer().complete()
     def init_ui(self):
         tabs = QTabWidget()
 
@@ -82,20 +290,62 @@ class ProxyMaster(QMainWindow):
         self.save_button = QPushButton("Save Proxy Settings")
         self.save_button.clicked.connect(self.save_proxy_settings)
         proxy_layout.addWidget(self.save_button)
+        self.apply_everywhere_button = QPushButton("Apply Everywhere (Environment + Package Managers)")
+        self.apply_everywhere_button.clicked.connect(self.apply_everywhere)
+        proxy_layout.addWidget(self.apply_everywhere_button)
+        self.probe_button = QPushButton("Probe Proxies (Health and Latency)")
+        self.probe_button.clicked.connect(self.probe_all_proxies)
+        proxy_layout.addWidget(self.probe_button)
+        self.launch_button = QPushButton("Launch with Profile...")
+        self.launch_button.clicked.connect(self.launch_with_profile)
+        proxy_layout.addWidget(self.launch_button)
+        self.auto_pick_checkbox = QCheckBox("Pick fastest live proxy before saving")
+        proxy_layout.addWidget(self.auto_pick_checkbox)
+        self.auto_switch_checkbox = QCheckBox("Switch profile automatically on network changes")
+        self.auto_switch_checkbox.toggled.connect(self.set_auto_switch)
+        proxy_layout.addWidget(self.auto_switch_checkbox)
+        import shellenv
+        self.shell_integration_checkbox = QCheckBox("Update open shells at their next prompt (shell integration)")
+        self.shell_integration_checkbox.setChecked(shellenv.installed())
+        self.shell_integration_checkbox.toggled.connect(self.set_shell_integration)
+        proxy_layout.addWidget(self.shell_integration_checkbox)
+        self.forwarder = None
+        self.forwarder_checkbox = QCheckBox("Run local forwarding proxy on 127.0.0.1:3128 "
+                                            "(fails over between the proxies above)")
+        self.forwarder_checkbox.toggled.connect(self.set_forwarder)
+        proxy_layout.addWidget(self.forwarder_checkbox)
+        self.forwarder_label = QLabel("")
+        proxy_layout.addWidget(self.forwarder_label)
+        self.forwarder_timer = QTimer(self)
+        self.forwarder_timer.setInterval(1000)
+        self.forwarder_timer.timeout.connect(self.update_forwarder_stats)
+        test_url_layout = QHBoxLayout()
+        self.test_url_input = QLineEdit()
+        self.test_url_input.setPlaceholderText("https://example.com/")
+        self.test_url_input.returnPressed.connect(self.test_url)
+        test_url_layout.addWidget(self.test_url_input)
+        test_url_button = QPushButton("Test URL")
+        test_url_button.clicked.connect(self.test_url)
+        test_url_layout.addWidget(test_url_button)
+        test_url_list_button = QPushButton("Test URL List...")
+        test_url_list_button.clicked.connect(self.test_url_list)
+        test_url_layout.addWidget(test_url_list_button)
+        proxy_layout.addWidget(QLabel("Would this URL use the proxy?"))
+        proxy_layout.addLayout(test_url_layout)
         proxy_tab.setLayout(proxy_layout)
         tabs.addTab(proxy_tab, "Proxy")
 
         # Load proxy history into dropdowns at startup
-        self.update_proxy_dropdowns()
+        self.setup_proxy_completion()
 
         # Package manager tab
         pkg_tab = QWidget()
         pkg_layout = QVBoxLayout()
-        self.pkgmanagers = self.detect_package_managers()
+        self.pkgmanagers = core.detect_package_managers()
         self.pkgmanager_labels = {}
         self.pkgmanager_proxy_buttons = {}
         pkg_layout.addWidget(QLabel("Package Managers Detected:"))
-        for pm in ["apt", "dnf", "pacman", "zypper"]:
+        for pm in core.PACKAGE_MANAGERS:
             label = QLabel(f"{pm}: {'Found' if self.pkgmanagers.get(pm, False) else 'Not Found'}")
             pkg_layout.addWidget(label)
             self.pkgmanager_labels[pm] = label
@@ -107,6 +357,21 @@ class ProxyMaster(QMainWindow):
                 btn_remove.clicked.connect(self.make_pm_remove_callback(pm))
                 pkg_layout.addWidget(btn_remove)
                 self.pkgmanager_proxy_buttons[pm] = (btn_set, btn_remove)
+        # Download tuning, saved with profiles and written together with the proxy
+        self.download_inputs = {}
+        for pm, keys in core.DOWNLOAD_SETTINGS.items():
+            if not self.pkgmanagers.get(pm, False):
+                continue
+            pkg_layout.addWidget(QLabel(f"{pm} download settings:"))
+            self.download_inputs[pm] = {}
+            for key in keys:
+                row = QHBoxLayout()
+                row.addWidget(QLabel(key))
+                field = QLineEdit()
+                field.setPlaceholderText(f"unchanged ('{core.UNSET}' removes it)")
+                row.addWidget(field)
+                pkg_layout.addLayout(row)
+                self.download_inputs[pm][key] = field
         pkg_tab.setLayout(pkg_layout)
         tabs.addTab(pkg_tab, "Package Managers")
 
@@ -114,61 +379,188 @@ class ProxyMaster(QMainWindow):
         main_layout.addWidget(tabs)
 
         # Log area
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
-        self.log_output.setStyleSheet("background-color: #222; color: #0f0; font-family: monospace; padding: 8px;")
+        self.log_buffer = LogBuffer(capacity=10000)
+        self.log_model = LogModel(self.log_buffer, self)
+        self.log_filter_model = LogFilterModel(self)
+        self.log_view = QListView()
+        self.log_view.setModel(self.log_model)
+        self.log_view.setUniformItemSizes(True)
+        self.log_view.setStyleSheet("background-color: #222; color: #0f0; font-family: monospace; padding: 8px;")
+        self.log_follow = True
+        self.log_scroll_timer = QTimer(self)
+        self.log_scroll_timer.setSingleShot(True)
+        self.log_scroll_timer.setInterval(50)
+        self.log_scroll_timer.timeout.connect(self.log_view.scrollToBottom)
+        log_filter_layout = QHBoxLayout()
+        self.log_severity_combo = QComboBox()
+        self.log_severity_combo.addItems(SEVERITIES)
+        self.log_severity_combo.currentTextChanged.connect(self.update_log_filter)
+        log_filter_layout.addWidget(self.log_severity_combo)
+        self.log_search_input = QLineEdit()
+        self.log_search_input.setPlaceholderText("Filter log...")
+        self.log_search_input.textChanged.connect(self.update_log_filter)
+        log_filter_layout.addWidget(self.log_search_input)
+        export_log_button = QPushButton("Export Log...")
+        export_log_button.clicked.connect(self.export_log)
+        log_filter_layout.addWidget(export_log_button)
+        # Background job status
+        jobs_layout = QHBoxLayout()
+        self.job_status_label = QLabel("Jobs: idle")
+        jobs_layout.addWidget(self.job_status_label)
+        self.job_progress_bar = QProgressBar()
+        self.job_progress_bar.setRange(0, 1)
+        self.job_progress_bar.setValue(0)
+        jobs_layout.addWidget(self.job_progress_bar)
+        self.cancel_jobs_button = QPushButton("Cancel Jobs")
+        self.cancel_jobs_button.clicked.connect(self.jobs.cancel_all)
+        jobs_layout.addWidget(self.cancel_jobs_button)
+        main_layout.addLayout(jobs_layout)
+
         main_layout.addWidget(QLabel("Command Log:"))
-        main_layout.addWidget(self.log_output)
+        main_layout.addLayout(log_filter_layout)
+        main_layout.addWidget(self.log_view)
 
         central_widget = QWidget()
         central_widget.setLayout(main_layout)
         self.setCentralWidget(central_widget)
 
-    def log(self, message):
-        self.log_output.append(message)
-    def get_profiles_path(self):
-        import os
-        path = os.path.expanduser("~/.proxymaster_profiles.json")
-        return path
-
-    def load_profiles(self):
-        import json, os
-        path = self.get_profiles_path()
-        if os.path.exists(path):
-            with open(path, "r") as f:
-                profiles = json.load(f)
+    def log(self, message, severity=None, target=None, duration=None):
+        # Safe to call from the job thread: the signal is delivered on the GUI thread
+        self.log_requested.emit(LogRecord(message, severity, target, duration))
+
+    def append_log(self, record):
+        # scrollToBottom() relayouts the view, so bursts of appends share one scroll
+        if not self.log_scroll_timer.isActive():
+            scrollbar = self.log_view.verticalScrollBar()
+            self.log_follow = scrollbar.value() >= scrollbar.maximum()
+        self.log_model.append(record)
+        if self.log_follow and not self.log_scroll_timer.isActive():
+            self.log_scroll_timer.start()
+
+    def update_log_filter(self, *args):
+        severity = self.log_severity_combo.currentText()
+        text = self.log_search_input.text()
+        # The proxy model remaps every row when the ring buffer drops its oldest record, so it is
+        # only attached while a filter is active and unfiltered appends stay O(1)
+        if severity == SEVERITIES[0] and not text:
+            self.log_view.setModel(self.log_model)
+            self.log_filter_model.setSourceModel(None)
+            return
+        if self.log_filter_model.sourceModel() is None:
+            self.log_filter_model.setSourceModel(self.log_model)
+            self.log_view.setModel(self.log_filter_model)
+        self.log_filter_model.set_filter(severity, text)
+
+    def export_log(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Log", "proxymaster-log.jsonl", "JSON lines (*.jsonl)")
+        if not path:
+            return
+        records = None
+        if self.log_filter_model.sourceModel() is not None:
+            records = [self.log_buffer[self.log_filter_model.mapToSource(self.log_filter_model.index(row, 0)).row()]
+                       for row in range(self.log_filter_model.rowCount())]
+        try:
+            count = self.log_buffer.export_jsonl(path, records)
+            self.log(f"Exported {count} log records to {path}.")
+        except OSError as e:
+            self.log(f"Error exporting log to {path}: {e}")
+
+    def submit_job(self, name, fn, on_success=None):
+        self.jobs.submit(name, fn, on_success)
+        self.update_job_status()
+
+    def update_job_status(self, current=None):
+        queued = len(self.jobs.jobs)
+        if queued == 0:
+            self.job_status_label.setText("Jobs: idle")
+        elif current:
+            self.job_status_label.setText(f"Jobs: {current} ({queued} queued)")
         else:
-            profiles = {"Default": {}}
-        return profiles
+            self.job_status_label.setText(f"Jobs: {queued} queued")
+
+    def on_job_started(self, job_id, name):
+        self.job_progress_bar.setRange(0, 0)
+        self.update_job_status(name)
+        self.log(f"[{name}] started", "debug", target=name)
+
+    def on_job_progress(self, job_id, done, total, message):
+        self.job_progress_bar.setRange(0, max(total, 1))
+        self.job_progress_bar.setValue(done)
+        if message:
+            self.log(message, target=self.jobs.jobs[job_id].name if job_id in self.jobs.jobs else None)
+
+    def on_job_finished(self, job_id, status, result, error):
+        import time
+        job = self.jobs.jobs.pop(job_id, None)
+        if job is None:
+            return
+        duration = time.monotonic() - job.started_at if job.started_at is not None else None
+        if status == "ok":
+            self.log(f"[{job.name}] finished", target=job.name, duration=duration)
+            if job.on_success:
+                job.on_success(result)
+        elif status == "cancelled":
+            self.log(f"[{job.name}] cancelled", "warning", target=job.name, duration=duration)
+        else:
+            self.log(f"[{job.name}] failed: {error}", "error", target=job.name, duration=duration)
+        if not self.jobs.jobs:
+            self.job_progress_bar.setRange(0, 1)
+            self.job_progress_bar.setValue(0)
+            if tracing.enabled():
+                self.log_trace_summary()
+        self.update_job_status()
+
+    def log_trace_summary(self):
+        self.log(f"Trace summary (written to {tracing.trace_path} on exit):", "debug")
+        for line in tracing.format_summary():
+            self.log(line, "debug")
+
+    def closeEvent(self, event):
+        self.jobs.stop()
+        self.store.close()
+        self.state_watcher.close()
+        self.stop_auto_switch()
+        self.stop_forwarder()
+        super().closeEvent(event)
+    def load_profiles(self):
+        return self.store.get_profiles()
 
     def save_profiles(self, profiles):
-        import json
-        path = self.get_profiles_path()
-        with open(path, "w") as f:
-            json.dump(profiles, f)
+        self.store.set_profiles(profiles)
 
     def save_profile(self):
-        profiles = self.load_profiles()
         name, ok = self.get_profile_name_dialog()
         if not ok or not name:
             return
-        profiles[name] = {
+        downloads = self.get_downloads()
+        if downloads is None:
+            return
+        # Only the managers shown here were edited: settings saved for the others are kept
+        saved = (self.store.get_profile(name) or {}).get("downloads") or {}
+        merged = {pm: settings for pm, settings in saved.items() if pm not in self.download_inputs}
+        merged.update(downloads)
+        self.store.set_profile(name, {
             "http_proxy": self.http_proxy_input.currentText().strip(),
             "https_proxy": self.https_proxy_input.currentText().strip(),
             "ftp_proxy": self.ftp_proxy_input.currentText().strip(),
-            "no_proxy": self.no_proxy_input.currentText().strip()
-        }
-        self.save_profiles(profiles)
+            "no_proxy": self.no_proxy_input.currentText().strip(),
+            "downloads": merged
+        })
+        self.update_proxy_dropdowns()
         self.refresh_profiles()
         self.log(f"Profile '{name}' saved.")
 
     def load_profile(self, name):
-        profiles = self.load_profiles()
-        profile = profiles.get(name, {})
+        profile = self.store.get_profile(name) or {}
         self.http_proxy_input.setCurrentText(profile.get("http_proxy", ""))
         self.https_proxy_input.setCurrentText(profile.get("https_proxy", ""))
         self.ftp_proxy_input.setCurrentText(profile.get("ftp_proxy", ""))
         self.no_proxy_input.setCurrentText(profile.get("no_proxy", ""))
+        downloads = profile.get("downloads") or {}
+        for pm, fields in self.download_inputs.items():
+            for key, field in fields.items():
+                value = downloads.get(pm, {}).get(key, "")
+                field.setText(core.UNSET if value is None else str(value))
         self.log(f"Profile '{name}' loaded.")
 
 
@@ -180,7 +572,6 @@ class ProxyMaster(QMainWindow):
         self.profile_combo.setCurrentText("Default")
 
     def get_profile_name_dialog(self):
-        from PyQt6.QtWidgets import QInputDialog
         name, ok = QInputDialog.getText(self, "Save Profile", "Profile name:")
         return name, ok
 
@@ -189,8 +580,24 @@ class ProxyMaster(QMainWindow):
         super().__init__()
         self.setWindowTitle("ProxyMaster")
         self.setGeometry(100, 100, 500, 500)
-        self.init_ui()
+        self.log_requested.connect(self.append_log)
+        self.jobs = JobQueue(self)
+        self.jobs.log_message.connect(self.append_log)
+        self.jobs.job_started.connect(self.on_job_started)
+        self.jobs.job_progress.connect(self.on_job_progress)
+        self.jobs.job_finished.connect(self.on_job_finished)
+        self.jobs.start()
+        from store import get_store
+        self.store = get_store()
+        from probe import ProbeCache
+        self.probe_cache = ProbeCache(ttl=300)
+        with tracing.span("init_ui"):
+            self.init_ui()
+        with tracing.span("setup_state_watcher"):
+            self.setup_state_watcher()
         self.apply_theme("Light")
+        if tracing.enabled():
+            QTimer.singleShot(0, self.log_trace_summary)
 
     # (removed duplicate old init_ui)
 
@@ -200,282 +607,331 @@ class ProxyMaster(QMainWindow):
     def make_pm_remove_callback(self, pm):
         return lambda checked=False, p=pm: self.remove_package_manager_proxy(p)
 
-    def set_package_manager_proxy(self, pm):
-        http_proxy = self.http_proxy_input.currentText().strip()
-        https_proxy = self.https_proxy_input.currentText().strip()
-        ftp_proxy = self.ftp_proxy_input.currentText().strip()
-        no_proxy = self.no_proxy_input.currentText().strip()
-        try:
-            if pm == "apt":
-                apt_conf = "/etc/apt/apt.conf.d/99proxy"
-                lines = []
-                if http_proxy:
-                    lines.append(f'Acquire::http::Proxy "{http_proxy}";\n')
-                if https_proxy:
-                    lines.append(f'Acquire::https::Proxy "{https_proxy}";\n')
-                if ftp_proxy:
-                    lines.append(f'Acquire::ftp::Proxy "{ftp_proxy}";\n')
-                with open("/tmp/apt_proxy", "w") as f:
-                    f.writelines(lines)
-                import subprocess
-                cmd = ["pkexec", "cp", "/tmp/apt_proxy", apt_conf]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.log("apt proxy set successfully.")
-                else:
-                    self.log(f"Error setting apt proxy: {result.stderr}")
-            elif pm == "dnf":
-                dnf_conf = "/etc/dnf/dnf.conf"
-                import subprocess
-                with open(dnf_conf, "r") as f:
-                    lines = f.readlines()
-                new_lines = []
-                for line in lines:
-                    if not line.strip().startswith("proxy="):
-                        new_lines.append(line)
-                if http_proxy:
-                    new_lines.append(f'proxy={http_proxy}\n')
-                with open("/tmp/dnf_proxy", "w") as f:
-                    f.writelines(new_lines)
-                cmd = ["pkexec", "cp", "/tmp/dnf_proxy", dnf_conf]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.log("dnf proxy set successfully.")
-                else:
-                    self.log(f"Error setting dnf proxy: {result.stderr}")
-            elif pm == "pacman":
-                pacman_conf = "/etc/pacman.conf"
-                import subprocess
-                with open(pacman_conf, "r") as f:
-                    lines = f.readlines()
-                new_lines = []
-                for line in lines:
-                    if not line.strip().startswith("XferCommand = "):
-                        new_lines.append(line)
-                if http_proxy:
-                    new_lines.append(f'XferCommand = /usr/bin/curl -x {http_proxy} -L -C - -f %u > %o\n')
-                with open("/tmp/pacman_proxy", "w") as f:
-                    f.writelines(new_lines)
-                cmd = ["pkexec", "cp", "/tmp/pacman_proxy", pacman_conf]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.log("pacman proxy set successfully.")
-                else:
-                    self.log(f"Error setting pacman proxy: {result.stderr}")
-            elif pm == "zypper":
-                zypper_conf = "/etc/zypp/zypp.conf"
-                import subprocess
-                with open(zypper_conf, "r") as f:
-                    lines = f.readlines()
-                new_lines = []
-                for line in lines:
-                    if not line.strip().startswith("proxy=" ):
-                        new_lines.append(line)
-                if http_proxy:
-                    new_lines.append(f'proxy={http_proxy}\n')
-                with open("/tmp/zypper_proxy", "w") as f:
-                    f.writelines(new_lines)
-                cmd = ["pkexec", "cp", "/tmp/zypper_proxy", zypper_conf]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.log("zypper proxy set successfully.")
-                else:
-                    self.log(f"Error setting zypper proxy: {result.stderr}")
-        except Exception as e:
-            self.log(f"Error setting proxy for {pm}: {e}")
+    def get_proxy_inputs(self):
+        return (self.http_proxy_input.currentText().strip(),
+                self.https_proxy_input.currentText().strip(),
+                self.ftp_proxy_input.currentText().strip(),
+                self.no_proxy_input.currentText().strip())
 
-    def remove_package_manager_proxy(self, pm):
+    def get_env_vars(self):
+        return core.make_env_vars(*self.get_proxy_inputs())
+
+    def get_downloads(self):
+        settings = {pm: {key: field.text() for key, field in fields.items()}
+                    for pm, fields in self.download_inputs.items()}
         try:
-            if pm == "apt":
-                import subprocess
-                cmd = ["pkexec", "rm", "-f", "/etc/apt/apt.conf.d/99proxy"]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.log("apt proxy removed.")
-                else:
-                    self.log(f"Error removing apt proxy: {result.stderr}")
-            elif pm == "dnf":
-                dnf_conf = "/etc/dnf/dnf.conf"
-                import subprocess
-                with open(dnf_conf, "r") as f:
-                    lines = f.readlines()
-                new_lines = [line for line in lines if not line.strip().startswith("proxy=")]
-                with open("/tmp/dnf_proxy", "w") as f:
-                    f.writelines(new_lines)
-                cmd = ["pkexec", "cp", "/tmp/dnf_proxy", dnf_conf]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.log("dnf proxy removed.")
-                else:
-                    self.log(f"Error removing dnf proxy: {result.stderr}")
-            elif pm == "pacman":
-                pacman_conf = "/etc/pacman.conf"
-                import subprocess
-                with open(pacman_conf, "r") as f:
-                    lines = f.readlines()
-                new_lines = [line for line in lines if not line.strip().startswith("XferCommand = ")]
-                with open("/tmp/pacman_proxy", "w") as f:
-                    f.writelines(new_lines)
-                cmd = ["pkexec", "cp", "/tmp/pacman_proxy", pacman_conf]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.log("pacman proxy removed.")
-                else:
-                    self.log(f"Error removing pacman proxy: {result.stderr}")
-            elif pm == "zypper":
-                zypper_conf = "/etc/zypp/zypp.conf"
-                import subprocess
-                with open(zypper_conf, "r") as f:
-                    lines = f.readlines()
-                new_lines = [line for line in lines if not line.strip().startswith("proxy=")]
-                with open("/tmp/zypper_proxy", "w") as f:
-                    f.writelines(new_lines)
-                cmd = ["pkexec", "cp", "/tmp/zypper_proxy", zypper_conf]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    self.log("zypper proxy removed.")
-                else:
-                    self.log(f"Error removing zypper proxy: {result.stderr}")
-        except Exception as e:
-            self.log(f"Error removing proxy for {pm}: {e}")
+            return core.profile_downloads({"downloads": settings})
+        except ValueError as e:
+            self.log(f"Error: {e}")
+            return None
 
-    def detect_package_managers(self):
-        import shutil
-        pkgmanagers = {}
-        for pm in ["apt", "dnf", "pacman", "zypper"]:
-            pkgmanagers[pm] = shutil.which(pm) is not None
-        return pkgmanagers
+    def set_package_manager_proxy(self, pm):
+        env_vars = self.get_env_vars()
+        downloads = self.get_downloads()
+        if downloads is None:
+            return
+        self.submit_job(f"Set {pm} proxy",
+                        lambda job: core.set_package_manager_proxy(pm, env_vars, self.log, downloads))
+
+    def remove_package_manager_proxy(self, pm):
+        self.submit_job(f"Remove {pm} proxy", lambda job: core.remove_package_manager_proxy(pm, self.log))
 
     def save_proxy_settings(self):
-        import os
-        import subprocess
-        http_proxy = self.http_proxy_input.currentText().strip()
-        https_proxy = self.https_proxy_input.currentText().strip()
-        ftp_proxy = self.ftp_proxy_input.currentText().strip()
-        no_proxy = self.no_proxy_input.currentText().strip()
+        self.apply_proxy_settings(package_managers=[])
 
-        env_vars = {
-            "http_proxy": http_proxy,
-            "https_proxy": https_proxy,
-            "ftp_proxy": ftp_proxy,
-            "no_proxy": no_proxy
-        }
+    def apply_everywhere(self):
+        self.apply_proxy_settings(package_managers=[pm for pm, found in self.pkgmanagers.items() if found])
 
-        try:
-            with open("/etc/environment", "r") as f:
-                lines = f.readlines()
-            new_lines = []
-            for line in lines:
-                if not any(var in line for var in env_vars.keys()):
-                    new_lines.append(line)
-            for var, value in env_vars.items():
-                if value:
-                    new_lines.append(f'{var}="{value}"\n')
-            temp_env = "/tmp/proxymaster_env"
-            with open(temp_env, "w") as f:
-                f.writelines(new_lines)
-            cmd = ["pkexec", "cp", temp_env, "/etc/environment"]
-            self.log("Requesting admin password to update /etc/environment...")
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                self.log("/etc/environment updated successfully.")
-                # Add to proxy history if successful
-                self.add_to_proxy_history(http_proxy, https_proxy, ftp_proxy, no_proxy)
-            else:
-                self.log(f"Error: {result.stderr}")
-            os.remove(temp_env)
-        except Exception as e:
-            self.log(f"Error writing to /etc/environment: {e}")
+    def apply_proxy_settings(self, package_managers):
+        env_vars = self.get_env_vars()
+        name = "Apply everywhere" if package_managers else "Save proxy settings"
+        candidates = self.get_probe_candidates() if self.auto_pick_checkbox.isChecked() else None
+        downloads = self.get_downloads() if package_managers else {}
+        if downloads is None:
+            return
 
-        shell = os.environ.get("SHELL", "")
-        user_rc = os.path.expanduser("~/.bashrc")
-        if "zsh" in shell:
-            user_rc = os.path.expanduser("~/.zshrc")
+        def on_success(applied):
+            if applied:
+                self.http_proxy_input.setCurrentText(applied["http_proxy"])
+                self.https_proxy_input.setCurrentText(applied["https_proxy"])
+                # Add to proxy history if successful
+                self.add_to_proxy_history(applied["http_proxy"], applied["https_proxy"],
+                                          applied["ftp_proxy"], applied["no_proxy"])
+
+        self.submit_job(name, lambda job: self.run_apply_proxy_settings(job, env_vars, package_managers, candidates,
+                                                                        downloads),
+                        on_success)
+
+    def run_apply_proxy_settings(self, job, env_vars, package_managers, candidates=None, downloads=None):
+        if candidates:
+            self.pick_fastest_proxies(job, env_vars, candidates)
+            job.check_cancelled()
+        job.progress(0, 3, "Staging configuration files...")
+        transaction = core.stage_proxy_settings(env_vars, package_managers, self.log, downloads)
+        job.check_cancelled()
+        job.progress(1, 3)
+        env_updated = core.commit_proxy_settings(transaction, self.log)
+        job.progress(2, 3, "Updating user shell config...")
+        core.update_user_rc(env_vars, self.log)
+        job.progress(3, 3)
+        return env_vars if env_updated else None
+
+    def get_probe_candidates(self):
+        from probe import candidate_proxies
+        http_proxy, https_proxy, ftp_proxy, no_proxy = self.get_proxy_inputs()
+        current = {"http_proxy": [http_proxy], "https_proxy": [https_proxy]}
+        return candidate_proxies(current, {}) + candidate_proxies(self.load_proxy_history(), self.load_profiles())
+
+    def probe_all_proxies(self):
+        candidates = self.get_probe_candidates()
+        if not candidates:
+            self.log("No proxies in history or profiles to probe.")
+            return
+        self.submit_job("Probe proxies", lambda job: self.run_probe_proxies(job, candidates))
+
+    def run_probe_proxies(self, job, candidates):
+        from probe import probe_proxies, format_result
+        job.progress(0, 1, f"Probing {len(candidates)} proxies...")
+        results = probe_proxies(candidates, cache=self.probe_cache)
+        for result in results:
+            self.log(format_result(result))
+        job.progress(1, 1)
+        return results
+
+    def pick_fastest_proxies(self, job, env_vars, candidates):
+        from probe import probe_proxies, fastest
+        job.progress(0, 1, f"Probing {len(candidates)} proxies to pick the fastest...")
+        results = probe_proxies(candidates, cache=self.probe_cache)
+        for var, method in (("http_proxy", "GET"), ("https_proxy", "CONNECT")):
+            best = fastest(results, method)
+            if best is None:
+                self.log(f"No live proxy found for {var}, keeping '{env_vars[var]}'.")
+                continue
+            env_vars[var] = best["proxy"]
+            self.log(f"Fastest {var}: {best['proxy']} ({best['first_byte_ms']:.0f} ms)")
+
+    def set_shell_integration(self, enabled):
+        if enabled:
+            self.submit_job("Install shell integration", lambda job: core.install_shell_integration(log=self.log),
+                            lambda result: self.sync_state_targets())
+        else:
+            self.submit_job("Remove shell integration", lambda job: core.uninstall_shell_integration(self.log),
+                            lambda result: self.sync_state_targets())
+
+    def set_forwarder(self, enabled):
+        # The daemon forwards to the http_proxy and https_proxy entered above, in that order; point the
+        # system at http://127.0.0.1:3128 to route every tool through it
+        if not enabled:
+            self.stop_forwarder()
+            return
+        from forwarder import BackgroundForwarder, ForwardingProxy
+        http_proxy, https_proxy, ftp_proxy, no_proxy = self.get_proxy_inputs()
+        try:
+            proxy = ForwardingProxy([url for url in (http_proxy, https_proxy) if url], no_proxy)
+            self.forwarder = BackgroundForwarder(proxy)
+            self.forwarder.start()
+        except (OSError, ValueError) as e:
+            self.forwarder = None
+            self.log(f"Error: could not start the forwarding proxy: {e}")
+            self.forwarder_checkbox.setChecked(False)
+            return
+        self.log(f"Forwarding proxy listening on {proxy.url}.")
+        self.forwarder_timer.start()
+        self.update_forwarder_stats()
+
+    def stop_forwarder(self):
+        self.forwarder_timer.stop()
+        if self.forwarder is not None:
+            self.forwarder.stop()
+            self.forwarder = None
+            self.log("Forwarding proxy stopped.")
+        self.forwarder_label.setText("")
+
+    def update_forwarder_stats(self):
+        if self.forwarder is None:
+            return
+        from forwarder import format_stats
         try:
-            with open(user_rc, "r") as f:
-                lines = f.readlines()
-            new_lines = []
-            for line in lines:
-                if not any(var in line for var in env_vars.keys()):
-                    new_lines.append(line)
-            for var, value in env_vars.items():
-                if value:
-                    new_lines.append(f'export {var}="{value}"\n')
-            with open(user_rc, "w") as f:
-                f.writelines(new_lines)
-            self.log("User shell config updated.")
+            lines = format_stats(self.forwarder.stats())
         except Exception as e:
-            self.log(f"Error writing to {user_rc}: {e}")
+            lines = [f"Forwarding proxy not responding: {e}"]
+        self.forwarder_label.setText("\n".join(lines))
 
-    def toggle_proxy(self):
-        import os
+    def launch_with_profile(self):
+        # Starts one command with a profile's proxy environment; nothing is written and no prompt is shown
+        import launcher
+        import shlex
+        import subprocess
+        names = sorted(self.load_profiles())
+        name, ok = QInputDialog.getItem(self, "Launch with Profile", "Profile:", names, 0, False)
+        if not ok or not name:
+            return
+        command, ok = QInputDialog.getText(self, "Launch with Profile", "Command:")
+        if not ok or not command.strip():
+            return
+        try:
+            argv = shlex.split(command)
+        except ValueError as e:
+            self.log(f"Error: invalid command: {e}")
+            return
+        env = launcher.profile_environ(self.store.get_profile(name) or {})
         try:
-            with open("/etc/environment", "r") as f:
-                lines = f.readlines()
-            enabled = any(line.startswith("http_proxy=") or line.startswith("https_proxy=") for line in lines)
-        except Exception:
-            enabled = False
+            process = subprocess.Popen(argv, env=env, stdin=subprocess.DEVNULL, start_new_session=True)
+        except OSError as e:
+            self.log(f"Error: could not launch {argv[0]}: {e.strerror}")
+            return
+        self.log(f"Launched \"{command}\" with profile '{name}' (pid {process.pid}).")
 
-        if enabled:
-            try:
-                new_lines = [line for line in lines if not (line.startswith("http_proxy=") or line.startswith("https_proxy=") or line.startswith("ftp_proxy=") or line.startswith("no_proxy="))]
-                with open("/etc/environment", "w") as f:
-                    f.writelines(new_lines)
-            except Exception as e:
-                print(f"Error disabling proxy in /etc/environment: {e}")
+    def test_url(self):
+        from noproxy import proxy_for_url, format_evaluation
+        url = self.test_url_input.text().strip()
+        if url:
+            self.log(format_evaluation(url, proxy_for_url(url, self.get_env_vars())))
 
-            shell = os.environ.get("SHELL", "")
-            user_rc = os.path.expanduser("~/.bashrc")
-            if "zsh" in shell:
-                user_rc = os.path.expanduser("~/.zshrc")
-            try:
-                with open(user_rc, "r") as f:
-                    lines = f.readlines()
-                new_lines = [line for line in lines if not (line.startswith("export http_proxy=") or line.startswith("export https_proxy=") or line.startswith("export ftp_proxy=") or line.startswith("export no_proxy="))]
-                with open(user_rc, "w") as f:
-                    f.writelines(new_lines)
-            except Exception as e:
-                print(f"Error disabling proxy in {user_rc}: {e}")
-            self.status_label.setText("Proxy Status: OFF")
+    def test_url_list(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Test URL List", "", "Text files (*.txt);;All files (*)")
+        if not path:
+            return
+        env_vars = self.get_env_vars()
+        self.submit_job("Test URL list", lambda job: self.run_test_url_list(job, path, env_vars))
+
+    def run_test_url_list(self, job, path, env_vars):
+        from noproxy import evaluate_urls, format_evaluation
+        with open(path, "r") as f:
+            urls = [line.strip() for line in f if line.strip()]
+        results = evaluate_urls(urls, env_vars)
+        direct = sum(1 for url, proxy in results if proxy is None)
+        for url, proxy in results:
+            self.log(format_evaluation(url, proxy))
+        self.log(f"{len(results)} URLs tested: {len(results) - direct} via proxy, {direct} direct.")
+        return results
+
+    def setup_state_watcher(self):
+        from watcher import ProxyState, create_watcher
+        self.proxy_state = ProxyState()
+        self.state_watcher = create_watcher(self.proxy_state.paths())
+        self.pending_state_changes = set()
+        # Bursts of events (e.g. several files written by one transaction) are coalesced
+        self.state_refresh_timer = QTimer(self)
+        self.state_refresh_timer.setSingleShot(True)
+        self.state_refresh_timer.setInterval(200)
+        self.state_refresh_timer.timeout.connect(self.refresh_proxy_state)
+        fd = self.state_watcher.fileno()
+        if fd is not None:
+            self.state_notifier = QSocketNotifier(fd, QSocketNotifier.Type.Read, self)
+            self.state_notifier.activated.connect(self.on_state_files_changed)
         else:
-            http_proxy = self.http_proxy_input.currentText().strip()
-            https_proxy = self.https_proxy_input.currentText().strip()
-            ftp_proxy = self.ftp_proxy_input.currentText().strip()
-            no_proxy = self.no_proxy_input.currentText().strip()
-            env_vars = {
-                "http_proxy": http_proxy,
-                "https_proxy": https_proxy,
-                "ftp_proxy": ftp_proxy,
-                "no_proxy": no_proxy
-            }
-            try:
-                with open("/etc/environment", "r") as f:
-                    lines = f.readlines()
-                new_lines = [line for line in lines if not any(var in line for var in env_vars.keys())]
-                for var, value in env_vars.items():
-                    if value:
-                        new_lines.append(f'{var}="{value}"\n')
-                with open("/etc/environment", "w") as f:
-                    f.writelines(new_lines)
-            except Exception as e:
-                print(f"Error enabling proxy in /etc/environment: {e}")
+            self.state_poll_timer = QTimer(self)
+            self.state_poll_timer.setInterval(2000)
+            self.state_poll_timer.timeout.connect(self.on_state_files_changed)
+            self.state_poll_timer.start()
+        self.update_status_display()
+
+    def set_auto_switch(self, enabled):
+        from netrules import ProfileSwitcher, create_network_watcher
+        self.stop_auto_switch()
+        if not enabled:
+            return
+        try:
+            self.profile_switcher = ProfileSwitcher(self.store.get_rules(), self.store.get_profile)
+        except ValueError as e:
+            self.log(f"Error in network rules: {e}")
+            self.auto_switch_checkbox.setChecked(False)
+            return
+        if not len(self.profile_switcher.ruleset):
+            self.log("Warning: no network rules configured (see ~/.proxymaster_rules.json).")
+            self.auto_switch_checkbox.setChecked(False)
+            return
+        self.network_watcher = create_network_watcher()
+        # Netlink sends a burst of messages per change; evaluate once it settles
+        self.network_check_timer = QTimer(self)
+        self.network_check_timer.setSingleShot(True)
+        self.network_check_timer.setInterval(50)
+        self.network_check_timer.timeout.connect(self.check_network_rules)
+        self.network_notifier = self.network_poll_timer = None
+        fd = self.network_watcher.fileno()
+        if fd is not None:
+            self.network_notifier = QSocketNotifier(fd, QSocketNotifier.Type.Read, self)
+            self.network_notifier.activated.connect(self.on_network_changed)
+        else:
+            self.network_poll_timer = QTimer(self)
+            self.network_poll_timer.setInterval(2000)
+            self.network_poll_timer.timeout.connect(self.on_network_changed)
+            self.network_poll_timer.start()
+        self.check_network_rules()
+
+    def stop_auto_switch(self):
+        if getattr(self, "network_watcher", None) is None:
+            return
+        if self.network_notifier is not None:
+            self.network_notifier.setEnabled(False)
+            self.network_notifier.deleteLater()
+        if self.network_poll_timer is not None:
+            self.network_poll_timer.stop()
+        self.network_check_timer.stop()
+        self.network_watcher.close()
+        self.network_watcher = self.network_notifier = self.network_poll_timer = None
+
+    def on_network_changed(self, *args):
+        if self.network_watcher.read_changes():
+            self.network_check_timer.start()
+
+    def check_network_rules(self):
+        name, facts, changed = self.profile_switcher.check()
+        if not changed:
+            return
+        if name is None:
+            self.log(f"Network changed ({facts.describe()}): no rule matched, settings left as they are.")
+            return
+        self.log(f"Network changed ({facts.describe()}): switching to profile '{name}'.")
+        self.load_profile(name)
+        package_managers = [pm for pm, found in self.pkgmanagers.items() if found]
+        switcher = self.profile_switcher
+        self.submit_job(f"Switch to profile {name}", lambda job: switcher.apply(name, package_managers, self.log))
+
+    def on_state_files_changed(self, *args):
+        changes = self.state_watcher.read_changes()
+        if changes:
+            self.pending_state_changes |= changes
+            self.state_refresh_timer.start()
+
+    def refresh_proxy_state(self):
+        paths, self.pending_state_changes = self.pending_state_changes, set()
+        # Shell integration may have been toggled from the CLI: its rc file changes when it is
+        if self.sync_state_targets():
+            return
+        if self.proxy_state.refresh(paths):
+            self.update_status_display()
+
+    def sync_state_targets(self):
+        # Re-points the watcher when the files that make up the proxy state changed
+        if not self.proxy_state.update_targets():
+            return False
+        self.state_watcher.set_paths(self.proxy_state.paths())
+        self.proxy_state.refresh()
+        self.update_status_display()
+        return True
+
+    def update_status_display(self):
+        state = self.proxy_state.snapshot()
+        self.status_label.setText(f"Proxy Status: {'ON' if state['enabled'] else 'OFF'}")
+        for pm, label in self.pkgmanager_labels.items():
+            found = "Found" if self.pkgmanagers.get(pm, False) else "Not Found"
+            proxy = " (proxy set)" if state["package_managers"][pm] else ""
+            label.setText(f"{pm}: {found}{proxy}")
 
-            shell = os.environ.get("SHELL", "")
-            user_rc = os.path.expanduser("~/.bashrc")
-            if "zsh" in shell:
-                user_rc = os.path.expanduser("~/.zshrc")
-            try:
-                with open(user_rc, "r") as f:
-                    lines = f.readlines()
-                new_lines = [line for line in lines if not any(var in line for var in env_vars.keys())]
-                for var, value in env_vars.items():
-                    if value:
-                        new_lines.append(f'export {var}="{value}"\n')
-                with open(user_rc, "w") as f:
-                    f.writelines(new_lines)
-            except Exception as e:
-                print(f"Error enabling proxy in {user_rc}: {e}")
-            self.status_label.setText("Proxy Status: ON")
+    def toggle_proxy(self):
+        env_vars = self.get_env_vars()
+        enabled = self.proxy_state.enabled
+        self.submit_job("Toggle proxy", lambda job: self.run_toggle_proxy(job, env_vars, enabled),
+                        lambda status: self.status_label.setText(f"Proxy Status: {status}"))
+
+    def run_toggle_proxy(self, job, env_vars, enabled):
+        if enabled:
+            core.disable_proxy(self.log)
+            return "OFF"
+        core.apply_proxy_settings(env_vars, log=self.log)
+        return "ON"
 
     def apply_theme(self, theme):
         palette = QPalette()
@@ -497,7 +953,8 @@ class ProxyMaster(QMainWindow):
 if __name__ == "__main__":
     print("ProxyMaster starting...")
     app = QApplication(sys.argv)
-    window = ProxyMaster()
-    window.show()
+    with tracing.span("ProxyMaster startup"):
+        window = ProxyMaster()
+        window.show()
     print("ProxyMaster window should be visible now.")
     sys.exit(app.exec())
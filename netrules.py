@@ -0,0 +1,287 @@
+import socket
+import struct
+from fnmatch import fnmatchcase
+
+from noproxy import parse_ip, parse_network
+
+# Network-aware profile switching. Rules map facts about the current network to a profile name:
+#   {"profile": "Office", "gateway": "10.20.0.0/16", "interface": "en*", "search_domain": "corp.example",
+#    "resolves": "intranet.corp.example"}
+# Every condition present must hold (each may also be a list, meaning any of); the first matching
+# rule wins, and a rule with no conditions is a catch-all. Rules are compiled once into predicate
+# lists ordered cheapest first, so DNS lookups only happen when everything else already matched.
+
+ROUTE_PATH = "/proc/net/route"
+RESOLV_PATH = "/etc/resolv.conf"
+RULE_KEYS = ("gateway", "interface", "search_domain", "resolves")
+RTF_UP = 0x0001
+RTF_GATEWAY = 0x0002
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+NETLINK_GROUPS = RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE
+
+
+def read_default_route(route_path=ROUTE_PATH):
+    # (gateway, interface) of the best IPv4 default route, from /proc/net/route or a file in its format
+    best = None
+    try:
+        with open(route_path, "r") as f:
+            next(f, None)
+            for line in f:
+                fields = line.split()
+                if len(fields) < 8 or fields[1] != "00000000" or fields[7] != "00000000":
+                    continue
+                flags, metric = int(fields[3], 16), int(fields[6])
+                if not flags & RTF_UP:
+                    continue
+                gateway = socket.inet_ntoa(struct.pack("<I", int(fields[2], 16))) if flags & RTF_GATEWAY else None
+                if best is None or metric < best[0]:
+                    best = (metric, gateway, fields[0])
+    except OSError:
+        return None, None
+    return (best[1], best[2]) if best else (None, None)
+
+
+def read_search_domains(resolv_path=RESOLV_PATH):
+    domains = []
+    try:
+        with open(resolv_path, "r") as f:
+            for line in f:
+                fields = line.split()
+                if fields and fields[0] in ("search", "domain"):
+                    domains.extend(domain.rstrip(".").lower() for domain in fields[1:])
+    except OSError:
+        pass
+    return domains
+
+
+class NetworkFacts:
+    def __init__(self, gateway=None, interface=None, search_domains=(), resolver=None):
+        self.gateway = gateway
+        self.interface = interface
+        self.search_domains = list(search_domains)
+        self.resolver = resolver
+        self.resolved = {}
+
+    def resolves(self, host):
+        if host not in self.resolved:
+            self.resolved[host] = (self.resolver or default_resolver)(host)
+        return self.resolved[host]
+
+    def key(self):
+        return (self.gateway, self.interface, tuple(self.search_domains))
+
+    def describe(self):
+        search = ",".join(self.search_domains) or "-"
+        return f"gateway={self.gateway or '-'} interface={self.interface or '-'} search={search}"
+
+
+def default_resolver(host):
+    try:
+        socket.getaddrinfo(host, None)
+        return True
+    except OSError:
+        return False
+
+
+def read_facts(route_path=ROUTE_PATH, resolv_path=RESOLV_PATH, resolver=None):
+    gateway, interface = read_default_route(route_path)
+    return NetworkFacts(gateway, interface, read_search_domains(resolv_path), resolver)
+
+
+def as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def compile_gateway(values):
+    networks = []
+    for value in as_list(values):
+        network = parse_network(value.strip())
+        if network is None:
+            raise ValueError(f"invalid gateway address or network: {value!r}")
+        networks.append(network)
+
+    def check(facts):
+        address = parse_ip(facts.gateway) if facts.gateway else None
+        if address is None:
+            return False
+        version, value = address
+        return any(version == v and first <= value <= last for v, first, last in networks)
+    return check
+
+
+def compile_interface(values):
+    patterns = as_list(values)
+    return lambda facts: facts.interface is not None and any(fnmatchcase(facts.interface, p) for p in patterns)
+
+
+def compile_search_domain(values):
+    wanted = [value.strip(".").lower() for value in as_list(values)]
+    return lambda facts: any(domain == w or domain.endswith("." + w) for domain in facts.search_domains for w in wanted)
+
+
+def compile_resolves(values):
+    hosts = as_list(values)
+    return lambda facts: any(facts.resolves(host) for host in hosts)
+
+
+COMPILERS = {
+    "gateway": compile_gateway,
+    "interface": compile_interface,
+    "search_domain": compile_search_domain,
+    "resolves": compile_resolves,
+}
+
+
+class RuleSet:
+    def __init__(self, rules):
+        self.rules = []
+        for i, spec in enumerate(rules):
+            if not isinstance(spec, dict) or not spec.get("profile"):
+                raise ValueError(f"rule {i + 1}: a profile name is required")
+            unknown = set(spec) - set(RULE_KEYS) - {"profile"}
+            if unknown:
+                raise ValueError(f"rule {i + 1}: unknown condition(s): {', '.join(sorted(unknown))}")
+            # RULE_KEYS is ordered cheapest first
+            checks = [COMPILERS[key](spec[key]) for key in RULE_KEYS if key in spec]
+            self.rules.append((spec["profile"], checks))
+
+    def __len__(self):
+        return len(self.rules)
+
+    def evaluate(self, facts):
+        for profile, checks in self.rules:
+            if all(check(facts) for check in checks):
+                return profile
+        return None
+
+
+def compile_rules(rules):
+    return RuleSet(rules)
+
+
+class NetlinkWatcher:
+    # rtnetlink multicast groups: the socket becomes readable on link, address and route changes
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            self.sock.bind((0, NETLINK_GROUPS))
+            self.sock.setblocking(False)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def read_changes(self):
+        changed = False
+        while True:
+            try:
+                if not self.sock.recv(65536):
+                    break
+            except (BlockingIOError, InterruptedError):
+                break
+            changed = True
+        return changed
+
+    def close(self):
+        self.sock.close()
+
+
+class RoutePoller:
+    # Fallback (and fake route tables in tests): reports a change when the watched files' content differs
+    def __init__(self, paths=(ROUTE_PATH, RESOLV_PATH)):
+        self.paths = list(paths)
+        self.contents = [self.read(path) for path in self.paths]
+
+    def read(self, path):
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def fileno(self):
+        return None
+
+    def read_changes(self):
+        contents = [self.read(path) for path in self.paths]
+        changed = contents != self.contents
+        self.contents = contents
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_network_watcher(route_path=ROUTE_PATH, resolv_path=RESOLV_PATH):
+    if route_path == ROUTE_PATH and hasattr(socket, "AF_NETLINK"):
+        try:
+            return NetlinkWatcher()
+        except OSError:
+            pass
+    return RoutePoller([route_path, resolv_path])
+
+
+class ProfileSwitcher:
+    # Evaluates the rules for the current facts and applies the matching profile through core's planned,
+    # no-op-aware apply: when the profile is already in place nothing is written and pkexec is not run.
+    def __init__(self, rules, get_profile, route_path=ROUTE_PATH, resolv_path=RESOLV_PATH, resolver=None):
+        self.ruleset = compile_rules(rules)
+        self.get_profile = get_profile
+        self.route_path = route_path
+        self.resolv_path = resolv_path
+        self.resolver = resolver
+        self.facts = None
+        self.active = None
+
+    def check(self):
+        # Returns (profile name or None, facts, changed); rules are only re-evaluated when the facts changed
+        facts = read_facts(self.route_path, self.resolv_path, self.resolver)
+        if self.facts is not None and facts.key() == self.facts.key():
+            return self.active, self.facts, False
+        self.facts = facts
+        self.active = self.ruleset.evaluate(facts)
+        return self.active, facts, True
+
+    def apply(self, name, package_managers=(), log=print):
+        import core
+        profile = self.get_profile(name)
+        if profile is None:
+            log(f"Error: rule matched unknown profile '{name}'.")
+            return False
+        env_vars = core.profile_env_vars(profile)
+        core.apply_proxy_settings(env_vars, package_managers, log, downloads=core.profile_downloads(profile))
+        return True
+
+
+def wait_for_change(watcher, timeout=None, settle=0.05, poll=1.0):
+    # Blocks until the watcher reports a change, then keeps draining for `settle` seconds so a burst of
+    # netlink messages (link up, address, routes) results in a single evaluation
+    import select
+    import time
+    deadline = None if timeout is None else time.monotonic() + timeout
+    fd = watcher.fileno()
+    while True:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if fd is not None:
+            ready, _, _ = select.select([fd], [], [], remaining)
+            changed = bool(ready) and watcher.read_changes()
+        else:
+            time.sleep(min(poll, remaining) if remaining is not None else poll)
+            changed = watcher.read_changes()
+        if changed:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+    settle_until = time.monotonic() + settle
+    while fd is not None and time.monotonic() < settle_until:
+        ready, _, _ = select.select([fd], [], [], max(0.0, settle_until - time.monotonic()))
+        if ready:
+            watcher.read_changes()
+    return True
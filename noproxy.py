@@ -0,0 +1,184 @@
+import socket
+from bisect import bisect_right
+
+DEFAULT_PORTS = {"http": 80, "https": 443, "ftp": 21}
+ANY_PORT = True
+
+
+class IntervalTable:
+    # Sorted, merged [start, end] integer ranges; lookups are a single bisect
+    def __init__(self, ranges):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, end in merged]
+        self.ends = [end for start, end in merged]
+
+    def __contains__(self, value):
+        i = bisect_right(self.starts, value) - 1
+        return i >= 0 and value <= self.ends[i]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def split_port(entry):
+    if entry.startswith("["):
+        host, _, rest = entry[1:].partition("]")
+        port = rest[1:] if rest.startswith(":") else ""
+        return host, int(port) if port.isdigit() else None
+    if entry.count(":") == 1:
+        host, _, port = entry.partition(":")
+        if port.isdigit():
+            return host, int(port)
+    return entry, None
+
+
+def parse_ip(host):
+    # Cheap pre-checks keep hostname lookups off the (slow) exception path
+    if ":" in host:
+        family, version = socket.AF_INET6, 6
+    elif host and host[-1].isdigit() and host.replace(".", "").isdigit():
+        family, version = socket.AF_INET, 4
+    else:
+        return None
+    try:
+        return version, int.from_bytes(socket.inet_pton(family, host), "big")
+    except OSError:
+        return None
+
+
+def parse_network(host):
+    address, _, prefix = host.partition("/")
+    parsed = parse_ip(address)
+    if parsed is None:
+        return None
+    version, value = parsed
+    bits = 32 if version == 4 else 128
+    length = int(prefix) if prefix.isdigit() else bits
+    if length > bits:
+        return None
+    host_bits = bits - length
+    first = (value >> host_bits) << host_bits
+    return version, first, first + (1 << host_bits) - 1
+
+
+def split_url(url):
+    # Minimal authority parser: urllib.parse is several times slower for hot-path lookups
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        scheme, rest = "http", url
+    scheme = scheme.lower()
+    for delimiter in "/?#":
+        rest = rest.split(delimiter, 1)[0]
+    host = rest.rpartition("@")[2]
+    port = None
+    if host.startswith("["):
+        host, _, tail = host[1:].partition("]")
+        if tail.startswith(":") and tail[1:].isdigit():
+            port = int(tail[1:])
+    elif host.count(":") == 1:
+        host, _, tail = host.partition(":")
+        if tail.isdigit():
+            port = int(tail)
+    return scheme, host, port or DEFAULT_PORTS.get(scheme)
+
+
+class NoProxyMatcher:
+    def __init__(self, no_proxy):
+        self.match_all = False
+        self.trie = {}
+        ranges = {4: {}, 6: {}}
+        for raw in no_proxy.replace(";", ",").split(","):
+            entry = raw.strip().lower()
+            if not entry:
+                continue
+            if entry == "*":
+                self.match_all = True
+                continue
+            host, port = split_port(entry)
+            network = parse_network(host)
+            if network is not None:
+                version, first, last = network
+                ranges[version].setdefault(port, []).append((first, last))
+            else:
+                self.add_domain(host.lstrip("*").strip("."), port)
+        self.ip_tables = {version: {port: IntervalTable(r) for port, r in tables.items()}
+                          for version, tables in ranges.items()}
+
+    def add_domain(self, domain, port):
+        if not domain:
+            return
+        node = self.trie
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        ports = node.get(None)
+        if port is None or ports is ANY_PORT:
+            node[None] = ANY_PORT
+        else:
+            node.setdefault(None, set()).add(port)
+
+    def bypass_host(self, host, port=None):
+        if self.match_all:
+            return True
+        host = host.strip("[]").rstrip(".").lower()
+        address = parse_ip(host)
+        if address is not None:
+            version, value = address
+            tables = self.ip_tables[version]
+            table = tables.get(None)
+            if table is not None and value in table:
+                return True
+            table = tables.get(port)
+            return port is not None and table is not None and value in table
+        # Walk the reversed labels; any terminal node on the way is a matching suffix
+        node = self.trie
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return False
+            ports = node.get(None)
+            if ports is ANY_PORT or (ports is not None and port in ports):
+                return True
+        return False
+
+    def bypass_url(self, url):
+        scheme, host, port = split_url(url)
+        return self.bypass_host(host, port)
+
+
+_cache = {}
+
+
+def compile_no_proxy(no_proxy):
+    matcher = _cache.get(no_proxy)
+    if matcher is None:
+        if len(_cache) >= 8:
+            _cache.clear()
+        matcher = _cache[no_proxy] = NoProxyMatcher(no_proxy)
+    return matcher
+
+
+def proxy_for_url(url, env_vars):
+    # Returns the proxy the URL would go through, or None when it connects directly
+    scheme, host, port = split_url(url)
+    proxy = env_vars.get(f"{scheme}_proxy") or None
+    if proxy is None:
+        return None
+    if compile_no_proxy(env_vars.get("no_proxy", "")).bypass_host(host, port):
+        return None
+    return proxy
+
+
+def evaluate_urls(urls, env_vars):
+    return [(url, proxy_for_url(url, env_vars)) for url in urls]
+
+
+def format_evaluation(url, proxy):
+    if proxy is None:
+        return f"{url}: DIRECT (no proxy)"
+    return f"{url}: via {proxy}"
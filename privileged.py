@@ -0,0 +1,140 @@
+import json
+import os
+import sys
+
+# Runs as a pkexec helper: `pkexec python3 privileged.py manifest.json` applies every
+# staged write/remove in one process so the user only sees a single polkit prompt.
+HELPER_PATH = os.path.abspath(__file__)
+
+
+class PrivilegedTransaction:
+    def __init__(self):
+        self.ops = []
+        self.unchanged = []
+        self.staging_dir = None
+
+    def _get_staging_dir(self):
+        if self.staging_dir is None:
+            import tempfile
+            self.staging_dir = tempfile.mkdtemp(prefix="proxymaster-")
+        return self.staging_dir
+
+    def write(self, target, content, label=None, mode=None):
+        staged = os.path.join(self._get_staging_dir(), f"{len(self.ops)}.staged")
+        with open(staged, "w") as f:
+            f.write(content)
+        self.ops.append({"action": "write", "source": staged, "target": target, "label": label or target, "mode": mode})
+
+    def remove(self, target, label=None):
+        self.ops.append({"action": "remove", "target": target, "label": label or target})
+
+    def skip(self, target, label=None):
+        # Target is already in the desired state: reported back by commit() without pkexec
+        self.unchanged.append({"target": target, "action": "none", "ok": True, "changed": False, "error": "",
+                               "label": label or target})
+
+    def commit(self):
+        unchanged, self.unchanged = self.unchanged, []
+        if not self.ops:
+            return unchanged
+        return self._run_helper() + unchanged
+
+    def _run_helper(self):
+        import shutil
+        import subprocess
+        import tracing
+        manifest = os.path.join(self._get_staging_dir(), "manifest.json")
+        try:
+            with open(manifest, "w") as f:
+                json.dump(self.ops, f)
+            cmd = ["pkexec", sys.executable, HELPER_PATH, manifest]
+            # Includes the time the user spends in the polkit prompt
+            try:
+                with tracing.span("pkexec helper", "privileged", targets=[op["target"] for op in self.ops]):
+                    result = subprocess.run(cmd, capture_output=True, text=True)
+            except OSError as e:
+                # pkexec missing or not executable: every op fails, but callers still get per-target results
+                results = []
+                error = f"could not run pkexec: {e.strerror or e}"
+            else:
+                results = parse_results(result.stdout)
+                error = result.stderr.strip() or f"pkexec exited with status {result.returncode}"
+            reported = {r["target"] for r in results}
+            for op in self.ops:
+                if op["target"] not in reported:
+                    results.append({"target": op["target"], "action": op["action"], "ok": False, "error": error})
+            labels = {op["target"]: op["label"] for op in self.ops}
+            for r in results:
+                r["label"] = labels.get(r["target"], r["target"])
+                r.setdefault("changed", False)
+            return results
+        finally:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self.staging_dir = None
+            self.ops = []
+
+
+def parse_results(output):
+    results = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        try:
+            results.append(json.loads(line))
+        except ValueError:
+            continue
+    return results
+
+
+def up_to_date(op):
+    # Targets the user cannot read (e.g. in /etc/sudoers.d) are staged without knowing their state
+    try:
+        with open(op["target"], "r") as current, open(op["source"], "r") as staged:
+            if current.read() != staged.read():
+                return False
+        return op.get("mode") is None or os.stat(op["target"]).st_mode & 0o7777 == op["mode"]
+    except OSError:
+        return False
+
+
+def apply_op(op):
+    # Returns True when the target was changed
+    import shutil
+    from rewrite import AtomicFile
+    if op["action"] == "write":
+        if up_to_date(op):
+            return False
+        # Temp file next to the target + fsync + rename: a crash never leaves a truncated system file,
+        # and the original owner and mode are kept unless the op sets one
+        with open(op["source"], "r") as source, AtomicFile(op["target"], op.get("mode")) as target:
+            shutil.copyfileobj(source, target)
+        return True
+    if op["action"] == "remove":
+        if not os.path.lexists(op["target"]):
+            return False
+        os.remove(op["target"])
+        return True
+    raise ValueError(f"unknown action {op['action']!r}")
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("usage: privileged.py MANIFEST", file=sys.stderr)
+        return 2
+    with open(argv[1], "r") as f:
+        ops = json.load(f)
+    failed = False
+    for op in ops:
+        try:
+            changed = apply_op(op)
+            result = {"target": op["target"], "action": op["action"], "ok": True, "changed": changed, "error": ""}
+        except Exception as e:
+            failed = True
+            result = {"target": op["target"], "action": op["action"], "ok": False, "changed": False, "error": str(e)}
+        print(json.dumps(result), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
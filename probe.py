@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+DEFAULT_HTTP_TARGET = "http://example.com/"
+DEFAULT_HTTPS_TARGET = "https://example.com/"
+
+
+def parse_proxy_url(proxy):
+    from urllib.parse import urlsplit
+    if "://" not in proxy:
+        proxy = "http://" + proxy
+    parts = urlsplit(proxy)
+    if not parts.hostname:
+        raise ValueError(f"invalid proxy URL: {proxy!r}")
+    port = parts.port or (443 if parts.scheme == "https" else 8080)
+    auth = None
+    if parts.username:
+        import base64
+        from urllib.parse import unquote
+        credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+        auth = base64.b64encode(credentials.encode()).decode()
+    return parts.hostname, port, auth
+
+
+def build_request(method, target, auth):
+    from urllib.parse import urlsplit
+    parts = urlsplit(target)
+    if method == "CONNECT":
+        authority = f"{parts.hostname}:{parts.port or 443}"
+        lines = [f"CONNECT {authority} HTTP/1.1", f"Host: {authority}"]
+    else:
+        lines = [f"GET {target} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close"]
+    if auth:
+        lines.append(f"Proxy-Authorization: Basic {auth}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+async def probe_proxy(proxy, method="GET", target=None, timeout=5.0):
+    if target is None:
+        target = DEFAULT_HTTPS_TARGET if method == "CONNECT" else DEFAULT_HTTP_TARGET
+    result = {"proxy": proxy, "method": method, "ok": False, "status": None,
+              "connect_ms": None, "first_byte_ms": None, "error": "", "checked_at": time.time()}
+    writer = None
+    start = time.monotonic()
+    try:
+        host, port, auth = parse_proxy_url(proxy)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        result["connect_ms"] = (time.monotonic() - start) * 1000
+        writer.write(build_request(method, target, auth))
+        await writer.drain()
+        remaining = max(timeout - (time.monotonic() - start), 0.001)
+        status_line = await asyncio.wait_for(reader.readline(), remaining)
+        result["first_byte_ms"] = (time.monotonic() - start) * 1000
+        fields = status_line.decode("latin-1").split()
+        if len(fields) < 2 or not fields[0].startswith("HTTP/") or not fields[1].isdigit():
+            result["error"] = "invalid response from proxy"
+        else:
+            result["status"] = int(fields[1])
+            result["ok"] = result["status"] < 400
+            if not result["ok"]:
+                result["error"] = " ".join(fields[1:])
+    except asyncio.TimeoutError:
+        result["error"] = "timed out"
+    except (OSError, ValueError) as e:
+        result["error"] = str(e) or e.__class__.__name__
+    finally:
+        if writer is not None:
+            writer.close()
+    return result
+
+
+class ProbeCache:
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self.entries = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["checked_at"] > self.ttl:
+            del self.entries[key]
+            return None
+        return entry
+
+    def put(self, key, result):
+        self.entries[key] = result
+
+    def clear(self):
+        self.entries.clear()
+
+
+async def probe_many(candidates, target=None, timeout=5.0, concurrency=64, cache=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+    pending = []
+    for proxy, method in dict.fromkeys(candidates):
+        key = (proxy, method, target)
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending.append(key)
+
+    async def run(key):
+        async with semaphore:
+            return key, await probe_proxy(key[0], key[1], key[2], timeout)
+
+    for key, result in await asyncio.gather(*(run(key) for key in pending)):
+        results[key] = result
+        if cache is not None:
+            cache.put(key, result)
+    return sorted(results.values(), key=rank_key)
+
+
+def probe_proxies(candidates, target=None, timeout=5.0, concurrency=64, cache=None):
+    import tracing
+    with tracing.span("probe proxies", "network", candidates=len(candidates)):
+        return asyncio.run(probe_many(candidates, target, timeout, concurrency, cache))
+
+
+def rank_key(result):
+    if not result["ok"]:
+        return (1, float("inf"))
+    return (0, result["first_byte_ms"])
+
+
+def fastest(results, method=None):
+    live = [r for r in results if r["ok"] and (method is None or r["method"] == method)]
+    if not live:
+        return None
+    return min(live, key=rank_key)
+
+
+def candidate_proxies(history, profiles):
+    # http_proxy entries are checked with a plain GET, https_proxy entries with a CONNECT tunnel
+    candidates = []
+    sources = [history] + list(profiles.values())
+    for source in sources:
+        for field, method in (("http_proxy", "GET"), ("https_proxy", "CONNECT")):
+            values = source.get(field, [])
+            if isinstance(values, str):
+                values = [values]
+            for value in values:
+                if value:
+                    candidates.append((value, method))
+    return list(dict.fromkeys(candidates))
+
+
+def format_result(result):
+    if result["ok"]:
+        return (f"{result['proxy']} [{result['method']}]: OK {result['status']}, "
+                f"connect {result['connect_ms']:.0f} ms, first byte {result['first_byte_ms']:.0f} ms")
+    return f"{result['proxy']} [{result['method']}]: FAILED ({result['error']})"
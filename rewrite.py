@@ -0,0 +1,132 @@
+import os
+import stat
+import tempfile
+
+# Shared atomic rewrite engine. Every file ProxyMaster writes goes through a uniquely named temp file in
+# the target's own directory which is fsynced and then renamed over the target, so a crash or a
+# concurrent instance can never leave a truncated or interleaved file behind: readers see either the
+# old or the new content.
+
+DEFAULT_MODE = 0o644
+
+
+def fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AtomicFile:
+    def __init__(self, path, mode=None, follow_symlinks=True):
+        # Write through symlinks (e.g. a ~/.bashrc kept in a dotfiles repo) instead of replacing them;
+        # offline writes into image trees turn this off, so a link there is replaced rather than followed
+        self.path = os.path.realpath(path) if follow_symlinks else os.path.abspath(path)
+        try:
+            self.previous = os.stat(self.path, follow_symlinks=follow_symlinks)
+        except FileNotFoundError:
+            self.previous = None
+        if self.previous is not None and stat.S_ISLNK(self.previous.st_mode):
+            # The link itself carries no useful mode or owner
+            self.previous = None
+        self.mode = mode
+        self.directory = os.path.dirname(self.path) or "."
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{os.path.basename(self.path)}.",
+                                             suffix=".tmp")
+        self.file = os.fdopen(fd, "w")
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def commit(self):
+        try:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            if self.mode is not None:
+                os.chmod(self.tmp_path, self.mode)
+            elif self.previous is not None:
+                os.chmod(self.tmp_path, self.previous.st_mode & 0o7777)
+            else:
+                os.chmod(self.tmp_path, DEFAULT_MODE)
+            if self.previous is not None and os.geteuid() == 0:
+                # Running as the pkexec helper: keep the original owner
+                os.chown(self.tmp_path, self.previous.st_uid, self.previous.st_gid)
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.discard()
+            raise
+        fsync_dir(self.directory)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+        elif not self.file.closed:
+            self.commit()
+        return False
+
+
+def atomic_write(path, content, mode=None, follow_symlinks=True):
+    with AtomicFile(path, mode, follow_symlinks) as f:
+        f.write(content)
+
+
+def hashed(lines, digest):
+    for line in lines:
+        digest.update(line.encode("utf-8", "surrogateescape"))
+        yield line
+
+
+def rewrite_file(path, parser, desired, must_exist=False, remove_if_empty=False, mode=None):
+    # Streams `path` through parser.iter_render() into a temp file, so memory stays flat whatever the
+    # file size. Input and output are hashed on the fly; when they match the temp file is dropped and
+    # the target is left untouched. Returns True when the file was changed.
+    path = os.path.realpath(path)
+    try:
+        source = open(path, "r")
+    except FileNotFoundError:
+        if must_exist:
+            raise
+        source = None
+    import hashlib
+    old_digest = hashlib.sha1()
+    new_digest = hashlib.sha1()
+    has_content = False
+    try:
+        with AtomicFile(path, mode) as f:
+            for chunk in parser.iter_render(hashed(source or (), old_digest), desired):
+                new_digest.update(chunk.encode("utf-8", "surrogateescape"))
+                has_content = has_content or bool(chunk.strip())
+                f.write(chunk)
+            if remove_if_empty and not has_content:
+                f.discard()
+                if source is not None:
+                    os.remove(path)
+                return source is not None
+            if source is None and not has_content:
+                # Nothing to remove from a file that does not exist: do not create an empty one
+                f.discard()
+                return False
+            if source is not None and old_digest.digest() == new_digest.digest():
+                f.discard()
+                return False
+    finally:
+        if source is not None:
+            source.close()
+    return True
@@ -0,0 +1,197 @@
+import os
+import time
+
+# Shell integration: instead of export lines in ~/.bashrc or ~/.zshrc, the rc file (or a fish conf.d
+# snippet) sources one ProxyMaster-managed env file, once, and installs a prompt hook that re-sources it
+# whenever it changes. A profile switch then reaches every open terminal at its next prompt and the rc
+# file is never rewritten again. The first line of each env file carries a serial that changes on every
+# write; the hook reads that line with the `read` builtin and compares it with the serial it last
+# sourced, so an idle prompt costs no fork, no stat binary and no re-parse.
+
+ENV_PATH = os.path.expanduser("~/.proxymaster_env.sh")
+FISH_ENV_PATH = os.path.expanduser("~/.proxymaster_env.fish")
+FISH_CONF_PATH = os.path.expanduser("~/.config/fish/conf.d/proxymaster.fish")
+RC_PATHS = {
+    "bash": os.path.expanduser("~/.bashrc"),
+    "zsh": os.path.expanduser("~/.zshrc"),
+}
+SHELLS = ("bash", "zsh", "fish")
+SERIAL_PREFIX = "# proxymaster-serial "
+BEGIN_MARKER = "# >>> ProxyMaster shell integration >>>\n"
+END_MARKER = "# <<< ProxyMaster shell integration <<<\n"
+
+SYNC_FUNCTION = """__proxymaster_sync() {
+    local serial=
+    { IFS= read -r serial < "$HOME/.proxymaster_env.sh"; } 2>/dev/null
+    if [ "$serial" != "$__proxymaster_serial" ]; then
+        __proxymaster_serial=$serial
+        [ -n "$serial" ] && . "$HOME/.proxymaster_env.sh"
+    fi
+}
+__proxymaster_sync
+"""
+HOOKS = {
+    "bash": SYNC_FUNCTION + """case ";$PROMPT_COMMAND;" in
+    *";__proxymaster_sync;"*) ;;
+    *) PROMPT_COMMAND="__proxymaster_sync${PROMPT_COMMAND:+;$PROMPT_COMMAND}" ;;
+esac
+""",
+    "zsh": SYNC_FUNCTION + """autoload -Uz add-zsh-hook
+add-zsh-hook precmd __proxymaster_sync
+""",
+}
+FISH_HOOK = """# Managed by ProxyMaster: remove with `proxymaster shell uninstall`
+function __proxymaster_sync --on-event fish_prompt
+    set -l serial ""
+    test -r ~/.proxymaster_env.fish; and read serial < ~/.proxymaster_env.fish
+    if test "$serial" != "$__proxymaster_serial"
+        set -g __proxymaster_serial $serial
+        test -n "$serial"; and source ~/.proxymaster_env.fish
+    end
+end
+__proxymaster_sync
+"""
+
+
+def sh_quote(value):
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def fish_quote(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def render_env(env_vars):
+    # Both spellings are exported; empty values are unset so switching a proxy off reaches open shells too
+    lines = ["# Managed by ProxyMaster, sourced by the shell prompt hook: do not edit\n"]
+    for var, value in env_vars.items():
+        if value:
+            lines.extend(f"export {name}={sh_quote(value)}\n" for name in (var, var.upper()))
+        else:
+            lines.append(f"unset {var} {var.upper()}\n")
+    return "".join(lines)
+
+
+def render_fish_env(env_vars):
+    lines = ["# Managed by ProxyMaster, sourced by the fish prompt hook: do not edit\n"]
+    for var, value in env_vars.items():
+        if value:
+            lines.extend(f"set -gx {name} {fish_quote(value)}\n" for name in (var, var.upper()))
+        else:
+            lines.append(f"set -e {var} {var.upper()}\n")
+    return "".join(lines)
+
+
+def installed():
+    return os.path.exists(ENV_PATH)
+
+
+def read_body(path):
+    # Env file content without its serial line, or None
+    try:
+        with open(path, "r") as f:
+            first = f.readline()
+            return f.read() if first.startswith(SERIAL_PREFIX) else None
+    except OSError:
+        return None
+
+
+def write_env(env_vars):
+    # Returns True when the env files changed; an unchanged state keeps the serial, so no shell re-sources
+    from rewrite import atomic_write
+    bodies = ((ENV_PATH, render_env(env_vars)), (FISH_ENV_PATH, render_fish_env(env_vars)))
+    if all(read_body(path) == body for path, body in bodies):
+        return False
+    serial = f"{SERIAL_PREFIX}{time.time_ns()}\n"
+    for path, body in bodies:
+        atomic_write(path, serial + body, 0o644)
+    return True
+
+
+def read_block(path):
+    try:
+        with open(path, "r") as f:
+            lines = iter(f)
+            for line in lines:
+                if line == BEGIN_MARKER:
+                    block = [line]
+                    for line in lines:
+                        block.append(line)
+                        if line == END_MARKER:
+                            break
+                    return "".join(block)
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def set_block(path, block):
+    # Streams the rc file into place without its old block and appends `block` (None removes it)
+    from rewrite import AtomicFile
+    if read_block(path) == block:
+        return False
+    try:
+        source = open(path, "r")
+    except FileNotFoundError:
+        source = None
+    last = ""
+    try:
+        with AtomicFile(path) as f:
+            skipping = False
+            for line in source or ():
+                if line == BEGIN_MARKER:
+                    skipping = True
+                if not skipping:
+                    f.write(line)
+                    last = line
+                elif line == END_MARKER:
+                    skipping = False
+            if block is not None:
+                if last and not last.endswith("\n"):
+                    f.write("\n")
+                f.write(block)
+    finally:
+        if source is not None:
+            source.close()
+    return True
+
+
+def detect_shells():
+    # Shells whose config exists, plus the login shell
+    shells = {shell for shell, path in RC_PATHS.items() if os.path.exists(path)}
+    if os.path.isdir(os.path.dirname(os.path.dirname(FISH_CONF_PATH))):
+        shells.add("fish")
+    login = os.path.basename(os.environ.get("SHELL", ""))
+    if login in SHELLS:
+        shells.add(login)
+    return [shell for shell in SHELLS if shell in shells] or ["bash"]
+
+
+def install(env_vars, shells=None, log=print):
+    # The env files are written first so the hook finds them the moment it is installed
+    write_env(env_vars)
+    shells = shells or detect_shells()
+    for shell in shells:
+        if shell == "fish":
+            os.makedirs(os.path.dirname(FISH_CONF_PATH), exist_ok=True)
+            from rewrite import atomic_write
+            atomic_write(FISH_CONF_PATH, FISH_HOOK, 0o644)
+            log(f"Shell integration installed in {FISH_CONF_PATH}.")
+        elif set_block(RC_PATHS[shell], BEGIN_MARKER + HOOKS[shell] + END_MARKER):
+            log(f"Shell integration installed in {RC_PATHS[shell]}.")
+        else:
+            log(f"Shell integration already present in {RC_PATHS[shell]}.")
+    return shells
+
+
+def uninstall(log=print):
+    # Open shells keep their hook function, which finds no env file and stays idle
+    for shell, path in RC_PATHS.items():
+        if read_block(path) is not None:
+            set_block(path, None)
+            log(f"Shell integration removed from {path}.")
+    for path in (FISH_CONF_PATH, ENV_PATH, FISH_ENV_PATH):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
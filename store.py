@@ -0,0 +1,258 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import tracing
+
+HISTORY_FIELDS = ("http_proxy", "https_proxy", "ftp_proxy", "no_proxy")
+DEFAULT_HISTORY_PATH = os.path.expanduser("~/.proxymaster_proxy_history.json")
+DEFAULT_PROFILES_PATH = os.path.expanduser("~/.proxymaster_profiles.json")
+DEFAULT_RULES_PATH = os.path.expanduser("~/.proxymaster_rules.json")
+# A write-behind flush that fails is retried with doubling delays up to this many seconds
+MAX_RETRY_DELAY = 60.0
+
+
+def read_json(path, default):
+    try:
+        with tracing.span("read json", "io", path=path), open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def valid_usage(stats, count):
+    # [[use count, last use time], ...] with at least `count` entries
+    return isinstance(stats, list) and len(stats) >= count and all(
+        isinstance(entry, list) and len(entry) == 2 and all(isinstance(n, (int, float)) for n in entry)
+        for entry in stats[:count])
+
+
+def atomic_write_json(path, data):
+    from rewrite import AtomicFile
+    with tracing.span("write json", "io", path=path), AtomicFile(path, 0o600) as f:
+        # One write of the encoded string: json.dump() issues a write per token
+        f.write(json.dumps(data))
+
+
+class ProxyStore:
+    # History and profiles are loaded once and kept in memory; writes are coalesced and
+    # flushed by a timer (write-behind) once changes stop for write_delay seconds, or explicitly
+    # via flush(). close() flushes at shutdown.
+    def __init__(self, history_path=DEFAULT_HISTORY_PATH, profiles_path=DEFAULT_PROFILES_PATH,
+                 max_history=500, write_delay=1.0, rules_path=DEFAULT_RULES_PATH, launch_cache_path=None):
+        self.history_path = history_path
+        self.profiles_path = profiles_path
+        self.rules_path = rules_path
+        self.launch_cache_path = launch_cache_path
+        self.max_history = max_history
+        self.write_delay = write_delay
+        self.lock = threading.RLock()
+        self.history = None
+        self.profiles = None
+        self.rules = None
+        self.dirty = set()
+        self.timer = None
+        self.due = 0.0
+        self.retry_delay = None
+
+    def _load_history(self):
+        if self.history is None:
+            data = read_json(self.history_path, {})
+            if not isinstance(data, dict):
+                data = {}
+            usage = data.get("usage") if isinstance(data.get("usage"), dict) else {}
+            self.history = {}
+            for field in HISTORY_FIELDS:
+                # Hand-edited or corrupt files: anything that is not a list of strings is ignored
+                values = data.get(field)
+                values = values[:self.max_history] if isinstance(values, list) else []
+                # Stored newest first on disk, kept newest last in memory for O(1) MRU updates. Each value
+                # maps to [use count, last use time], stored on disk as a list parallel to the values;
+                # files written before usage was tracked count every value once and get increasingly old
+                # timestamps, which keeps their MRU order.
+                stats = usage.get(field)
+                if not valid_usage(stats, len(values)):
+                    stats = [[1, -i] for i in range(len(values))]
+                self.history[field] = OrderedDict(
+                    (values[i], stats[i]) for i in range(len(values) - 1, -1, -1) if isinstance(values[i], str) and values[i])
+        return self.history
+
+    def _load_profiles(self):
+        if self.profiles is None:
+            data = read_json(self.profiles_path, None)
+            if isinstance(data, dict):
+                self.profiles = {name: profile for name, profile in data.items() if isinstance(profile, dict)}
+            else:
+                self.profiles = {"Default": {}}
+        return self.profiles
+
+    def get_history(self):
+        with self.lock:
+            history = self._load_history()
+            return {field: list(reversed(history[field])) for field in HISTORY_FIELDS}
+
+    def get_usage(self):
+        # {field: {value: (use count, last use time)}} for frecency ranking
+        with self.lock:
+            history = self._load_history()
+            return {field: {value: tuple(stats) for value, stats in history[field].items()} for field in HISTORY_FIELDS}
+
+    def add_history(self, values, now=None):
+        # Records one successful use of each value; returns the values evicted to stay within max_history
+        now = time.time() if now is None else now
+        evicted = {}
+        with self.lock:
+            history = self._load_history()
+            changed = False
+            for field in HISTORY_FIELDS:
+                value = values.get(field)
+                if not value:
+                    continue
+                entries = history[field]
+                if value in entries:
+                    entries.move_to_end(value)
+                    entries[value] = [entries[value][0] + 1, now]
+                else:
+                    entries[value] = [1, now]
+                    while len(entries) > self.max_history:
+                        evicted.setdefault(field, []).append(entries.popitem(last=False)[0])
+                changed = True
+            if changed:
+                self.schedule_write("history")
+            return evicted
+
+    def set_history(self, history):
+        with self.lock:
+            self.history = {}
+            for field in HISTORY_FIELDS:
+                values = history.get(field, [])[:self.max_history]
+                self.history[field] = OrderedDict((value, [1, -i]) for i, value in reversed(list(enumerate(values)))
+                                                  if value)
+            self.schedule_write("history")
+
+    def history_data(self):
+        history = self._load_history()
+        data = {field: list(reversed(history[field])) for field in HISTORY_FIELDS}
+        data["usage"] = {field: [[count, int(last_used)] for count, last_used in reversed(history[field].values())]
+                         for field in HISTORY_FIELDS}
+        return data
+
+    def get_profiles(self):
+        with self.lock:
+            return {name: dict(profile) for name, profile in self._load_profiles().items()}
+
+    def get_profile(self, name):
+        with self.lock:
+            profile = self._load_profiles().get(name)
+            return dict(profile) if profile is not None else None
+
+    def set_profile(self, name, profile):
+        with self.lock:
+            self._load_profiles()[name] = dict(profile)
+            self.schedule_write("profiles")
+
+    def set_profiles(self, profiles):
+        with self.lock:
+            self.profiles = {name: dict(profile) for name, profile in profiles.items()}
+            self.schedule_write("profiles")
+
+    def get_rules(self):
+        # Network rules for automatic profile switching (see netrules)
+        with self.lock:
+            if self.rules is None:
+                data = read_json(self.rules_path, [])
+                self.rules = [rule for rule in data if isinstance(rule, dict)] if isinstance(data, list) else []
+            return [dict(rule) for rule in self.rules]
+
+    def set_rules(self, rules):
+        with self.lock:
+            self.rules = [dict(rule) for rule in rules]
+            self.schedule_write("rules")
+
+    def write_launch_cache(self):
+        # Profile lookup cache for `cli.py run` (see launcher); best effort, a stale one is ignored
+        if self.launch_cache_path is None:
+            return
+        import launcher
+        try:
+            launcher.write_cache(self.profiles, self.launch_cache_path)
+        except OSError:
+            pass
+
+    def schedule_write(self, kind):
+        with self.lock:
+            self.dirty.add(kind)
+            if self.write_delay <= 0:
+                self.flush()
+                return
+            # Debounced: every change pushes the write back, so a burst of edits is written once, after
+            # it ends. The running timer re-arms itself when it fires early instead of being replaced.
+            self.due = time.monotonic() + self.write_delay
+            if self.timer is None:
+                self.start_timer(self.write_delay)
+
+    def start_timer(self, delay):
+        self.timer = threading.Timer(delay, self.timer_flush)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def timer_flush(self):
+        # Runs on the timer thread, where a raised error would go unnoticed: report it and retry later
+        with self.lock:
+            if self.timer is not threading.current_thread():
+                # Flushed (and maybe rescheduled) since this timer was started
+                return
+            remaining = self.due - time.monotonic()
+            if remaining > 0:
+                self.start_timer(remaining)
+                return
+            try:
+                self.flush()
+            except OSError as e:
+                self.retry_delay = min((self.retry_delay or self.write_delay) * 2, MAX_RETRY_DELAY)
+                print(f"proxymaster: could not save settings (retrying in {self.retry_delay:.0f} s): {e}",
+                      file=sys.stderr)
+                self.due = time.monotonic() + self.retry_delay
+                self.start_timer(self.retry_delay)
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            dirty, self.dirty = self.dirty, set()
+            try:
+                if "history" in dirty:
+                    atomic_write_json(self.history_path, self.history_data())
+                if "profiles" in dirty:
+                    atomic_write_json(self.profiles_path, self.profiles)
+                    self.write_launch_cache()
+                if "rules" in dirty:
+                    atomic_write_json(self.rules_path, self.rules)
+            except OSError:
+                self.dirty |= dirty
+                raise
+            self.retry_delay = None
+
+    def close(self):
+        # Shutdown: write what is pending now; errors are reported since there is nobody left to raise to
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"proxymaster: could not save settings: {e}", file=sys.stderr)
+
+
+_default_store = None
+
+
+def get_store():
+    global _default_store
+    if _default_store is None:
+        import atexit
+        from launcher import CACHE_PATH
+        _default_store = ProxyStore(launch_cache_path=CACHE_PATH)
+        atexit.register(_default_store.close)
+    return _default_store
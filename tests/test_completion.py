@@ -0,0 +1,45 @@
+from completion import HALF_LIFE, CompletionIndex
+
+
+def test_ranking_by_count_and_recency():
+    index = CompletionIndex()
+    index.add("http://old.example:3128", 8, 0.0)
+    index.add("http://recent.example:3128", 1, 3 * HALF_LIFE)
+    index.add("http://profile.example:3128")
+    # 8 uses three half-lives ago count as one use now
+    assert index.ranked() == ["http://old.example:3128", "http://recent.example:3128", "http://profile.example:3128"]
+    index.use("http://recent.example:3128", 3 * HALF_LIFE)
+    assert index.ranked(2) == ["http://recent.example:3128", "http://old.example:3128"]
+    assert index.rank_of("http://profile.example:3128") == 2
+    # Merging an older record keeps the higher count and the later time
+    index.add("http://old.example:3128", 2, 4 * HALF_LIFE)
+    assert index.ranked(1) == ["http://old.example:3128"]
+    index.remove("http://old.example:3128")
+    assert "http://old.example:3128" not in index and len(index) == 2
+
+
+def test_search_prefix_then_substring():
+    index = CompletionIndex()
+    for i, value in enumerate(["http://proxy.example:3128", "socks5://10.0.0.1:1080", "http://my-proxy.lan:8080",
+                               "proxy.corp:3128"]):
+        index.add(value, i + 1, float(i))
+    assert index.search("PROXY") == ["proxy.corp:3128", "http://proxy.example:3128", "http://my-proxy.lan:8080"]
+    assert index.search("10.0") == ["socks5://10.0.0.1:1080"]
+    assert index.search("http", limit=1) == ["http://my-proxy.lan:8080"]
+    assert index.search("nothing") == []
+    assert index.search("") == index.ranked(50)
+    index.use("http://my-proxy.lan:8080", 10.0)
+    index.remove("proxy.corp:3128")
+    assert index.search("proxy") == ["http://proxy.example:3128", "http://my-proxy.lan:8080"]
+
+
+def test_search_after_length_changing_lowercase():
+    # "İ".lower() is two characters long; later values must still be found at the right offsets
+    index = CompletionIndex()
+    index.add("http://İİİİİİİİ.example:3128", 3, 2.0)
+    index.add("http://a.lan:1", 2, 1.0)
+    index.add("proxy.example:3128", 1, 0.0)
+    assert index.search("proxy") == ["proxy.example:3128"]
+    assert index.search("lan") == ["http://a.lan:1"]
+    assert index.search("a") == ["http://a.lan:1", "http://İİİİİİİİ.example:3128", "proxy.example:3128"]
+    assert index.search("i̇i̇") == ["http://İİİİİİİİ.example:3128"]
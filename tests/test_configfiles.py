@@ -0,0 +1,161 @@
+import io
+
+import configfiles
+
+PROXY = "http://proxy.example:3128"
+DNF_CONF = """[main]
+gpgcheck=1
+proxy=http://old.example:8080
+
+[updates]
+name=Updates
+proxy=http://repo-proxy.example:3128
+"""
+ENVIRONMENT = """PATH="/usr/local/bin:/usr/bin"
+my_http_proxy="http://keep.example"
+http_proxy_backup=http://keep.example
+http_proxy="http://old.example"
+http_proxy="http://duplicate.example"
+"""
+
+
+def streamed(parser, text, desired):
+    # iter_render() over a file object, the way rewrite_file() feeds it
+    return "".join(parser.iter_render(io.StringIO(text), desired))
+
+
+def test_render_twice_changes_nothing():
+    cases = [
+        (configfiles.ENVIRONMENT, ENVIRONMENT, {"http_proxy": PROXY, "https_proxy": PROXY, "no_proxy": None}),
+        (configfiles.SHELL, "alias ll='ls -l'\nexport http_proxy='old'", {"http_proxy": PROXY, "ftp_proxy": None}),
+        (configfiles.APT, 'Acquire::http::Proxy "http://old";\n', {"Acquire::http::Proxy": PROXY,
+                                                                   "Acquire::https::Proxy": PROXY}),
+        (configfiles.DNF, DNF_CONF, {"proxy": PROXY, "max_parallel_downloads": "10"}),
+        (configfiles.DNF, DNF_CONF, {"proxy": None}),
+    ]
+    for parser, text, desired in cases:
+        once = streamed(parser, text, desired)
+        assert once != text
+        assert streamed(parser, once, desired) == once
+        assert parser.render(text, desired) == once
+
+
+def test_substring_variables_are_left_alone():
+    rendered = streamed(configfiles.ENVIRONMENT, ENVIRONMENT, {"http_proxy": PROXY, "https_proxy": None})
+    assert rendered == f"""PATH="/usr/local/bin:/usr/bin"
+my_http_proxy="http://keep.example"
+http_proxy_backup=http://keep.example
+http_proxy="{PROXY}"
+"""
+    assert streamed(configfiles.ENVIRONMENT, rendered, {"http_proxy": None}) == """PATH="/usr/local/bin:/usr/bin"
+my_http_proxy="http://keep.example"
+http_proxy_backup=http://keep.example
+"""
+
+    shell = 'export my_http_proxy="keep"\nexport no_proxy_extra=keep\nexport http_proxy="old"\n'
+    assert streamed(configfiles.SHELL, shell, {"http_proxy": None, "no_proxy": None}) == \
+        'export my_http_proxy="keep"\nexport no_proxy_extra=keep\n'
+
+
+def test_section_scoped_insert():
+    rendered = streamed(configfiles.DNF, DNF_CONF, {"proxy": PROXY, "max_parallel_downloads": "10"})
+    # Changed in place, missing keys go before the blank line that ends [main]; the repo's proxy survives
+    assert rendered == f"""[main]
+gpgcheck=1
+proxy={PROXY}
+max_parallel_downloads=10
+
+[updates]
+name=Updates
+proxy=http://repo-proxy.example:3128
+"""
+
+
+def test_section_scoped_remove():
+    rendered = streamed(configfiles.DNF, DNF_CONF, {"proxy": None})
+    assert rendered == """[main]
+gpgcheck=1
+
+[updates]
+name=Updates
+proxy=http://repo-proxy.example:3128
+"""
+    assert configfiles.DNF.parse(rendered) == {"gpgcheck": "1"}
+
+
+def test_missing_section_is_appended():
+    text = "[updates]\nproxy=http://repo-proxy.example:3128"
+    rendered = streamed(configfiles.DNF, text, {"proxy": PROXY})
+    assert rendered == f"[updates]\nproxy=http://repo-proxy.example:3128\n[main]\nproxy={PROXY}\n"
+    # Nothing to add: the file is left as it is
+    assert streamed(configfiles.DNF, text, {"proxy": None}) == text
+
+
+def test_repeated_section_renders_once():
+    text = "[main]\nproxy=http://old.example:8080\n[updates]\nname=Updates\n[ main ]\ngpgcheck = b\n"
+    desired = {"proxy": PROXY, "gpgcheck": "a"}
+    rendered = streamed(configfiles.DNF, text, desired)
+    # Missing keys go into the first [main]; their copies in the repeated one are dropped as duplicates
+    assert rendered == f"[main]\nproxy={PROXY}\ngpgcheck=a\n[updates]\nname=Updates\n[ main ]\n"
+    assert streamed(configfiles.DNF, rendered, desired) == rendered
+    assert configfiles.DNF.parse(rendered) == {"proxy": PROXY, "gpgcheck": "a"}
+
+
+def test_up_to_date_file_is_kept_byte_for_byte():
+    text = "# proxy settings\nexport http_proxy='http://proxy.example:3128'   \nexport https_proxy=\"x\"\r\n"
+    assert streamed(configfiles.SHELL, text, {"http_proxy": PROXY, "https_proxy": "x"}) == text
+
+
+def test_scan_reads_lazily():
+    lines = iter(["http_proxy=a\n", "https_proxy=b\n", "boom"])
+    scan = configfiles.ENVIRONMENT.scan(lines, ("http_proxy", "https_proxy"))
+    assert next(scan) == ("http_proxy", "a")
+    assert next(scan) == ("https_proxy", "b")
+    assert next(lines) == "boom"
+
+
+PACMAN_CONF = """[options]
+HoldPkg     = pacman glibc
+XferCommand = /usr/bin/wget --passive-ftp -c -O %o %u
+ParallelDownloads = 5
+
+[core]
+Include = /etc/pacman.d/mirrorlist
+"""
+
+
+def test_pacman_xfercommand_disabled_and_restored():
+    enabled = streamed(configfiles.PACMAN, PACMAN_CONF, {"proxy": "environment"})
+    assert enabled == f"""[options]
+{configfiles.PACMAN.marker}HoldPkg     = pacman glibc
+#ProxyMaster-disabled# XferCommand = /usr/bin/wget --passive-ftp -c -O %o %u
+ParallelDownloads = 5
+
+[core]
+Include = /etc/pacman.d/mirrorlist
+"""
+    assert configfiles.PACMAN.parse(enabled) == {"proxy": "environment"}
+    assert streamed(configfiles.PACMAN, enabled, {"proxy": "environment"}) == enabled
+    # Removing the proxy restores the original file exactly
+    assert streamed(configfiles.PACMAN, enabled, {"proxy": None}) == PACMAN_CONF
+    assert streamed(configfiles.PACMAN, PACMAN_CONF, {"proxy": None}) == PACMAN_CONF
+    assert configfiles.PACMAN.parse(PACMAN_CONF) == {}
+
+
+def test_pacman_legacy_curl_xfercommand_dropped():
+    legacy = "XferCommand = /usr/bin/curl -x http://old.example:8080 -L -C - -f %u > %o\n"
+    text = PACMAN_CONF.replace("ParallelDownloads", legacy + "ParallelDownloads")
+    disabled = streamed(configfiles.PACMAN, text, {"proxy": None})
+    assert disabled == PACMAN_CONF
+    enabled = streamed(configfiles.PACMAN, text, {"proxy": "environment"})
+    assert enabled == streamed(configfiles.PACMAN, PACMAN_CONF, {"proxy": "environment"})
+    # Only the exact command older versions wrote is dropped
+    custom = "XferCommand = /usr/bin/curl -x http://old.example:8080 -L -C - -f -o %o %u\n"
+    assert streamed(configfiles.PACMAN, custom, {"proxy": None}) == custom
+
+
+def test_pacman_options_section_added():
+    text = "[core]\nInclude = /etc/pacman.d/mirrorlist"
+    enabled = streamed(configfiles.PACMAN, text, {"proxy": "environment"})
+    assert enabled == f"{text}\n[options]\n{configfiles.PACMAN.marker}"
+    assert streamed(configfiles.PACMAN, enabled, {"proxy": "environment"}) == enabled
@@ -0,0 +1,80 @@
+import os
+
+import core
+from privileged import PrivilegedTransaction
+
+STUB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "stub")
+PROXY = "http://proxy.example:3128"
+PACMAN_CONF = "[options]\nXferCommand = /usr/bin/wget -c -O %o %u\nParallelDownloads = 5\n"
+
+
+def make_root(tmp_path):
+    (tmp_path / "etc" / "sudoers.d").mkdir(parents=True)
+    (tmp_path / "etc" / "environment").write_text('PATH="/usr/bin"\n')
+    (tmp_path / "etc" / "pacman.conf").write_text(PACMAN_CONF)
+    return str(tmp_path)
+
+
+def test_pacman_set_and_remove_are_symmetric(tmp_path):
+    root = make_root(tmp_path)
+    env_vars = core.make_env_vars(PROXY, PROXY)
+    targets = [plan["target"] for plan in core.plan_package_manager("pacman", env_vars, root)]
+    expected = ("/etc/pacman.conf", core.SUDOERS_PROXY_CONF, core.ENVIRONMENT_FILE)
+    assert targets == [core.rooted(path, root) for path in expected]
+    assert core.apply_to_root(root, env_vars, ["pacman"])["ok"]
+    assert core.read_status(root)["environment"]["http_proxy"] == PROXY
+    assert (tmp_path / "etc" / "sudoers.d" / "proxymaster").read_text() == core.SUDOERS_PROXY_CONTENT
+
+    # Removing the pacman proxy also clears the environment it was read from
+    plans = core.plan_package_manager("pacman", core.make_env_vars(), root)
+    assert [plan["changed"] for plan in plans] == [True, True, True]
+    for plan in plans:
+        core.write_plan(plan, follow_symlinks=False)
+    assert (tmp_path / "etc" / "environment").read_text() == 'PATH="/usr/bin"\n'
+    assert (tmp_path / "etc" / "pacman.conf").read_text() == PACMAN_CONF
+    assert not (tmp_path / "etc" / "sudoers.d" / "proxymaster").exists()
+    assert not any(plan["changed"] for plan in core.plan_package_manager("pacman", core.make_env_vars(), root))
+
+
+def test_helper_reports_unchanged_targets(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", STUB_DIR + os.pathsep + os.environ["PATH"])
+    same, other, missing = tmp_path / "same", tmp_path / "other", tmp_path / "missing"
+    same.write_text("content\n")
+    other.write_text("old\n")
+    transaction = PrivilegedTransaction()
+    transaction.write(str(same), "content\n")
+    transaction.write(str(other), "content\n")
+    transaction.remove(str(missing))
+    results = {r["target"]: r for r in transaction.commit()}
+    assert all(r["ok"] for r in results.values())
+    assert [results[str(path)]["changed"] for path in (same, other, missing)] == [False, True, False]
+    assert other.read_text() == "content\n"
+
+
+def test_profile_downloads():
+    profile = {"downloads": {
+        "dnf": {"max_parallel_downloads": " 10 ", "fastestmirror": "", "retries": None, "timeout": "Unset",
+                "not_an_option": "1"},
+        "zypper": {},
+        "emerge": {"jobs": "4"},
+    }}
+    # Empty leaves an option untouched, None or "unset" removes it
+    assert core.profile_downloads(profile) == {"dnf": {"max_parallel_downloads": "10", "retries": None,
+                                                       "timeout": None}}
+
+
+def test_unset_download_setting_is_removed(tmp_path):
+    (tmp_path / "etc" / "dnf").mkdir(parents=True)
+    dnf_conf = tmp_path / "etc" / "dnf" / "dnf.conf"
+    dnf_conf.write_text("[main]\ngpgcheck=1\n")
+    root = str(tmp_path)
+    env_vars = core.make_env_vars(PROXY)
+    downloads = core.profile_downloads({"downloads": {"dnf": {"max_parallel_downloads": "10"}}})
+    assert core.apply_to_root(root, env_vars, ["dnf"], downloads)["ok"]
+    assert dnf_conf.read_text() == f"[main]\ngpgcheck=1\nproxy={PROXY}\nmax_parallel_downloads=10\n"
+    # Removing the proxy keeps the tuning; unsetting it removes the line
+    assert core.apply_to_root(root, core.make_env_vars(), ["dnf"])["ok"]
+    assert dnf_conf.read_text() == "[main]\ngpgcheck=1\nmax_parallel_downloads=10\n"
+    downloads = core.profile_downloads({"downloads": {"dnf": {"max_parallel_downloads": None}}})
+    assert core.apply_to_root(root, core.make_env_vars(), ["dnf"], downloads)["ok"]
+    assert dnf_conf.read_text() == "[main]\ngpgcheck=1\n"
@@ -0,0 +1,237 @@
+import asyncio
+import gc
+import json
+import socket
+import warnings
+
+from forwarder import BodyBuffer, ForwardingProxy, body_framing, copy_body, parse_head, read_head
+
+
+class StandIn:
+    # Plays an upstream proxy or an origin server. Every request is recorded with its body and answered
+    # with the number of body bytes received. `mode` misbehaves on purpose: "drop" closes the connection
+    # without answering, "silent" never answers and records when the other end closes.
+    def __init__(self, name, mode="answer"):
+        self.name = name
+        self.mode = mode
+        self.requests = []
+        self.connections = 0
+        self.closed_by_peer = asyncio.Event()
+        self.writers = set()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def stop(self):
+        self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.writers.add(writer)
+        try:
+            while True:
+                data = await read_head(reader)
+                if data is None:
+                    break
+                request_line, headers = parse_head(data)
+                if self.mode == "silent":
+                    await reader.read()
+                    self.closed_by_peer.set()
+                    break
+                if self.mode == "drop":
+                    break
+                framing = body_framing(headers)
+                body = BodyBuffer()
+                if framing is None or framing > 0:
+                    await copy_body(reader, body, framing)
+                self.requests.append((request_line, dict(headers), body.getvalue()))
+                answer = b"%d" % len(body.getvalue())
+                writer.write(b"HTTP/1.1 200 OK\r\nX-Served-By: %s\r\nContent-Length: %d\r\n\r\n%s"
+                             % (self.name.encode(), len(answer), answer))
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+
+async def request(reader, writer, method, target, headers=(), body=b""):
+    head = f"{method} {target} HTTP/1.1\r\nHost: test\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers)
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+    status_line, response_headers = parse_head(await read_head(reader))
+    response = BodyBuffer()
+    await copy_body(reader, response, body_framing(response_headers))
+    return int(status_line.split()[1]), dict(response_headers), response.getvalue()
+
+
+def refusing_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def run(test):
+    # `start` runs a proxy in front of the test's stand-ins and opens a client connection to it
+    started = []
+    clients = []
+
+    async def start(upstreams, **options):
+        proxy = ForwardingProxy(upstreams, port=0, **options)
+        await proxy.start()
+        started.append(proxy)
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+        clients.append(writer)
+        return proxy, reader, writer
+
+    async def main():
+        try:
+            return await test(start)
+        finally:
+            for writer in clients:
+                writer.close()
+            for proxy in started:
+                await proxy.close()
+    return asyncio.run(main())
+
+
+def test_upstream_connections_are_pooled():
+    async def test(start):
+        async with StandIn("upstream") as upstream:
+            url = upstream.url.replace("http://", "http://user:secret@")
+            proxy, reader, writer = await start([url])
+            for i in range(3):
+                status, headers, body = await request(reader, writer, "GET", f"http://example.com/{i}",
+                                                      [("Proxy-Authorization", "Basic client")])
+                assert (status, headers["X-Served-By"]) == (200, "upstream")
+            assert upstream.connections == 1
+            stats = proxy.stats()["upstreams"][0]
+            assert (stats["requests"], stats["connections"], stats["reused"]) == (3, 1, 2)
+            request_line, headers, body = upstream.requests[0]
+            assert request_line == "GET http://example.com/0 HTTP/1.1"
+            # The upstream's own credentials replace the client's
+            assert headers["Proxy-Authorization"] == "Basic dXNlcjpzZWNyZXQ="
+    run(test)
+
+
+def test_failover_to_next_upstream():
+    async def test(start):
+        async with StandIn("primary") as primary, StandIn("backup") as backup:
+            proxy, reader, writer = await start([refusing_url(), primary.url, backup.url], check_interval=60)
+            status, headers, body = await request(reader, writer, "GET", "http://example.com/")
+            assert (status, headers["X-Served-By"]) == (200, "primary")
+            assert not proxy.upstreams[0].up
+            # The primary dies with a pooled connection open: the request is replayed on the backup
+            await primary.stop()
+            status, headers, body = await request(reader, writer, "GET", "http://example.com/")
+            assert (status, headers["X-Served-By"]) == (200, "backup")
+            assert [upstream.up for upstream in proxy.upstreams] == [False, False, True]
+            assert proxy.stats()["failovers"] == 2
+    run(test)
+
+
+def test_all_upstreams_down():
+    async def test(start):
+        proxy, reader, writer = await start([refusing_url()])
+        status, headers, body = await request(reader, writer, "GET", "http://example.com/")
+        assert status == 502 and body.startswith(b"all upstream proxies failed")
+        assert proxy.stats()["errors"] == 1
+    run(test)
+
+
+def test_request_bodies_are_streamed():
+    async def test(start):
+        async with StandIn("upstream") as upstream:
+            proxy, reader, writer = await start([upstream.url])
+            payload = b"x" * (3 << 20)
+            status, headers, body = await request(reader, writer, "POST", "http://example.com/upload",
+                                                  [("Content-Length", len(payload))], payload)
+            assert (status, body) == (200, b"%d" % len(payload))
+            chunked = b"5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n"
+            status, headers, body = await request(reader, writer, "PUT", "http://example.com/chunked",
+                                                  [("Transfer-Encoding", "chunked")], chunked)
+            # Chunked bodies are relayed with their framing
+            assert (status, upstream.requests[-1][2]) == (200, chunked)
+            assert proxy.stats()["bytes_sent"] == len(payload) + len(chunked)
+    run(test)
+
+
+def test_streamed_body_is_not_failed_over():
+    async def test(start):
+        async with StandIn("primary", mode="drop") as primary, StandIn("backup") as backup:
+            proxy, reader, writer = await start([primary.url, backup.url])
+            payload = b"x" * (2 << 20)
+            status, headers, body = await request(reader, writer, "POST", "http://example.com/upload",
+                                                  [("Content-Length", len(payload))], payload)
+            assert status == 502
+            assert backup.requests == []
+    run(test)
+
+
+def test_small_replayable_body_is_failed_over():
+    async def test(start):
+        async with StandIn("primary", mode="drop") as primary, StandIn("backup") as backup:
+            proxy, reader, writer = await start([primary.url, backup.url])
+            status, headers, body = await request(reader, writer, "PUT", "http://example.com/file",
+                                                  [("Content-Length", 5)], b"hello")
+            assert (status, headers["X-Served-By"], body) == (200, "backup", b"5")
+            assert backup.requests[0][2] == b"hello"
+    run(test)
+
+
+def test_no_proxy_targets_are_connected_directly():
+    async def test(start):
+        async with StandIn("upstream") as upstream, StandIn("origin") as origin:
+            proxy, reader, writer = await start([upstream.url], no_proxy="127.0.0.1")
+            status, headers, body = await request(reader, writer, "POST", f"{origin.url}/form?a=1",
+                                                  [("Content-Length", 4)], b"data")
+            assert (status, headers["X-Served-By"], body) == (200, "origin", b"4")
+            # Origin-form request line, no proxy credentials
+            assert origin.requests[0][0] == "POST /form?a=1 HTTP/1.1"
+            assert upstream.requests == []
+            assert proxy.stats()["direct"] == 1
+    run(test)
+
+
+def test_failed_direct_connection_is_closed():
+    async def test(start):
+        async with StandIn("origin", mode="silent") as origin:
+            proxy, reader, writer = await start([], no_proxy="127.0.0.1", response_timeout=0.2)
+            # The connection to the origin is closed, not left for the garbage collector to find
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", ResourceWarning)
+                status, headers, body = await request(reader, writer, "GET", f"{origin.url}/")
+                await asyncio.wait_for(origin.closed_by_peer.wait(), 2)
+                gc.collect()
+            assert status == 502
+            assert [str(w.message) for w in caught if issubclass(w.category, ResourceWarning)] == []
+            # A 502 closes the client connection
+            reader, writer = await asyncio.open_connection("127.0.0.1", proxy.port)
+            status, headers, body = await request(reader, writer, "GET", f"{refusing_url()}/")
+            writer.close()
+            assert status == 502
+            assert proxy.stats()["errors"] == 2
+    run(test)
+
+
+def test_stats_endpoint():
+    async def test(start):
+        proxy, reader, writer = await start([refusing_url()])
+        status, headers, body = await request(reader, writer, "GET", "/proxymaster/stats")
+        assert status == 200 and headers["Content-Type"] == "application/json"
+        stats = json.loads(body)
+        assert stats["listen"] == proxy.url
+        assert stats["upstreams"][0]["up"] is True
+        status, headers, body = await request(reader, writer, "GET", "/elsewhere")
+        assert status == 404
+    run(test)
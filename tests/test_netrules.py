@@ -0,0 +1,138 @@
+import socket
+import struct
+
+import pytest
+
+from netrules import RTF_GATEWAY, RTF_UP, NetworkFacts, ProfileSwitcher, RuleSet, read_default_route
+
+HEADER = "Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT\n"
+
+
+def route(interface, gateway="0.0.0.0", flags=RTF_UP | RTF_GATEWAY, metric=0, destination="00000000",
+          mask="00000000"):
+    # One /proc/net/route line: addresses are little-endian hex
+    gateway = "%08X" % struct.unpack("<I", socket.inet_aton(gateway))[0]
+    return f"{interface}\t{destination}\t{gateway}\t{flags:04X}\t0\t0\t{metric}\t{mask}\t0\t0\t0\n"
+
+
+def write_routes(path, *lines):
+    path.write_text(HEADER + "".join(lines))
+    return str(path)
+
+
+class FakeResolver:
+    def __init__(self, known=()):
+        self.known = set(known)
+        self.calls = []
+
+    def __call__(self, host):
+        self.calls.append(host)
+        return host in self.known
+
+
+def test_default_route_lowest_metric(tmp_path):
+    path = write_routes(tmp_path / "route",
+                        route("wlan0", "192.168.1.1", metric=600),
+                        route("eth0", "10.20.0.1", metric=100),
+                        route("eth0", destination="0014000A", mask="0000FFFF", flags=RTF_UP),
+                        route("docker0", "172.17.0.1", metric=50, destination="000011AC", mask="0000FFFF"))
+    assert read_default_route(path) == ("10.20.0.1", "eth0")
+
+
+def test_default_route_ignores_routes_that_are_down(tmp_path):
+    path = write_routes(tmp_path / "route",
+                        route("eth0", "10.20.0.1", flags=RTF_GATEWAY, metric=0),
+                        route("wlan0", "192.168.1.1", metric=600))
+    assert read_default_route(path) == ("192.168.1.1", "wlan0")
+
+
+def test_default_route_without_gateway_flag(tmp_path):
+    # A point-to-point default route (e.g. a VPN tunnel) has no gateway, only an interface
+    path = write_routes(tmp_path / "route",
+                        route("wlan0", "192.168.1.1", metric=600),
+                        route("tun0", "10.8.0.1", flags=RTF_UP, metric=50))
+    assert read_default_route(path) == (None, "tun0")
+
+
+def test_default_route_missing(tmp_path):
+    assert read_default_route(str(tmp_path / "absent")) == (None, None)
+    path = write_routes(tmp_path / "route", route("eth0", destination="0014000A", mask="0000FFFF", flags=RTF_UP))
+    assert read_default_route(path) == (None, None)
+
+
+def test_first_matching_rule_wins():
+    rules = RuleSet([
+        {"profile": "Office", "gateway": "10.20.0.0/16", "interface": "en*"},
+        {"profile": "Lab", "gateway": ["10.20.0.0/16", "10.30.0.1"]},
+        {"profile": "Corp", "search_domain": "corp.example"},
+        {"profile": "Direct"},
+    ])
+    assert rules.evaluate(NetworkFacts("10.20.0.1", "enp3s0")) == "Office"
+    assert rules.evaluate(NetworkFacts("10.20.0.1", "wlan0")) == "Lab"
+    assert rules.evaluate(NetworkFacts("10.30.0.1", "wlan0")) == "Lab"
+    assert rules.evaluate(NetworkFacts("192.168.1.1", "wlan0", ["eu.corp.example"])) == "Corp"
+    assert rules.evaluate(NetworkFacts("192.168.1.1", "wlan0", ["notcorp.example"])) == "Direct"
+    assert rules.evaluate(NetworkFacts()) == "Direct"
+
+
+def test_no_rule_matches():
+    rules = RuleSet([{"profile": "Office", "gateway": "10.20.0.0/16"}])
+    assert rules.evaluate(NetworkFacts("192.168.1.1", "wlan0")) is None
+    assert rules.evaluate(NetworkFacts(None, "tun0")) is None
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError, match="profile name is required"):
+        RuleSet([{"gateway": "10.0.0.1"}])
+    with pytest.raises(ValueError, match="unknown condition"):
+        RuleSet([{"profile": "Office", "ssid": "corp"}])
+    with pytest.raises(ValueError, match="invalid gateway"):
+        RuleSet([{"profile": "Office", "gateway": "not-an-address"}])
+
+
+def test_resolves_is_checked_last_and_once():
+    resolver = FakeResolver(["intranet.corp.example"])
+    rules = RuleSet([
+        {"profile": "Office", "resolves": "intranet.corp.example", "gateway": "10.20.0.0/16"},
+        {"profile": "VPN", "resolves": ["vpn.corp.example", "intranet.corp.example"]},
+    ])
+    # The gateway check fails first, so the first rule does no lookup; the second rule does
+    facts = NetworkFacts("192.168.1.1", "wlan0", resolver=resolver)
+    assert rules.evaluate(facts) == "VPN"
+    assert resolver.calls == ["vpn.corp.example", "intranet.corp.example"]
+    # Lookups are cached per facts
+    assert rules.evaluate(facts) == "VPN"
+    assert resolver.calls == ["vpn.corp.example", "intranet.corp.example"]
+
+    resolver.calls = []
+    facts = NetworkFacts("10.20.0.1", "eth0", resolver=resolver)
+    assert rules.evaluate(facts) == "Office"
+    assert resolver.calls == ["intranet.corp.example"]
+
+
+def test_switcher_detects_changes(tmp_path):
+    route_path = tmp_path / "route"
+    resolv_path = tmp_path / "resolv.conf"
+    write_routes(route_path, route("eth0", "10.20.0.1", metric=100))
+    resolv_path.write_text("nameserver 10.20.0.53\nsearch corp.example.\n")
+    resolver = FakeResolver()
+    switcher = ProfileSwitcher([
+        {"profile": "Office", "gateway": "10.20.0.0/16", "resolves": "intranet.corp.example"},
+        {"profile": "Corp", "search_domain": "corp.example"},
+        {"profile": "Direct"},
+    ], get_profile=lambda name: None, route_path=str(route_path), resolv_path=str(resolv_path), resolver=resolver)
+
+    profile, facts, changed = switcher.check()
+    assert (profile, changed) == ("Corp", True)
+    assert (facts.gateway, facts.interface, facts.search_domains) == ("10.20.0.1", "eth0", ["corp.example"])
+    assert resolver.calls == ["intranet.corp.example"]
+
+    # Same facts: nothing is re-evaluated, so no new lookup either
+    assert switcher.check()[::2] == ("Corp", False)
+    assert resolver.calls == ["intranet.corp.example"]
+
+    write_routes(route_path, route("wlan0", "192.168.1.1", metric=600))
+    assert switcher.check()[::2] == ("Corp", True)
+    resolv_path.write_text("nameserver 192.168.1.1\n")
+    assert switcher.check()[::2] == ("Direct", True)
+    assert switcher.check()[::2] == ("Direct", False)
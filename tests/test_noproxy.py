@@ -0,0 +1,60 @@
+import noproxy
+
+NO_PROXY = "localhost, .corp.example,*.lan;intranet.example:8080,10.0.0.0/8,192.168.1.5:3128,fd00::/8,[::1]"
+
+
+def test_domain_suffixes():
+    matcher = noproxy.compile_no_proxy(NO_PROXY)
+    assert matcher.bypass_host("localhost")
+    assert matcher.bypass_host("corp.example")
+    assert matcher.bypass_host("build.eu.CORP.example.")
+    assert matcher.bypass_host("printer.lan")
+    # Suffixes match whole labels only
+    assert not matcher.bypass_host("notcorp.example")
+    assert not matcher.bypass_host("corp.example.com")
+    assert not matcher.bypass_host("example")
+
+
+def test_ports():
+    matcher = noproxy.compile_no_proxy(NO_PROXY)
+    assert matcher.bypass_host("intranet.example", 8080)
+    assert matcher.bypass_host("www.intranet.example", 8080)
+    assert not matcher.bypass_host("intranet.example", 443)
+    assert not matcher.bypass_host("intranet.example")
+    assert matcher.bypass_url("http://intranet.example:8080/wiki")
+    assert not matcher.bypass_url("https://intranet.example/wiki")
+    assert matcher.bypass_host("192.168.1.5", 3128)
+    assert not matcher.bypass_host("192.168.1.5", 80)
+    # A port-less entry for the same host wins over any port
+    assert noproxy.NoProxyMatcher("a.example:81,a.example").bypass_host("a.example", 82)
+
+
+def test_cidr_ranges():
+    matcher = noproxy.compile_no_proxy(NO_PROXY)
+    assert matcher.bypass_host("10.0.0.0")
+    assert matcher.bypass_host("10.255.255.255")
+    assert not matcher.bypass_host("11.0.0.0")
+    assert not matcher.bypass_host("9.255.255.255")
+    assert matcher.bypass_host("[fd12:3456::1]")
+    assert matcher.bypass_host("::1")
+    assert not matcher.bypass_host("::2")
+    assert not matcher.bypass_host("fe80::1")
+    assert matcher.bypass_url("http://[fd00::5]:8080/")
+    assert noproxy.parse_network("10.1.2.3/8") == (4, 10 << 24, (11 << 24) - 1)
+    assert noproxy.parse_network("10.0.0.0/33") is None
+    assert noproxy.parse_ip("host10.example") is None
+
+
+def test_interval_table_merges_ranges():
+    table = noproxy.IntervalTable([(10, 20), (21, 30), (5, 12), (40, 40)])
+    assert len(table) == 2
+    assert 5 in table and 30 in table and 40 in table
+    assert 4 not in table and 31 not in table and 41 not in table
+
+
+def test_evaluate_urls():
+    env_vars = {"http_proxy": "http://proxy.example:3128", "https_proxy": "", "no_proxy": NO_PROXY}
+    assert noproxy.evaluate_urls(["http://www.example.com", "http://10.1.1.1/", "https://www.example.com"],
+                                 env_vars) == [("http://www.example.com", "http://proxy.example:3128"),
+                                               ("http://10.1.1.1/", None), ("https://www.example.com", None)]
+    assert noproxy.compile_no_proxy("*").bypass_url("http://anything.example")
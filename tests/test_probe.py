@@ -0,0 +1,140 @@
+import asyncio
+import socket
+import time
+
+from probe import ProbeCache, fastest, probe_many, probe_proxy
+
+
+class StandIn:
+    # Answers every request with `status` after `delay` seconds and records what it was sent
+    def __init__(self, status=200, delay=0.0):
+        self.status = status
+        self.delay = delay
+        self.requests = []
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            self.requests.append(await reader.readuntil(b"\r\n\r\n"))
+            await asyncio.sleep(self.delay)
+            writer.write(b"HTTP/1.1 %d Stand-in\r\nContent-Length: 0\r\n\r\n" % self.status)
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def refusing_url():
+    # A port that was just free: nothing listens on it, so connecting is refused
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def test_live_proxy():
+    async def check():
+        async with StandIn() as live:
+            result = await probe_proxy(live.url, target="http://example.com/", timeout=2)
+            return result, live.requests
+    result, requests = asyncio.run(check())
+    assert result["ok"] and result["status"] == 200 and result["error"] == ""
+    assert 0 <= result["connect_ms"] <= result["first_byte_ms"]
+    assert requests[0].startswith(b"GET http://example.com/ HTTP/1.1\r\n")
+
+
+def test_connect_with_credentials():
+    async def check():
+        async with StandIn() as live:
+            url = live.url.replace("http://", "http://user:p%40ss@")
+            result = await probe_proxy(url, method="CONNECT", target="https://example.com/", timeout=2)
+            return result, live.requests
+    result, requests = asyncio.run(check())
+    assert result["ok"]
+    assert requests[0].startswith(b"CONNECT example.com:443 HTTP/1.1\r\n")
+    # base64 of "user:p@ss"
+    assert b"Proxy-Authorization: Basic dXNlcjpwQHNz\r\n" in requests[0]
+
+
+def test_slow_proxy_times_out():
+    async def check():
+        async with StandIn(delay=1.0) as slow:
+            return await probe_proxy(slow.url, timeout=0.2)
+    result = asyncio.run(check())
+    assert not result["ok"]
+    assert result["status"] is None and result["first_byte_ms"] is None
+    assert result["connect_ms"] is not None
+    assert result["error"] == "timed out"
+
+
+def test_refusing_proxy():
+    result = asyncio.run(probe_proxy(refusing_url(), timeout=2))
+    assert not result["ok"]
+    assert result["status"] is None and result["connect_ms"] is None
+    assert result["error"]
+
+
+def test_proxy_requiring_auth():
+    async def check():
+        async with StandIn(status=407) as auth:
+            return await probe_proxy(auth.url, timeout=2)
+    result = asyncio.run(check())
+    assert not result["ok"]
+    assert result["status"] == 407
+    assert result["error"] == "407 Stand-in"
+    assert result["first_byte_ms"] is not None
+
+
+def test_probe_many_ranks_and_picks_fastest():
+    async def check():
+        async with StandIn() as live, StandIn(delay=0.2) as slow, StandIn(status=407) as auth:
+            candidates = [(slow.url, "GET"), (refusing_url(), "GET"), (auth.url, "GET"), (live.url, "GET"),
+                          (live.url, "CONNECT")]
+            return live.url, slow.url, await probe_many(candidates, timeout=2)
+    live_url, slow_url, results = asyncio.run(check())
+    assert len(results) == 5
+    ok = [(r["proxy"], r["method"]) for r in results if r["ok"]]
+    assert sorted(ok) == sorted([(live_url, "GET"), (live_url, "CONNECT"), (slow_url, "GET")])
+    # Working proxies come first, fastest first; failures go last
+    assert [r["ok"] for r in results] == [True, True, True, False, False]
+    assert results[-3]["proxy"] == slow_url
+    best = fastest(results, "GET")
+    assert (best["proxy"], best["method"]) == (live_url, "GET")
+    assert fastest(results, "CONNECT")["method"] == "CONNECT"
+    assert fastest([r for r in results if not r["ok"]]) is None
+
+
+def test_probe_many_uses_cache():
+    async def check():
+        cache = ProbeCache(ttl=60)
+        async with StandIn() as live:
+            first = await probe_many([(live.url, "GET")], timeout=2, cache=cache)
+            second = await probe_many([(live.url, "GET")], timeout=2, cache=cache)
+            return first, second, len(live.requests)
+    first, second, probes = asyncio.run(check())
+    assert probes == 1
+    assert second == first
+
+
+def test_cache_ttl():
+    cache = ProbeCache(ttl=5)
+    fresh = {"checked_at": time.time()}
+    stale = {"checked_at": time.time() - 10}
+    cache.put("fresh", fresh)
+    cache.put("stale", stale)
+    assert cache.get("fresh") is fresh
+    assert cache.get("stale") is None
+    # Expired entries are dropped, not kept around
+    assert "stale" not in cache.entries
+    assert cache.get("missing") is None
+    cache.clear()
+    assert cache.get("fresh") is None
@@ -0,0 +1,112 @@
+import os
+import stat
+
+import pytest
+
+import configfiles
+import rewrite
+
+PROXY = "http://proxy.example:3128"
+
+
+def leftovers(directory):
+    return [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+
+def test_temp_file_is_fsynced_and_renamed(tmp_path, monkeypatch):
+    target = tmp_path / "environment"
+    target.write_text("old\n")
+    calls = []
+    real_fsync, real_replace = os.fsync, os.replace
+
+    def fsync(fd):
+        calls.append("fsync")
+        real_fsync(fd)
+
+    def replace(src, dst):
+        calls.append((src, dst))
+        real_replace(src, dst)
+
+    monkeypatch.setattr(os, "fsync", fsync)
+    monkeypatch.setattr(os, "replace", replace)
+    with rewrite.AtomicFile(str(target)) as f:
+        f.write("new\n")
+        # Nothing reaches the target before commit
+        assert target.read_text() == "old\n"
+    tmp, dst = calls[1]
+    assert calls[0] == "fsync" and dst == str(target)
+    assert os.path.dirname(tmp) == str(tmp_path) and not os.path.exists(tmp)
+    assert target.read_text() == "new\n"
+    assert leftovers(tmp_path) == []
+
+
+def test_failed_write_leaves_target_alone(tmp_path):
+    target = tmp_path / "environment"
+    target.write_text("old\n")
+    with pytest.raises(RuntimeError):
+        with rewrite.AtomicFile(str(target)) as f:
+            f.write("half")
+            raise RuntimeError("boom")
+    assert target.read_text() == "old\n"
+    assert leftovers(tmp_path) == []
+
+
+def test_symlinks_followed_or_replaced(tmp_path):
+    real = tmp_path / "dotfiles" / "bashrc"
+    real.parent.mkdir()
+    real.write_text("alias ll='ls -l'\n")
+    link = tmp_path / ".bashrc"
+    link.symlink_to(real)
+    rewrite.atomic_write(str(link), "through\n")
+    assert link.is_symlink() and real.read_text() == "through\n"
+    rewrite.atomic_write(str(link), "replaced\n", follow_symlinks=False)
+    assert not link.is_symlink() and link.read_text() == "replaced\n"
+    assert real.read_text() == "through\n"
+
+
+def test_mode_and_owner_preserved(tmp_path):
+    target = tmp_path / "apt.conf"
+    target.write_text("old\n")
+    os.chmod(target, 0o600)
+    if os.geteuid() == 0:
+        os.chown(target, 1234, 4321)
+    rewrite.atomic_write(str(target), "new\n")
+    info = os.stat(target)
+    assert stat.S_IMODE(info.st_mode) == 0o600
+    if os.geteuid() == 0:
+        assert (info.st_uid, info.st_gid) == (1234, 4321)
+    rewrite.atomic_write(str(target), "newer\n", mode=0o640)
+    assert stat.S_IMODE(os.stat(target).st_mode) == 0o640
+    fresh = tmp_path / "fresh.conf"
+    rewrite.atomic_write(str(fresh), "x\n")
+    assert stat.S_IMODE(os.stat(fresh).st_mode) == rewrite.DEFAULT_MODE
+
+
+def test_up_to_date_file_is_not_rewritten(tmp_path):
+    target = tmp_path / ".bashrc"
+    target.write_text("alias ll='ls -l'\n")
+    assert rewrite.rewrite_file(str(target), configfiles.SHELL, {"http_proxy": PROXY}) is True
+    before = os.stat(target)
+    assert rewrite.rewrite_file(str(target), configfiles.SHELL, {"http_proxy": PROXY}) is False
+    after = os.stat(target)
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    assert leftovers(tmp_path) == []
+
+
+def test_nothing_to_write_creates_no_file(tmp_path):
+    target = tmp_path / ".bashrc"
+    assert rewrite.rewrite_file(str(target), configfiles.SHELL, {"http_proxy": None}) is False
+    assert not target.exists()
+    with pytest.raises(FileNotFoundError):
+        rewrite.rewrite_file(str(target), configfiles.SHELL, {"http_proxy": PROXY}, must_exist=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_remove_if_empty(tmp_path):
+    target = tmp_path / "proxy.conf"
+    target.write_text(f'Acquire::http::Proxy "{PROXY}";\n')
+    desired = {"Acquire::http::Proxy": None}
+    assert rewrite.rewrite_file(str(target), configfiles.APT, desired, remove_if_empty=True) is True
+    assert not target.exists()
+    assert rewrite.rewrite_file(str(target), configfiles.APT, desired, remove_if_empty=True) is False
+    assert os.listdir(tmp_path) == []
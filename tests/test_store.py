@@ -0,0 +1,88 @@
+import json
+import time
+
+from store import ProxyStore
+
+
+def make_store(tmp_path, write_delay=0.2):
+    return ProxyStore(str(tmp_path / "history.json"), str(tmp_path / "profiles.json"), write_delay=write_delay,
+                      rules_path=str(tmp_path / "rules.json"))
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_writes_are_debounced(tmp_path):
+    store = make_store(tmp_path)
+    profiles = tmp_path / "profiles.json"
+    # Each change within write_delay of the previous one pushes the write back
+    for i in range(5):
+        store.set_profile("Office", {"http_proxy": f"http://proxy{i}.example:3128"})
+        time.sleep(0.1)
+    assert not profiles.exists()
+    assert wait_for(profiles.exists)
+    assert json.loads(profiles.read_text())["Office"]["http_proxy"] == "http://proxy4.example:3128"
+
+
+def test_failed_timer_flush_is_reported_and_retried(tmp_path, capsys):
+    store = ProxyStore(str(tmp_path / "history.json"), str(tmp_path / "missing" / "profiles.json"), write_delay=0.05,
+                       rules_path=str(tmp_path / "rules.json"))
+    store.set_profile("Office", {"http_proxy": "http://proxy.example:3128"})
+    assert wait_for(lambda: "could not save settings" in capsys.readouterr().err)
+    assert store.dirty == {"profiles"}
+    (tmp_path / "missing").mkdir()
+    assert wait_for(lambda: (tmp_path / "missing" / "profiles.json").exists())
+    assert store.dirty == set() and store.retry_delay is None
+
+
+def test_close_flushes_pending_writes(tmp_path, capsys):
+    store = make_store(tmp_path, write_delay=60)
+    store.add_history({"http_proxy": "http://proxy.example:3128"}, now=1000)
+    store.close()
+    assert store.timer is None
+    data = json.loads((tmp_path / "history.json").read_text())
+    assert data["http_proxy"] == ["http://proxy.example:3128"]
+    assert data["usage"]["http_proxy"] == [[1, 1000]]
+
+    broken = ProxyStore(str(tmp_path / "missing" / "history.json"), write_delay=60)
+    broken.add_history({"http_proxy": "http://proxy.example:3128"})
+    broken.close()
+    assert "could not save settings" in capsys.readouterr().err
+
+
+def test_corrupt_files_load_as_empty(tmp_path):
+    (tmp_path / "history.json").write_text(json.dumps({
+        "http_proxy": "http://not-a-list.example",
+        "https_proxy": ["http://a.example", 42, None, "http://b.example"],
+        "no_proxy": {"localhost": 1},
+        "usage": {"https_proxy": [[3, 100], "bad"]},
+    }))
+    (tmp_path / "profiles.json").write_text(json.dumps({"Office": {"http_proxy": "http://a.example"}, "Bad": "x"}))
+    (tmp_path / "rules.json").write_text(json.dumps([{"profile": "Office"}, "bad"]))
+    store = make_store(tmp_path)
+    history = store.get_history()
+    assert history["http_proxy"] == [] and history["no_proxy"] == []
+    assert history["https_proxy"] == ["http://a.example", "http://b.example"]
+    # Malformed usage is replaced by the default counts, newest first
+    assert store.get_usage()["https_proxy"] == {"http://a.example": (1, 0), "http://b.example": (1, -3)}
+    assert store.get_profiles() == {"Office": {"http_proxy": "http://a.example"}}
+    assert store.get_rules() == [{"profile": "Office"}]
+
+    (tmp_path / "history.json").write_text("[1, 2")
+    assert make_store(tmp_path).get_history()["http_proxy"] == []
+
+
+def test_history_round_trip(tmp_path):
+    store = make_store(tmp_path, write_delay=0)
+    store.add_history({"http_proxy": "http://a.example"}, now=100)
+    store.add_history({"http_proxy": "http://b.example"}, now=200)
+    store.add_history({"http_proxy": "http://a.example"}, now=300)
+    reloaded = make_store(tmp_path)
+    assert reloaded.get_history()["http_proxy"] == ["http://a.example", "http://b.example"]
+    assert reloaded.get_usage()["http_proxy"] == {"http://a.example": (2, 300), "http://b.example": (1, 200)}
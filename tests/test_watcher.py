@@ -0,0 +1,58 @@
+import os
+
+import core
+import shellenv
+import watcher
+
+
+def test_symlinked_file_is_followed(tmp_path):
+    dotfiles = tmp_path / "dotfiles"
+    home = tmp_path / "home"
+    dotfiles.mkdir()
+    home.mkdir()
+    real = dotfiles / "bashrc"
+    real.write_text("export http_proxy=a\n")
+    link = home / ".bashrc"
+    link.symlink_to(real)
+    watchers = [watcher.PollingWatcher([str(link)])]
+    try:
+        watchers.append(watcher.InotifyWatcher([str(link)]))
+    except (OSError, AttributeError):
+        pass
+    for w in watchers:
+        w.read_changes()
+    # Written through the link: only the target's directory sees the change
+    real.write_text("export http_proxy=bb\n")
+    for w in watchers:
+        assert w.read_changes() == {str(link)}
+    # Re-pointed to a file elsewhere: later writes there are still seen
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "bashrc").write_text("x\n")
+    link.unlink()
+    link.symlink_to(other / "bashrc")
+    for w in watchers:
+        assert w.read_changes() == {str(link)}
+    (other / "bashrc").write_text("export http_proxy=ccc\n")
+    for w in watchers:
+        assert w.read_changes() == {str(link)}
+        w.close()
+
+
+def test_state_follows_shell_integration(tmp_path, monkeypatch):
+    rc = tmp_path / ".bashrc"
+    env = tmp_path / ".proxymaster_env.sh"
+    rc.write_text("export http_proxy='http://rc.example:1'\n")
+    monkeypatch.setattr(core, "get_user_rc", lambda: str(rc))
+    monkeypatch.setattr(shellenv, "ENV_PATH", str(env))
+    state = watcher.ProxyState("/")
+    assert str(rc) in state.paths()
+    assert state.update_targets() is False
+    env.write_text("export http_proxy='http://env.example:2'\n")
+    assert state.update_targets() is True
+    assert str(env) in state.paths() and str(rc) not in state.paths()
+    state.refresh()
+    assert state.values["shell"]["http_proxy"] == "http://env.example:2"
+    os.remove(env)
+    assert state.update_targets() is True
+    assert str(rc) in state.paths()
@@ -0,0 +1,161 @@
+import os
+import time
+
+# Lightweight span recorder. Disabled by default: span() then returns a shared no-op object, so the
+# instrumentation left in the code costs one function call. Enabled with `--trace out.json`, spans are
+# written in the Chrome trace event format (chrome://tracing, https://ui.perfetto.dev).
+
+_lock = None
+_events = []
+_threads = {}
+_origin = time.perf_counter()
+trace_path = None
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("name", "category", "args", "start")
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        record(self.name, self.start, end, self.category, self.args)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+def enabled():
+    return trace_path is not None
+
+
+def enable(path):
+    # threading is only imported once tracing is on, keeping `cli.py status` startup unchanged
+    global trace_path, _lock
+    if trace_path is None:
+        import atexit
+        import threading
+        _lock = threading.Lock()
+        atexit.register(finish)
+    trace_path = path
+
+
+def span(name, category="app", **args):
+    if trace_path is None:
+        return NULL_SPAN
+    return Span(name, category, args)
+
+
+def record(name, start, end, category="app", args=None):
+    # start/end are time.perf_counter() values
+    if trace_path is None:
+        return
+    import threading
+    thread = threading.current_thread()
+    event = {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": round((start - _origin) * 1e6, 1),
+        "dur": round((end - start) * 1e6, 1),
+        "pid": os.getpid(),
+        "tid": thread.ident,
+    }
+    if args:
+        event["args"] = args
+    with _lock:
+        _events.append(event)
+        _threads[thread.ident] = thread.name
+
+
+def events():
+    if _lock is None:
+        return []
+    with _lock:
+        return list(_events)
+
+
+def summary():
+    totals = {}
+    for event in events():
+        row = totals.setdefault(event["name"], {"name": event["name"], "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = event["dur"] / 1000
+        row["count"] += 1
+        row["total_ms"] += ms
+        row["max_ms"] = max(row["max_ms"], ms)
+    return sorted(totals.values(), key=lambda row: row["total_ms"], reverse=True)
+
+
+def format_summary(rows=None):
+    rows = summary() if rows is None else rows
+    width = max([len("span")] + [len(row["name"]) for row in rows])
+    lines = [f"{'span':<{width}}  {'count':>5}  {'total ms':>9}  {'max ms':>9}"]
+    for row in rows:
+        lines.append(f"{row['name']:<{width}}  {row['count']:>5}  {row['total_ms']:>9.1f}  {row['max_ms']:>9.1f}")
+    return lines
+
+
+def write_chrome_trace(path):
+    import json
+    trace_events = events()
+    threads = dict(_threads)
+    pid = os.getpid()
+    for tid, name in threads.items():
+        trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+    return len(trace_events)
+
+
+def finish():
+    if trace_path is None or not _events:
+        return
+    try:
+        write_chrome_trace(trace_path)
+    except OSError as e:
+        import sys
+        print(f"proxymaster: could not write trace to {trace_path}: {e}", file=sys.stderr)
+
+
+def enable_from_argv(argv, start=0):
+    # Strips `--trace PATH` / `--trace=PATH` from argv (in place) and enables tracing. Only the options
+    # before the first positional argument (the subcommand) or `--` are looked at, so a `--trace` meant
+    # for a command wrapped by `cli.py run` is passed on untouched.
+    for i in range(start, len(argv)):
+        arg = argv[i]
+        if arg == "--" or not arg.startswith("-"):
+            return False
+        if arg == "--trace" and i + 1 < len(argv):
+            enable(argv[i + 1])
+            del argv[i:i + 2]
+            return True
+        if arg.startswith("--trace="):
+            enable(arg.split("=", 1)[1])
+            del argv[i]
+            return True
+    return False
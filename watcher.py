@@ -0,0 +1,191 @@
+import os
+import struct
+
+import configfiles
+import core
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def watch_locations(path):
+    # A symlinked file (e.g. an rc file kept by a dotfile manager) is written through the link, so its
+    # target is watched as well as the link itself, which may be replaced or re-pointed
+    real = os.path.realpath(path)
+    return [path] if real == path else [path, real]
+
+
+class InotifyWatcher:
+    # Watches the parent directories rather than the files themselves, so atomic
+    # temp-file + rename replacements (and files that do not exist yet) are still seen.
+    # Changes are reported under the paths as given, whichever location they were seen at.
+    def __init__(self, paths):
+        import ctypes
+        try:
+            libc = ctypes.CDLL("libc.so.6", use_errno=True)
+        except OSError:
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.names = {}
+        self.set_paths(paths)
+
+    def set_paths(self, paths):
+        # Also called again after changes, so a re-pointed symlink moves its watch along
+        self.paths = list(paths)
+        names = {}
+        for path in self.paths:
+            for location in watch_locations(path):
+                directory, name = os.path.split(location)
+                names.setdefault(directory, {}).setdefault(name, set()).add(path)
+        for wd, directory in list(self.watches.items()):
+            if directory not in names:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+        watched = set(self.watches.values())
+        for directory in names:
+            if directory not in watched:
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+                if wd >= 0:
+                    self.watches[wd] = directory
+        self.names = names
+
+    def fileno(self):
+        return self.fd
+
+    def read_changes(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].split(b"\0", 1)[0])
+                offset += length
+                directory = self.watches.get(wd)
+                if directory is not None and name in self.names.get(directory, {}):
+                    changed.update(self.names[directory][name])
+        if changed:
+            self.set_paths(self.paths)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    # os.stat() follows symlinks, so a symlinked file is compared by its target
+    def __init__(self, paths):
+        self.stats = {}
+        self.set_paths(paths)
+
+    def set_paths(self, paths):
+        self.paths = list(paths)
+        self.stats = {path: self.stats[path] if path in self.stats else self.stat(path) for path in self.paths}
+
+    def stat(self, path):
+        try:
+            st = os.stat(path)
+            return (st.st_ino, st.st_size, st.st_mtime_ns)
+        except OSError:
+            return None
+
+    def fileno(self):
+        return None
+
+    def read_changes(self):
+        changed = set()
+        for path in self.paths:
+            st = self.stat(path)
+            if st != self.stats[path]:
+                self.stats[path] = st
+                changed.add(path)
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(paths):
+    try:
+        return InotifyWatcher(paths)
+    except (OSError, AttributeError):
+        return PollingWatcher(paths)
+
+
+class ProxyState:
+    # Cached "effective proxy state": each target is parsed once and then only re-parsed
+    # when the watcher reports that its file changed.
+    def __init__(self, root="/"):
+        self.root = root
+        self.targets = {}
+        self.values = {}
+        self.update_targets()
+        self.refresh()
+
+    def update_targets(self):
+        # The shell state lives in the rc file or, with shell integration installed, in the env file;
+        # returns True when the set of files changed, so the caller can re-point its watcher
+        root = self.root
+        targets = {core.rooted(core.ENVIRONMENT_FILE, root): ("environment", configfiles.ENVIRONMENT, core.ENV_VARS)}
+        if root in ("", "/"):
+            targets[core.get_shell_state_file()] = ("shell", configfiles.SHELL, core.ENV_VARS)
+        for pm, (path, parser) in core.PACKAGE_MANAGER_CONFIGS.items():
+            targets[core.rooted(path, root)] = (pm, parser, tuple(core.desired_package_manager(pm, {})))
+        if list(targets) == list(self.targets):
+            return False
+        self.targets = targets
+        return True
+
+    def paths(self):
+        return list(self.targets)
+
+    def refresh(self, paths=None):
+        changed = False
+        for path in self.targets if paths is None else paths:
+            if path not in self.targets:
+                continue
+            kind, parser, keys = self.targets[path]
+            try:
+                values = core.read_values(path, parser, keys)
+            except OSError:
+                values = {}
+            if self.values.get(kind) != values:
+                self.values[kind] = values
+                changed = True
+        return changed
+
+    @property
+    def enabled(self):
+        environment = self.values.get("environment", {})
+        return bool(environment.get("http_proxy") or environment.get("https_proxy"))
+
+    def snapshot(self):
+        status = {
+            "enabled": self.enabled,
+            "environment": dict(self.values.get("environment", {})),
+            "package_managers": {pm: bool(self.values.get(pm)) for pm in core.PACKAGE_MANAGERS},
+        }
+        if "shell" in self.values:
+            status["shell"] = dict(self.values["shell"])
+        return status